@@ -8,20 +8,29 @@ API completa para gestión de scrapers, credenciales y catálogo interno.
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import json
 import os
 import asyncio
+import tempfile
 from datetime import datetime
 from pathlib import Path
 from sqlalchemy.orm import Session
 from core.database import get_db, SessionLocal
 from core.models import Product, Supplier, ProductImage
-from services.chat_engine import AdquifyChatEngine
-from core.ai.vector_store import QdrantHandler
+from services.chat_engine import AdquifyChatEngine, get_chat_engine, set_chat_engine
+from services.product_listing import get_listing_engine
+from services.snapshot_store import latest_snapshot, save_snapshot
+from services.catalog_export import (CSV_FILENAME, CSV_MEDIA_TYPE, XLSX_FILENAME, XLSX_MEDIA_TYPE,
+                                     iter_catalog_csv, write_catalog_xlsx)
+from services.response_cache import get_response_cache
+from core.ai.vector_store import QdrantHandler, create_vector_store
+from core.ai.embedding_cache import get_query_embedding_cache
 from services.sync_service import reindex_qdrant_from_db, generate_missing_embeddings
 from departments.procurement.scraping_skill.scripts.catalog_merger import CatalogMergerAgent
 from fastapi import BackgroundTasks, Depends
@@ -29,6 +38,7 @@ from fastapi import BackgroundTasks, Depends
 # Ensure Tables & Migrations
 from core.database import engine, Base
 from sqlalchemy import inspect, text
+from core.migrations import migrate_embeddings_to_binary
 
 def run_migrations():
     """Simple startup migration to fix schema drift in SQLite"""
@@ -48,7 +58,45 @@ def run_migrations():
                     print("⚠️ Migration: Adding 'last_stock_update' column...")
                     conn.execute(text("ALTER TABLE products ADD COLUMN last_stock_update TIMESTAMP"))
                 
+                # 3. embedding_text_hash (incremental vector sync)
+                if "embedding_text_hash" not in columns:
+                    print("⚠️ Migration: Adding 'embedding_text_hash' column...")
+                    conn.execute(text("ALTER TABLE products ADD COLUMN embedding_text_hash VARCHAR(40)"))
+                
+                # 4. embedding_vector (binary embeddings, replaces embedding_json)
+                if "embedding_vector" not in columns:
+                    print("⚠️ Migration: Adding 'embedding_vector' column...")
+                    conn.execute(text("ALTER TABLE products ADD COLUMN embedding_vector BLOB"))
+                if "product_images" in inspector.get_table_names():
+                    image_columns = [c["name"] for c in inspector.get_columns("product_images")]
+                    if "embedding_vector" not in image_columns:
+                        conn.execute(text("ALTER TABLE product_images ADD COLUMN embedding_vector BLOB"))
+                    # Perceptual image fingerprints (duplicate photo detection)
+                    if "fingerprint" not in image_columns:
+                        print("⚠️ Migration: Adding 'product_images.fingerprint' column...")
+                        conn.execute(text("ALTER TABLE product_images ADD COLUMN fingerprint BLOB"))
+                    # Image download state (content-addressed store, conditional GET)
+                    for column, ddl in (("content_hash", "VARCHAR(64)"), ("etag", "VARCHAR"),
+                                        ("last_modified", "VARCHAR"), ("fetched_at", "TIMESTAMP")):
+                        if column not in image_columns:
+                            print(f"⚠️ Migration: Adding 'product_images.{column}' column...")
+                            conn.execute(text(f"ALTER TABLE product_images ADD COLUMN {column} {ddl}"))
+                
+                # 5. Keyset pagination / sync watermark indexes (create_all skips existing tables)
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_status_id ON products (status, id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_status_updated_id ON products (status, updated_at, id)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_updated_id ON products (updated_at, id)"))
+                if "product_images" in inspector.get_table_names():
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_product_images_product_id ON product_images (product_id)"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_product_images_content_hash ON product_images (content_hash)"))
+                
                 conn.commit()
+            
+            # 6. Convert JSON embeddings to binary (no-op once done)
+            if "embedding_json" in columns:
+                migrate_embeddings_to_binary(engine, "products")
+            if "product_images" in inspector.get_table_names() and "embedding_json" in image_columns:
+                migrate_embeddings_to_binary(engine, "product_images")
             print("✅ DB Migrations Checked.")
     except Exception as e:
         print(f"❌ Migration Error: {e}")
@@ -56,6 +104,10 @@ def run_migrations():
 run_migrations()
 Base.metadata.create_all(bind=engine)
 
+# Full-text index (SQLite FTS5) for /products?q= and the chat keyword search
+from services.search_index import ensure_fts_index
+ensure_fts_index(engine)
+
 # Paths
 ENGINE_ROOT = Path(__file__).parent.parent
 CONFIG_PATH = ENGINE_ROOT / "config" / "suppliers_credentials.json"
@@ -98,7 +150,8 @@ app.include_router(whatsapp.router)
 
 # Startup/Shutdown Events
 from contextlib import asynccontextmanager
-from services.scheduler_service import get_scheduler
+from services.scheduler_service import get_scheduler, vector_sync_task
+from core.config import settings
 from services.notification_service import get_notification_service
 
 @app.on_event("startup")
@@ -109,7 +162,7 @@ async def startup_event():
     
     # Initialize Global Qdrant Handler (Singleton for :memory: persistence)
     try:
-        app.state.qdrant_handler = QdrantHandler()
+        app.state.qdrant_handler = create_vector_store()
         app.state.qdrant_handler.ensure_collection()
         print("✅ Qdrant Handler Initialized")
         
@@ -119,20 +172,61 @@ async def startup_event():
             db = SessionLocal()
             try:
                 await reindex_qdrant_from_db(db, app.state.qdrant_handler)
+            except Exception as e:
+                print(f"❌ Re-indexing failed: {e}")
             finally:
                 db.close()
                 
         asyncio.create_task(run_reindex())
         print("🚀 Background Re-indexing Task Started")
         
+        # Keep payloads fresh: incremental sync from Product.updated_at
+        scheduler.add_interval_job(
+            job_id="vector_sync",
+            func=vector_sync_task,
+            minutes=settings.VECTOR_SYNC_INTERVAL_MINUTES,
+            description="Incremental Qdrant sync (updated_at watermark)",
+            vector_store=app.state.qdrant_handler
+        )
+        
     except Exception as e:
         print(f"❌ Failed to initialize Qdrant: {e}")
+    
+    # Long-lived chat engine shared by /chat, WhatsApp and voice (pre-warmed clients)
+    try:
+        chat_engine = AdquifyChatEngine(vector_store=getattr(app.state, "qdrant_handler", None))
+        await chat_engine.warm_up()
+        set_chat_engine(chat_engine)
+        app.state.chat_engine = chat_engine
+        print("✅ Chat Engine Warmed Up")
+    except Exception as e:
+        print(f"❌ Failed to warm up Chat Engine: {e}")
+
+    # Visual search index: memory-mapped load now, new images indexed in background
+    try:
+        visual_search = get_visual_search()
+
+        def refresh_visual_index():
+            db = SessionLocal()
+            try:
+                visual_search.refresh(db)
+            except Exception as e:
+                print(f"❌ Visual index refresh failed: {e}")
+            finally:
+                db.close()
+
+        asyncio.create_task(asyncio.to_thread(refresh_visual_index))
+        print(f"✅ Visual Search Index Loaded ({visual_search.store.count()} images)")
+    except Exception as e:
+        print(f"❌ Failed to load Visual Search: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     scheduler = get_scheduler()
     scheduler.stop()
+    if getattr(app.state, "qdrant_handler", None):
+        app.state.qdrant_handler.flush()
     notif = get_notification_service()
     await notif.close()
 
@@ -217,46 +311,41 @@ def save_config(config: dict):
     with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
         json.dump(config, f, ensure_ascii=False, indent=2)
 
-def get_internal_products(skip: int = 0, limit: int = 50, q: Optional[str] = None, category: Optional[str] = None) -> List[dict]:
+def get_internal_products(skip: int = 0, limit: int = 50, q: Optional[str] = None, category: Optional[str] = None, cursor: Optional[str] = None) -> List[dict]:
     """Obtiene productos del catálogo interno (SQL Database) con filtros"""
+    return get_internal_products_page(skip, limit, q, category, cursor)["items"]
+
+def get_internal_products_page(skip: int = 0, limit: int = 50, q: Optional[str] = None, category: Optional[str] = None,
+                               cursor: Optional[str] = None, order: Optional[str] = None, include_total: bool = False) -> dict:
+    """Página del catálogo interno con cursor keyset (ver services.product_listing)"""
+    # Con texto de búsqueda, por defecto se ordena por relevancia (BM25)
+    order = order or ("relevance" if q else "id")
     db: Session = SessionLocal()
     try:
-        query = db.query(Product).filter(Product.status == "published")
-        
-        if q:
-            search = f"%{q}%"
-            query = query.filter(Product.name.ilike(search) | Product.description.ilike(search))
-        
-        if category and category != "Todos":
-            query = query.filter(Product.category.ilike(f"%{category}%"))
-
-        total = query.count()
-        products_orm = query.offset(skip).limit(limit).all()
-        
-        results = []
-        for p in products_orm:
-            # Obtener primera imagen o placeholder
-            img_url = p.images[0].url if p.images else "https://via.placeholder.com/400"
-            
-            supplier_code = p.supplier.code if p.supplier else "Unknown"
-            
-            results.append({
-                "id": p.sku_adquify,
-                "name": p.name,
-                "category": p.category,
-                "price": p.selling_price,
-                "image": img_url,
-                "supplier": supplier_code,
-                "stock": p.stock_quantity if p.last_stock_update else "Consultar", # Real stock
-                "description": p.description
-            })
-        return results
+        return get_listing_engine().list_products(
+            db, limit=limit, cursor=cursor, q=q, category=category,
+            order=order, include_total=include_total, skip=skip
+        )
     finally:
         db.close()
 
 @app.get("/products")
-async def read_products(skip: int = 0, limit: int = 50, q: Optional[str] = None, category: Optional[str] = None):
-    return get_internal_products(skip, limit, q, category)
+async def read_products(skip: int = 0, limit: int = 50, q: Optional[str] = None, category: Optional[str] = None, cursor: Optional[str] = None):
+    try:
+        return await asyncio.to_thread(get_internal_products, skip, limit, q, category, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/products/page")
+async def read_products_page(limit: int = 50, cursor: Optional[str] = None, q: Optional[str] = None,
+                             category: Optional[str] = None, order: Optional[str] = None, include_total: bool = False):
+    """Listado paginado por cursor: devuelve `items`, `next_cursor` y `total` (cacheado)"""
+    try:
+        return await asyncio.to_thread(
+            get_internal_products_page, 0, limit, q, category, cursor, order, include_total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 
@@ -272,9 +361,15 @@ def count_products_by_supplier(supplier_code: str) -> int:
 
 def get_last_sync(supplier_code: str) -> Optional[str]:
     """Obtiene última sincronización de un proveedor"""
-    latest = None
+    # Snapshot manifests carry extracted_at; JSON dumps are only parsed if written after
+    # the latest snapshot (extract_* scripts and runs without pyarrow write JSON only)
+    snapshot = latest_snapshot(supplier_code)
+    latest = snapshot.extracted_at if snapshot else None
+    since = snapshot.extracted_datetime if snapshot else None
     for json_file in DATA_RAW.glob(f"{supplier_code.lower()}*.json"):
         try:
+            if since and datetime.utcfromtimestamp(json_file.stat().st_mtime) <= since:
+                continue
             with open(json_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 extracted = data.get('extracted_at')
@@ -458,6 +553,7 @@ async def execute_scraper(supplier_code: str, max_pages: int, supplier_config: d
                                 'products': products
                             }, f, default=str, ensure_ascii=False)
                         scraper_status[supplier_code]['message'] = f"Guardado en {outfile.name}"
+                        save_snapshot(supplier_code, products)
                     except Exception as e:
                         print(f"Error saving JSON: {e}")
             else:
@@ -552,85 +648,68 @@ def publish_products(request: ProductPublish):
 
 @app.get("/internal-catalog/export/csv")
 def export_client_catalog():
-    """Generates and returns the path to the CSV catalog"""
-    # Import logic dynamically to avoid circular imports if any
+    """Catálogo cliente en CSV, en streaming (páginas del cursor de BD, memoria constante)"""
+    def chunks():
+        db: Session = SessionLocal()
+        try:
+            yield from iter_catalog_csv(db)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        chunks(),
+        media_type=CSV_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{CSV_FILENAME}"'}
+    )
+
+def _write_client_catalog_xlsx(path: str):
+    db: Session = SessionLocal()
     try:
-        from core.catalog_processor import AdquifyProcessor
-        products = get_internal_products()
-        
-        processor = AdquifyProcessor(products)
-        df_result = processor.process()
-        
-        # Save to exports
-        exports_dir = ENGINE_ROOT / "data" / "exports"
-        exports_dir.mkdir(parents=True, exist_ok=True)
-        
-        filename = "Catalogo_Maestro_Adquify_Interactive_LATEST.csv"
-        file_path = exports_dir / filename
-        df_result.to_csv(file_path, index=False, encoding='utf-8-sig')
-        
-        return {
-            "success": True,
-            "message": "Call Catalog Update generated",
-            "file_path": str(file_path),
-            "download_url": f"/files/exports/{filename}"
-        }
+        write_catalog_xlsx(db, path)
+    finally:
+        db.close()
+
+@app.get("/internal-catalog/export/xlsx")
+async def export_client_catalog_xlsx():
+    """Catálogo cliente en Excel (openpyxl write-only a un temporal, que se borra tras enviarlo)"""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(_write_client_catalog_xlsx, path)
     except Exception as e:
+        os.unlink(path)
         raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(path, media_type=XLSX_MEDIA_TYPE, filename=XLSX_FILENAME,
+                        background=BackgroundTask(os.unlink, path))
 
 # ----- VISUAL SEARCH -----
 
 from fastapi import UploadFile, File
-# from services.visual_search import VisualSearchService
-from io import BytesIO
-import numpy as np
-from PIL import Image
-
-# Initialize Service (Lazy load in prod, but eager here for demo)
-# Global instance
-visual_search = None
-
-# Initialize Service (Agent)
-# from departments.procurement.visual_search_agent import VisualSearchAgent
-# visual_search_agent = VisualSearchAgent()
-visual_search_agent = None
+from services.visual_search import get_visual_search
 
-def get_visual_search_agent():
-    return visual_search_agent
+MAX_SEARCH_IMAGE_BYTES = 10 * 1024 * 1024
 
 @app.post("/search/image")
-async def search_by_image(file: UploadFile = File(...)):
-    """Busca productos similares por imagen"""
-    # service = get_visual_search()
-    
-    # 1. Read Image
+async def search_by_image(file: UploadFile = File(...), limit: int = 10):
+    """Busca productos similares por imagen (índice visual local, todo en memoria)"""
     content = await file.read()
-    # img = Image.open(BytesIO(content)) # Not needed for Agent call yet
-    
+    if not content:
+        raise HTTPException(status_code=400, detail="Empty image")
+    if len(content) > MAX_SEARCH_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
 
-        
-    """Busca productos similares por imagen usando el Agente"""
-    agent = get_visual_search_agent()
-    
-    # 1. Read Image URL or Content
-    # For prototype, we might need a way to pass URL or save the file temporarily
-    # The agent expects a URL or path currently.
-    
-    # FIXME: The agent currently expects a URL in the signature: search_by_image(image_url: str)
-    # But this endpoint receives bytes.
-    # We will wrap it to save to a temp file or just mock the call for now as per the Agent's design.
-    
-    # Save to temp file
-    temp_filename = f"temp_search_{file.filename}"
-    temp_path = DATA_RAW / temp_filename
-    with open(temp_path, "wb") as buffer:
-        buffer.write(content)
-        
-        # Call Agent
-        # We pass the file path as "url" for now
-        results = agent.search_by_image(str(temp_path))
-        
-        return results
+    def _search():
+        db = SessionLocal()
+        try:
+            return get_visual_search().search_bytes(content, db, limit=max(1, min(limit, 50)))
+        finally:
+            db.close()
+
+    try:
+        return await asyncio.to_thread(_search)
+    except (OSError, SyntaxError, ValueError) as e:
+        # PIL raises these for truncated or non-image uploads
+        raise HTTPException(status_code=400, detail=f"Unreadable image: {e}")
 
 
 # ----- SCRAPEMASTER -----
@@ -697,15 +776,64 @@ async def chat_with_catalog(req: ChatRequest):
     """Interfaz de chat inteligente con el catálogo"""
     db: Session = SessionLocal()
     try:
-        # Use Singleton Qdrant Handler if available (crucial for :memory: mode)
-        qdrant_handler = getattr(app.state, "qdrant_handler", None)
-        
-        engine = AdquifyChatEngine(db, vector_store=qdrant_handler)
-        response = await engine.process_query(req.message)
+        # Shared engine (uses the singleton Qdrant Handler, crucial for :memory: mode)
+        engine = get_chat_engine(vector_store=getattr(app.state, "qdrant_handler", None))
+        response = await engine.process_query(req.message, db=db)
         return response
     finally:
         db.close()
 
+def _sse(event: Dict) -> str:
+    """Server-Sent Events frame: `event:` line + JSON `data:` line"""
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_with_catalog_stream(req: ChatRequest):
+    """
+    Chat en streaming (SSE): primero los productos, luego los tokens del LLM
+    y por último un evento 'done' con el pdf_url.
+    """
+    engine = get_chat_engine(vector_store=getattr(app.state, "qdrant_handler", None))
+
+    async def events():
+        # The engine opens (and closes) its own session for the stream's lifetime
+        async for event in engine.stream_query(req.message):
+            yield _sse(event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat en streaming por WebSocket. Cada mensaje {"message": "..."} recibe
+    la misma secuencia de eventos que /chat/stream (products, token..., done).
+    """
+    await websocket.accept()
+    engine = get_chat_engine(vector_store=getattr(app.state, "qdrant_handler", None))
+    try:
+        while True:
+            data = await websocket.receive_json()
+            message = (data or {}).get("message") if isinstance(data, dict) else None
+            if not message:
+                await websocket.send_json({"event": "error", "detail": "Missing 'message'"})
+                continue
+            async for event in engine.stream_query(message):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/chat/stats")
+def chat_cache_stats():
+    """Contadores de las cachés del chat (embeddings de consultas y respuestas)"""
+    return {
+        "query_embedding_cache": get_query_embedding_cache().get_stats(),
+        "response_cache": get_response_cache().get_stats()
+    }
+
 # ===== MAIN =====
 
 
@@ -751,10 +879,10 @@ async def trigger_ingestion(background_tasks: BackgroundTasks):
             
             # B. Push to Qdrant
             # Need strict re-initialization
-            q_handler = QdrantHandler()
+            q_handler = getattr(app.state, "qdrant_handler", None) or create_vector_store()
             
             # Double check connection
-            if not q_handler.client:
+            if isinstance(q_handler, QdrantHandler) and not q_handler.client:
                 print("❌ [Background] Qdrant Client failed to init.")
             else:
                 await reindex_qdrant_from_db(db_session, q_handler)
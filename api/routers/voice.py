@@ -7,8 +7,7 @@ Endpoints para consultas por voz.
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import Response
 from services.voice_service import get_voice_service
-from services.chat_engine import AdquifyChatEngine
-from core.database import SessionLocal
+from services.chat_engine import get_chat_engine
 
 router = APIRouter(prefix="/voice", tags=["voice"])
 
@@ -95,30 +94,26 @@ async def voice_query(
             detail="Transcription service not available. Set OPENAI_API_KEY."
         )
     
-    # Get chat engine
-    db = SessionLocal()
-    try:
-        chat_engine = AdquifyChatEngine(db)
-        
-        # Process voice query
-        content = await file.read()
-        text_response, audio_response = await service.process_voice_query(
-            audio_bytes=content,
-            filename=file.filename,
-            chat_engine=chat_engine
+    # Get chat engine (shared; opens its own DB session per query)
+    chat_engine = get_chat_engine()
+    
+    # Process voice query
+    content = await file.read()
+    text_response, audio_response = await service.process_voice_query(
+        audio_bytes=content,
+        filename=file.filename,
+        chat_engine=chat_engine
+    )
+    
+    if return_audio and audio_response:
+        # Return audio response
+        return Response(
+            content=audio_response,
+            media_type="audio/mpeg",
+            headers={
+                "Content-Disposition": "attachment; filename=response.mp3",
+                "X-Text-Response": text_response[:200]  # Include text in header
+            }
         )
-        
-        if return_audio and audio_response:
-            # Return audio response
-            return Response(
-                content=audio_response,
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": "attachment; filename=response.mp3",
-                    "X-Text-Response": text_response[:200]  # Include text in header
-                }
-            )
-        else:
-            return {"response": text_response}
-    finally:
-        db.close()
+    else:
+        return {"response": text_response}
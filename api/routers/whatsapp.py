@@ -7,7 +7,7 @@ import logging
 import httpx
 import json
 from core.database import SessionLocal
-from services.chat_engine import AdquifyChatEngine
+from services.chat_engine import get_chat_engine
 
 router = APIRouter(
     prefix="/api/whatsapp",
@@ -101,11 +101,11 @@ async def process_message_background(sender_id: str, text: str, qdrant_handler=N
     
     db = SessionLocal()
     try:
-        # Initialize Chat Engine (using global handler if allowed)
-        chat_engine = AdquifyChatEngine(db, vector_store=qdrant_handler)
+        # Shared Chat Engine (created at startup with the global handler)
+        chat_engine = get_chat_engine(vector_store=qdrant_handler)
         
         # Get AI Response
-        response = await chat_engine.process_query(text)
+        response = await chat_engine.process_query(text, db=db)
         answer = response.get("answer", "Lo siento, hubo un error procesando tu consulta.")
         pdf_url = response.get("pdf_url")
         products = response.get("products", [])
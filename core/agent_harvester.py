@@ -10,6 +10,7 @@ from playwright.async_api import async_playwright, BrowserContext, Page
 from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from core.models import Product, Supplier, ProductImage
+from core.bulk_upsert import upsert_products
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
@@ -341,50 +342,39 @@ class HarvesterAgent:
             db.commit()
             db.refresh(supplier)
 
+        # Default margin if not set
+        margin = supplier.margin_multiplier if supplier.margin_multiplier else 1.5
+
+        rows, images = [], {}
         for p_info in data:
             try:
                 adq_sku = hashlib.md5(p_info['url'].encode()).hexdigest()[:8].upper()
                 adq_sku = f"ADQ-{supplier_code[:2].upper()}-{adq_sku}"
-                
-                product = db.query(Product).filter(Product.sku_adquify == adq_sku).first()
-                
-                # Default margin if not set
-                margin = supplier.margin_multiplier if supplier.margin_multiplier else 1.5
-
-                if not product:
-                    product = Product(
-                        sku_adquify=adq_sku,
-                        sku_supplier=p_info.get('sku_supplier') or adq_sku,
-                        supplier_id=supplier.id,
-                        name=p_info['name'],
-                        category=p_info.get('category', 'general'),
-                        cost_price=p_info['price'],
-                        selling_price=p_info['price'] * margin,
-                        description=p_info.get('description', ''),
-                        material=p_info.get('material', ''),
-                        dimensions=p_info.get('dimensions', ''),
-                        status="published"
-                    )
-                    db.add(product)
-                    db.flush() 
-                    
-                    # Images
-                    for img_url in p_info.get('images', []):
-                        if img_url:
-                            img = ProductImage(product_id=product.id, url=img_url)
-                            db.add(img)
-                else:
-                    # Update critical fields
-                    product.cost_price = p_info['price']
-                    product.selling_price = p_info['price'] * margin
-                    product.updated_at = datetime.utcnow()
-                    
+                rows.append({
+                    "sku_adquify": adq_sku,
+                    "sku_supplier": p_info.get('sku_supplier') or adq_sku,
+                    "supplier_id": supplier.id,
+                    "name": p_info['name'],
+                    "category": p_info.get('category', 'general'),
+                    "cost_price": p_info['price'],
+                    "selling_price": p_info['price'] * margin,
+                    "description": p_info.get('description', ''),
+                    # core.models.Product has no material/dimensions columns (the old
+                    # Product(material=..., dimensions=...) raised TypeError and the row
+                    # was skipped): they go with the other specs in metadata_json
+                    "metadata_json": {
+                        "material": p_info.get('material', ''),
+                        "dimensions": p_info.get('dimensions', '')
+                    },
+                    "status": "published"
+                })
+                images[adq_sku] = p_info.get('images', [])
             except Exception as e:
                 logger.error(f"Error saving product {p_info.get('name')}: {e}")
-                db.rollback()
-                continue
-        
-        db.commit()
+
+        # New products are inserted with their images; existing ones only get prices refreshed
+        result = upsert_products(db, rows, update_columns=["cost_price", "selling_price"], images=images)
+        logger.info(f"💾 {supplier_code}: {result.created} new, {result.updated} updated")
 
 if __name__ == "__main__":
     agent = HarvesterAgent()
@@ -399,6 +389,7 @@ from playwright.async_api import async_playwright, BrowserContext, Page
 from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from core.models import Product, Supplier, ProductImage
+from core.bulk_upsert import upsert_products
 
 # Configure Logging (Devin Style)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
@@ -512,39 +503,28 @@ class HarvesterAgent:
         if not supplier:
             supplier = Supplier(code=supplier_code, name=supplier_code.capitalize())
             db.add(supplier)
-            db.flush()
+            db.commit()  # Products are committed per chunk; the supplier must not ride on the first one
 
+        rows, images = [], {}
         for p_info in data:
-            # Check if exists
             adq_sku = hashlib.md5(p_info['url'].encode()).hexdigest()[:8].upper()
             adq_sku = f"ADQ-{supplier_code[:2].upper()}-{adq_sku}"
-            
-            product = db.query(Product).filter(Product.sku_adquify == adq_sku).first()
-            
-            if not product:
-                product = Product(
-                    sku_adquify=adq_sku,
-                    sku_supplier=p_info['sku_supplier'],
-                    supplier_id=supplier.id,
-                    name=p_info['name'],
-                    category=p_info['category'],
-                    cost_price=p_info['price'],
-                    selling_price=p_info['price'] * supplier.margin_multiplier,
-                    description=p_info['description'],
-                    status="published"
-                )
-                db.add(product)
-                db.flush()
-                
-                # Handle Images
-                for img_url in p_info.get('images', []):
-                    img = ProductImage(product_id=product.id, url=img_url)
-                    db.add(img)
-            else:
-                # Update price if changed
-                product.cost_price = p_info['price']
-                product.selling_price = p_info['price'] * supplier.margin_multiplier
-                product.updated_at = datetime.utcnow()
+            rows.append({
+                "sku_adquify": adq_sku,
+                "sku_supplier": p_info['sku_supplier'],
+                "supplier_id": supplier.id,
+                "name": p_info['name'],
+                "category": p_info['category'],
+                "cost_price": p_info['price'],
+                "selling_price": p_info['price'] * supplier.margin_multiplier,
+                "description": p_info['description'],
+                "status": "published"
+            })
+            images[adq_sku] = p_info.get('images', [])
+
+        # Insert new products (with images), update prices of existing ones; committed per chunk
+        result = upsert_products(db, rows, update_columns=["cost_price", "selling_price"], images=images)
+        logger.info(f"💾 {supplier_code}: {result.created} new, {result.updated} updated")
 
 if __name__ == "__main__":
     agent = HarvesterAgent()
@@ -0,0 +1,138 @@
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core.ai.vector_codec import encode_vector, decode_vector
+
+logger = logging.getLogger("EmbeddingCache")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: NFKC, case-folded, whitespace collapsed"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.casefold().split()).strip(" .,;:!?¿¡")
+
+
+class QueryEmbeddingCache:
+    """
+    Normalized query text -> embedding vector.
+    - Memory tier: size-bounded LRU with TTL.
+    - Optional disk tier (SQLite) so hot queries survive restarts.
+    Thread-safe; vectors are returned as float32 NumPy arrays.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 7 * 24 * 3600, db_path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._disk = None
+        if db_path:
+            try:
+                Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+                self._disk = sqlite3.connect(str(db_path), check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                if ttl_seconds is not None:
+                    # Drop expired entries so the disk tier stays bounded by TTL
+                    self._disk.execute("DELETE FROM query_embeddings WHERE created_at < ?", (time.time() - ttl_seconds,))
+                self._disk.commit()
+            except Exception as e:
+                logger.warning(f"Disk tier disabled ({db_path}): {e}")
+                self._disk = None
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, vector: np.ndarray):
+        self._memory[key] = (created_at, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._disk:
+                row = self._disk.execute(
+                    "SELECT vector, created_at FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    vector = decode_vector(row[0])
+                    self._remember(key, row[1], vector)
+                    self.stats["disk_hits"] += 1
+                    return vector
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, text: str, vector) -> np.ndarray:
+        key = normalize_query(text)
+        arr = np.asarray(vector, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, arr)
+            if self._disk:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                        (key, encode_vector(arr), now)
+                    )
+                    self._disk.commit()
+                except Exception as e:
+                    logger.warning(f"Failed to persist query embedding: {e}")
+        return arr
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk:
+                self._disk.execute("DELETE FROM query_embeddings")
+                self._disk.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._memory),
+                "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+            }
+
+
+# ========== GLOBAL INSTANCE ==========
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Process-wide query cache (disk tier under data/cache)"""
+    global _query_cache
+    if _query_cache is None:
+        from core.config import settings
+        _query_cache = QueryEmbeddingCache(
+            max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+            db_path=settings.DATA_DIR / "cache" / "query_embeddings.db" if settings.QUERY_EMBEDDING_CACHE_PERSIST else None
+        )
+    return _query_cache
@@ -1,6 +1,9 @@
 
 import os
+import time
+import hashlib
 import logging
+import numpy as np
 import google.generativeai as genai
 from typing import List, Optional
 from dotenv import load_dotenv
@@ -16,9 +19,14 @@ class GeminiEmbeddingHandler:
     Model: models/text-embedding-004
     Dimension: 768
     """
-    def __init__(self, model_name: str = "models/text-embedding-004"):
+    # Límite de textos por llamada batchEmbedContents
+    max_batch_size = 100
+
+    def __init__(self, model_name: str = "models/text-embedding-004", cache=None):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.model_name = model_name
+        # Optional QueryEmbeddingCache used by get_query_embedding_async
+        self.cache = cache
         
         if not self.api_key:
             logger.warning("GOOGLE_API_KEY not found. Embeddings will fail.")
@@ -55,3 +63,74 @@ class GeminiEmbeddingHandler:
         # We can run it in a thread/executor.
         import asyncio
         return await asyncio.to_thread(self.get_embedding, text)
+
+    async def get_query_embedding_async(self, text: str) -> List[float]:
+        """
+        Embedding for a user query, served from `self.cache` when possible
+        (saves the API round trip for repeated queries).
+        """
+        if self.cache is None:
+            return await self.get_embedding_async(text)
+
+        cached = self.cache.get(text)
+        if cached is not None:
+            return cached
+        vector = await self.get_embedding_async(text)
+        return self.cache.put(text, vector)
+
+    def get_embeddings_batch(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        """
+        Synchronous batch embedding generation (one API call for up to `max_batch_size` texts).
+        Errors are propagated so the caller can retry (e.g. on 429 rate limits).
+        """
+        if not self.configured:
+            raise ValueError("Google API Key not configured")
+        if not texts:
+            return []
+
+        result = genai.embed_content(
+            model=self.model_name,
+            content=[t.replace("\n", " ") for t in texts],
+            task_type=task_type
+        )
+        return result['embedding']
+
+
+class FakeEmbeddingHandler:
+    """
+    Deterministic local embedder with the same interface as GeminiEmbeddingHandler.
+    Used for offline benchmarks and tests: the same text always yields the same
+    unit vector, and `latency` simulates the network round trip per call.
+    """
+    max_batch_size = 100
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.configured = True
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        vec /= np.linalg.norm(vec)
+        return vec.tolist()
+
+    def get_embedding(self, text: str) -> List[float]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def get_embeddings_batch(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def get_embedding_async(self, text: str) -> List[float]:
+        import asyncio
+        return await asyncio.to_thread(self.get_embedding, text)
+
+    async def get_query_embedding_async(self, text: str) -> List[float]:
+        return await self.get_embedding_async(text)
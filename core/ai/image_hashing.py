@@ -0,0 +1,218 @@
+"""
+Perceptual image fingerprints (CPU only, Pillow + NumPy)
+========================================================
+Detects the same supplier photo across catalogs (re-encoded, resized,
+slightly recompressed) without a GPU model.
+
+Fingerprint = 80 bytes:
+    pHash (64 bit)      DCT of a 32x32 grayscale thumbnail, 8x8 low frequencies vs median
+    dHash (64 bit)      horizontal gradient signs of a 9x8 grayscale thumbnail
+    color histogram     4x4x4 RGB bins, normalized to uint8 (64 bytes)
+
+Hamming distance on the hashes finds candidates; the histogram rejects
+grayscale-identical but differently colored variants (same chair, other fabric).
+
+ImageHashIndex answers Hamming-radius queries with multi-index hashing: the
+64-bit hash is split into 4 x 16-bit chunks; by pigeonhole, any hash within
+distance r matches at least one chunk within r // 4 bits, so only those
+buckets are probed and verified.
+"""
+
+import struct
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+HIST_BINS = 4
+FINGERPRINT_SIZE = 16 + HIST_BINS ** 3
+
+# 8-bit popcount table for vectorized Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def _grayscale(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def phash(image: Image.Image) -> int:
+    pixels = _grayscale(image, (32, 32))
+    dct = _DCT32 @ pixels @ _DCT32.T
+    low = dct[:8, :8].ravel()
+    # Median without the DC term (it only encodes overall brightness)
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image: Image.Image) -> int:
+    pixels = _grayscale(image, (9, 8))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def color_histogram(image: Image.Image, bins: int = HIST_BINS) -> np.ndarray:
+    """RGB histogram (bins^3) of a 64x64 thumbnail, scaled so the largest bin is 255"""
+    rgb = np.asarray(image.convert("RGB").resize((64, 64), Image.BILINEAR), dtype=np.uint16)
+    q = (rgb * bins) // 256
+    codes = (q[..., 0] * bins + q[..., 1]) * bins + q[..., 2]
+    hist = np.bincount(codes.ravel(), minlength=bins ** 3).astype(np.float32)
+    return np.round(hist / max(hist.max(), 1.0) * 255).astype(np.uint8)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass(frozen=True)
+class ImageFingerprint:
+    phash: int
+    dhash: int
+    histogram: bytes
+
+    def to_bytes(self) -> bytes:
+        return struct.pack(">QQ", self.phash, self.dhash) + self.histogram
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "ImageFingerprint":
+        if blob is None or len(blob) != FINGERPRINT_SIZE:
+            raise ValueError("Not an image fingerprint")
+        p, d = struct.unpack_from(">QQ", blob)
+        return cls(p, d, bytes(blob[16:]))
+
+    def color_similarity(self, other: "ImageFingerprint") -> float:
+        """Histogram intersection in [0, 1]"""
+        a = np.frombuffer(self.histogram, dtype=np.uint8).astype(np.float32)
+        b = np.frombuffer(other.histogram, dtype=np.uint8).astype(np.float32)
+        total = max(a.sum(), b.sum(), 1.0)
+        return float(np.minimum(a, b).sum() / total)
+
+
+def fingerprint_image(image: Image.Image) -> ImageFingerprint:
+    image.draft("RGB", (256, 256))  # JPEG: decode at reduced size (much faster)
+    return ImageFingerprint(phash(image), dhash(image), color_histogram(image).tobytes())
+
+
+def fingerprint_bytes(data: bytes) -> ImageFingerprint:
+    with Image.open(BytesIO(data)) as image:
+        return fingerprint_image(image)
+
+
+def fingerprint_file(path: str) -> Optional[bytes]:
+    """Encoded fingerprint of an image file, or None if unreadable (process-pool friendly)"""
+    try:
+        with Image.open(path) as image:
+            return fingerprint_image(image).to_bytes()
+    except Exception:
+        return None
+
+
+def hamming_many(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Hamming distance from `value` to every uint64 in `hashes`"""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+class ImageHashIndex:
+    """
+    Multi-index hashing over 64-bit pHashes for Hamming-radius queries.
+    Keys are arbitrary ids (e.g. ProductImage.id).
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+
+    def __init__(self, items: Iterable[Tuple[int, ImageFingerprint]] = ()):
+        ids, fingerprints = [], []
+        for key, fp in items:
+            ids.append(key)
+            fingerprints.append(fp)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.fingerprints = fingerprints
+        self.hashes = np.fromiter((fp.phash for fp in fingerprints), dtype=np.uint64, count=len(fingerprints))
+
+        mask = np.uint64((1 << self.CHUNK_BITS) - 1)
+        self._tables: List[Dict[int, np.ndarray]] = []
+        for c in range(self.CHUNKS):
+            chunk = (self.hashes >> np.uint64(c * self.CHUNK_BITS)) & mask
+            order = np.argsort(chunk, kind="stable")
+            values, starts = np.unique(chunk[order], return_index=True)
+            groups = np.split(order, starts[1:])
+            self._tables.append({int(v): g for v, g in zip(values, groups)})
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _chunk_neighbors(self, value: int, radius: int) -> List[int]:
+        """All 16-bit values within `radius` bits of `value` (radius <= 2 in practice)"""
+        out = [value]
+        frontier = [value]
+        for _ in range(radius):
+            frontier = [v ^ (1 << b) for v in frontier for b in range(self.CHUNK_BITS)]
+            out.extend(frontier)
+        return list(set(out))
+
+    def _candidates(self, value: int, radius: int) -> np.ndarray:
+        sub_radius = radius // self.CHUNKS
+        mask = (1 << self.CHUNK_BITS) - 1
+        found = []
+        for c, table in enumerate(self._tables):
+            chunk = (value >> (c * self.CHUNK_BITS)) & mask
+            for neighbor in self._chunk_neighbors(chunk, sub_radius):
+                rows = table.get(neighbor)
+                if rows is not None:
+                    found.append(rows)
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def query(self, fingerprint: ImageFingerprint, max_distance: int = 6,
+              min_color_similarity: float = 0.0) -> List[Tuple[int, int, float]]:
+        """[(id, hamming distance, color similarity)] within `max_distance`, closest first"""
+        rows = self._candidates(fingerprint.phash, max_distance)
+        if not rows.size:
+            return []
+        distances = hamming_many(self.hashes[rows], fingerprint.phash)
+        keep = distances <= max_distance
+        results = []
+        for row, distance in zip(rows[keep], distances[keep]):
+            color = fingerprint.color_similarity(self.fingerprints[row])
+            if color >= min_color_similarity:
+                results.append((int(self.ids[row]), int(distance), round(color, 4)))
+        results.sort(key=lambda r: (r[1], -r[2]))
+        return results
+
+    def duplicate_groups(self, max_distance: int = 6, min_color_similarity: float = 0.8) -> List[List[int]]:
+        """Groups of ids whose images are near-identical (transitive)"""
+        parent = list(range(len(self.ids)))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        row_of = {int(key): row for row, key in enumerate(self.ids)}
+        for row, fp in enumerate(self.fingerprints):
+            for key, _, _ in self.query(fp, max_distance, min_color_similarity):
+                other = row_of[key]
+                if other != row:
+                    parent[find(other)] = find(row)
+
+        groups: Dict[int, List[int]] = {}
+        for row in range(len(self.ids)):
+            groups.setdefault(find(row), []).append(int(self.ids[row]))
+        return [g for g in groups.values() if len(g) > 1]
@@ -0,0 +1,453 @@
+"""
+Local Vector Store (NumPy)
+==========================
+In-process replacement for QdrantHandler on single-node deployments: no
+Qdrant server, and no rebuild on boot.
+
+- Vectors are L2-normalized float32 rows; cosine similarity is a matrix-vector
+  product over the whole matrix ("flat", exact) or over the probed cells of
+  an inverted file index ("ivf", approximate: spherical k-means centroids,
+  `nprobe` cells searched per query). The IVF cells are (re)trained in
+  `flush`, never inside a search: until the first training, searches are exact.
+- Persisted under data/vector_index/<collection>/ as .npy + JSON; the vector
+  matrix is memory-mapped on load, so startup cost does not grow with the
+  catalog. The first write copies it into memory.
+- Payload filters (category, supplier_code, price range, in stock) run as
+  NumPy masks over columnar copies of those payload fields.
+
+Same interface as QdrantHandler (ensure_collection, search, upsert_points,
+delete_points, count, list_point_ids, flush). Point ids are the SKUs.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.ai.search_filters import SearchFilters, as_values
+
+logger = logging.getLogger("LocalVectorStore")
+
+CODE_COLUMNS = ("category", "supplier_code")
+NUMERIC_COLUMNS = ("price", "stock", "stock_known")
+
+
+@dataclass
+class SearchHit:
+    """Search result (same attributes the chat engine reads from Qdrant's ScoredPoint)"""
+    id: str
+    score: float
+    payload: Dict[str, Any]
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class LocalVectorStore:
+    def __init__(
+        self,
+        collection_name: str = "adquify_products",
+        index_dir: Optional[Path] = None,
+        index_type: str = "flat",
+        # recall@10 on 20k points / 141 cells: ~0.96 at 32 on clustered (embedding-like)
+        # data vs ~0.9 at 16; unstructured random data needs more (0.83 at 32, 32-dim)
+        nprobe: int = 32,
+        nlist: Optional[int] = None,
+        ivf_min_points: int = 10000
+    ):
+        if index_type not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported local index type: {index_type}")
+
+        from core.config import settings
+        self.collection_name = collection_name
+        self.index_dir = Path(index_dir or settings.DATA_DIR / "vector_index") / collection_name
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.ivf_min_points = ivf_min_points
+        self._lock = threading.RLock()
+        self._dirty = False
+
+        self._reset(dim=None)
+        self._load()
+
+    # ----- state -----
+
+    def _reset(self, dim: Optional[int]):
+        self.dim = dim
+        self._size = 0
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._payloads: List[Dict] = []
+        self._rows: Dict[str, int] = {}
+        self._vocab: Dict[str, Dict[str, int]] = {c: {} for c in CODE_COLUMNS}
+        self._cols: Dict[str, np.ndarray] = {c: np.zeros(0, dtype=np.int32) for c in CODE_COLUMNS}
+        self._cols.update({c: np.zeros(0, dtype=np.float64) for c in NUMERIC_COLUMNS})
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+    def _files(self) -> Dict[str, Path]:
+        return {
+            "meta": self.index_dir / "meta.json",
+            "vectors": self.index_dir / "vectors.npy",
+            "columns": self.index_dir / "columns.npz",
+            "centroids": self.index_dir / "centroids.npy",
+        }
+
+    def _load(self):
+        files = self._files()
+        if not files["meta"].exists():
+            return
+        try:
+            meta = json.loads(files["meta"].read_text(encoding="utf-8"))
+            vectors = np.load(files["vectors"], mmap_mode="r")
+            if vectors.shape[0] != meta["count"] or len(meta["ids"]) != meta["count"]:
+                raise ValueError("vector matrix and metadata are out of sync")
+
+            self._reset(dim=meta["dim"])
+            self._vectors = vectors
+            self._size = meta["count"]
+            self._ids = meta["ids"]
+            self._payloads = meta["payloads"]
+            self._rows = {pid: i for i, pid in enumerate(self._ids)}
+            self._vocab = meta["vocab"]
+            with np.load(files["columns"]) as cols:
+                # Columns added after the index was written read as unknown (NaN) until a reindex
+                self._cols = {
+                    c: cols[c] if c in cols.files else np.full(self._size, np.nan)
+                    for c in CODE_COLUMNS + NUMERIC_COLUMNS
+                }
+                self._assign = cols["assign"]
+            if meta.get("trained_size") and files["centroids"].exists():
+                self._centroids = np.load(files["centroids"])
+                self._trained_size = meta["trained_size"]
+            logger.info(f"Loaded local vector index '{self.collection_name}' ({self._size} points, memory-mapped)")
+        except Exception as e:
+            logger.warning(f"Local vector index at {self.index_dir} unreadable ({e}); starting empty")
+            self._reset(dim=None)
+
+    def flush(self):
+        """
+        Persists the index if it changed (atomic per file; meta.json is written last).
+        Trains the IVF cells first when they are missing or stale (batch time, not query time).
+        """
+        if self._needs_training():
+            self._train_ivf()
+        with self._lock:
+            if not self._dirty:
+                return
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            files = self._files()
+            n = self._size
+
+            def write(path: Path, save):
+                tmp = path.with_name(path.name + ".tmp")
+                with open(tmp, "wb") as f:
+                    save(f)
+                os.replace(tmp, path)
+
+            write(files["vectors"], lambda f: np.save(f, np.ascontiguousarray(self._vectors[:n])))
+            write(files["columns"], lambda f: np.savez(
+                f, assign=self._assign[:n], **{c: arr[:n] for c, arr in self._cols.items()}
+            ))
+            if self._centroids is not None:
+                write(files["centroids"], lambda f: np.save(f, self._centroids))
+            meta = {
+                "dim": self.dim,
+                "count": n,
+                "ids": self._ids,
+                "payloads": self._payloads,
+                "vocab": self._vocab,
+                "trained_size": self._trained_size if self._centroids is not None else 0
+            }
+            write(files["meta"], lambda f: f.write(json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8")))
+            self._dirty = False
+            logger.info(f"Local vector index '{self.collection_name}' saved ({n} points)")
+
+    def _reserve(self, extra: int):
+        """Makes the arrays writable (detaches the mmap) with room for `extra` rows"""
+        needed = self._size + extra
+        capacity = self._vectors.shape[0]
+        if self._vectors.flags.writeable and needed <= capacity:
+            return
+
+        new_capacity = max(needed, capacity * 2 if self._vectors.flags.writeable else needed, 1024)
+
+        def grow(arr: np.ndarray, fill=0) -> np.ndarray:
+            out = np.full((new_capacity,) + arr.shape[1:], fill, dtype=arr.dtype)
+            out[:self._size] = arr[:self._size]
+            return out
+
+        self._vectors = grow(self._vectors)
+        self._assign = grow(self._assign, -1)
+        for c in CODE_COLUMNS:
+            self._cols[c] = grow(self._cols[c], -1)
+        for c in NUMERIC_COLUMNS:
+            self._cols[c] = grow(self._cols[c], np.nan)
+
+    def _code(self, column: str, value) -> int:
+        if value is None or value == "":
+            return -1
+        vocab = self._vocab[column]
+        key = str(value)
+        if key not in vocab:
+            vocab[key] = len(vocab)
+        return vocab[key]
+
+    # ----- QdrantHandler interface -----
+
+    def ensure_collection(self, vector_size: int = 768, force_recreate: bool = False):
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector_size
+                self._vectors = np.zeros((0, vector_size), dtype=np.float32)
+            elif self.dim != vector_size or force_recreate:
+                logger.warning(f"Local index dimension mismatch or forced (Current: {self.dim}, Target: {vector_size}). Recreating...")
+                self._reset(dim=vector_size)
+                self._dirty = True
+
+    @staticmethod
+    def to_point_id(point_id: str) -> str:
+        """Points are keyed by SKU directly"""
+        return str(point_id)
+
+    def count(self) -> int:
+        return self._size
+
+    def list_point_ids(self, page_size: int = 1000) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def payload_values(self, key: str) -> Dict[str, object]:
+        """{point_id: payload[key]} for every point (None where the key is missing)"""
+        with self._lock:
+            return {pid: payload.get(key) for pid, payload in zip(self._ids, self._payloads)}
+
+    async def upsert_points(self, points: List[Tuple[str, List[float], Dict]], wait: bool = True) -> int:
+        if not points:
+            return 0
+        try:
+            return await asyncio.to_thread(self._upsert, points)
+        except Exception as e:
+            logger.error(f"Bulk upsert of {len(points)} points failed: {e}")
+            return 0
+
+    async def upsert_point(self, point_id: str, vector: List[float], payload: Dict):
+        await self.upsert_points([(point_id, vector, payload)])
+
+    async def delete_points(self, point_ids: List[str]) -> int:
+        """Same contract as QdrantHandler: the number requested (ids not in the index included), 0 on failure"""
+        if not point_ids:
+            return 0
+        try:
+            await asyncio.to_thread(self._delete, point_ids)
+            return len(point_ids)
+        except Exception as e:
+            logger.error(f"Delete of {len(point_ids)} points failed: {e}")
+            return 0
+
+    async def search(self, vector: List[float], limit: int = 5, score_threshold: float = 0.6,
+                     filters: Optional[SearchFilters] = None) -> List[SearchHit]:
+        try:
+            return await asyncio.to_thread(self.search_sync, vector, limit, score_threshold, filters)
+        except Exception as e:
+            logger.error(f"Search failed with error: {e}")
+            return []
+
+    # ----- writes -----
+
+    def upsert_points_sync(self, points: List[Tuple[str, List[float], Dict]]) -> int:
+        """Blocking upsert for callers outside the event loop (batch jobs, worker threads)"""
+        return self._upsert(points) if points else 0
+
+    def delete_points_sync(self, point_ids: List[str]) -> int:
+        return self._delete(point_ids) if point_ids else 0
+
+    def _upsert(self, points) -> int:
+        # Last occurrence wins for repeated ids in one batch
+        latest = {str(pid): (vec, payload) for pid, vec, payload in points}
+        ids = list(latest)
+        vectors = np.asarray([latest[pid][0] for pid in ids], dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("Vectors must share one dimension")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        with self._lock:
+            if self.dim is None:
+                self.ensure_collection(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} != index dimension {self.dim}")
+
+            new_ids = [pid for pid in ids if pid not in self._rows]
+            self._reserve(len(new_ids))
+            for pid in new_ids:
+                self._rows[pid] = self._size
+                self._ids.append(pid)
+                self._payloads.append({})
+                self._size += 1
+
+            rows = np.fromiter((self._rows[pid] for pid in ids), dtype=np.int64, count=len(ids))
+            self._vectors[rows] = vectors
+            for row, pid in zip(rows, ids):
+                payload = dict(latest[pid][1] or {})
+                self._payloads[row] = payload
+                for c in CODE_COLUMNS:
+                    self._cols[c][row] = self._code(c, payload.get(c))
+                for c in NUMERIC_COLUMNS:
+                    self._cols[c][row] = _as_float(payload.get(c))
+            if self._centroids is not None:
+                self._assign[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+            self._dirty = True
+            return len(ids)
+
+    def _delete(self, point_ids: List[str]) -> int:
+        with self._lock:
+            targets = [str(pid) for pid in point_ids if str(pid) in self._rows]
+            if not targets:
+                return 0
+            self._reserve(0)
+            for pid in targets:
+                # Swap-remove: move the last row into the hole to keep the matrix dense
+                row = self._rows.pop(pid)
+                last = self._size - 1
+                if row != last:
+                    moved = self._ids[last]
+                    self._vectors[row] = self._vectors[last]
+                    self._assign[row] = self._assign[last]
+                    for arr in self._cols.values():
+                        arr[row] = arr[last]
+                    self._ids[row] = moved
+                    self._payloads[row] = self._payloads[last]
+                    self._rows[moved] = row
+                self._ids.pop()
+                self._payloads.pop()
+                self._size -= 1
+            self._dirty = True
+            return len(targets)
+
+    # ----- search -----
+
+    def _filter_mask(self, filters: Optional[SearchFilters]) -> Optional[np.ndarray]:
+        if filters is None or filters.is_empty():
+            return None
+        n = self._size
+        mask = np.ones(n, dtype=bool)
+        for column in CODE_COLUMNS:
+            values = as_values(getattr(filters, column))
+            if values:
+                codes = [self._vocab[column][v] for v in values if v in self._vocab[column]]
+                mask &= np.isin(self._cols[column][:n], codes)
+        price = self._cols["price"][:n]
+        with np.errstate(invalid="ignore"):
+            if filters.min_price is not None:
+                mask &= price >= filters.min_price
+            if filters.max_price is not None:
+                mask &= price <= filters.max_price
+            if filters.in_stock:
+                mask &= (self._cols["stock_known"][:n] == 1) & (self._cols["stock"][:n] > 0)
+        return mask
+
+    def _needs_training(self) -> bool:
+        """IVF cells missing, or trained on less than half of the current points"""
+        if self.index_type != "ivf" or self._size < self.ivf_min_points:
+            return False
+        return self._centroids is None or self._size > 2 * self._trained_size
+
+    def _train_ivf(self, iterations: int = 10, seed: int = 0):
+        """
+        Spherical k-means on a sample, then assigns every row to its nearest centroid.
+        Only the sampling and the assignment hold the lock: searches and writes go on
+        (exact, or with the previous cells) while k-means runs.
+        """
+        rng = np.random.default_rng(seed)
+        with self._lock:
+            n = self._size
+            nlist = self.nlist or int(np.clip(np.sqrt(n), 16, 4096))
+            sample = np.array(self._vectors[np.sort(rng.choice(n, size=min(n, nlist * 32), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            # Per-cell sums via sort + reduceat (np.add.at is far slower on 2-D rows)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            present = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True).clip(min=1e-12)
+
+        centroids = centroids.astype(np.float32)
+        with self._lock:
+            # Every current row, including those written during k-means
+            n = self._size
+            self._reserve(0)
+            for start in range(0, n, 65536):
+                block = self._vectors[start:start + 65536]
+                self._assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self._centroids = centroids
+            self._trained_size = n
+            self._dirty = True
+        logger.info(f"IVF index trained: {nlist} cells over {n} points")
+
+    def _ivf_candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        # Not trained yet (see flush): exact search. Rows written since the last
+        # training were assigned to the existing cells on upsert.
+        if self.index_type != "ivf" or self._size < self.ivf_min_points or self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return np.isin(self._assign[:self._size], probes)
+
+    def search_sync(self, vector, limit: int = 5, score_threshold: float = 0.6,
+                    filters: Optional[SearchFilters] = None) -> List[SearchHit]:
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if not norm:
+            return []
+        query = query / norm
+
+        with self._lock:
+            if self._size == 0 or query.shape[0] != self.dim:
+                return []
+
+            mask = self._filter_mask(filters)
+            candidates = self._ivf_candidates(query)
+            rows, scores = self._score(query, mask if candidates is None else (
+                candidates if mask is None else candidates & mask
+            ))
+            if candidates is not None and np.count_nonzero(scores >= score_threshold) < limit:
+                # Probed cells too sparse (selective filter): fall back to exact search
+                rows, scores = self._score(query, mask)
+
+            keep = scores >= score_threshold
+            rows, scores = rows[keep], scores[keep]
+            if len(scores) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                rows, scores = rows[top], scores[top]
+            order = np.argsort(-scores)
+            return [
+                SearchHit(id=self._ids[r], score=float(s), payload=self._payloads[r])
+                for r, s in zip(rows[order], scores[order])
+            ]
+
+    def _score(self, query: np.ndarray, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        if mask is None:
+            return np.arange(self._size), self._vectors[:self._size] @ query
+        rows = np.flatnonzero(mask)
+        return rows, self._vectors[rows] @ query
@@ -0,0 +1,33 @@
+"""
+Structured filters for vector search (backend-agnostic).
+Matched against the point payload built by services.sync_service.build_point_payload.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+StrOrList = Optional[Union[str, Sequence[str]]]
+
+
+def as_values(value: StrOrList) -> List[str]:
+    """str | list[str] | None -> list of non-empty strings"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return [v for v in value if v]
+
+
+@dataclass
+class SearchFilters:
+    category: StrOrList = None        # exact payload value, any of
+    supplier_code: StrOrList = None   # exact payload value, any of
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: bool = False            # stock > 0 (unknown stock is excluded)
+
+    def is_empty(self) -> bool:
+        return not (
+            as_values(self.category) or as_values(self.supplier_code)
+            or self.min_price is not None or self.max_price is not None or self.in_stock
+        )
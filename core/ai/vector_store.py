@@ -1,16 +1,47 @@
 
 import os
 import logging
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 from dotenv import load_dotenv
 
+from core.ai.search_filters import SearchFilters, as_values
+
 load_dotenv()
 
 logger = logging.getLogger("QdrantStore")
 logger.setLevel(logging.INFO)
 
+# Payload fields filtered on at search time (see SearchFilters)
+PAYLOAD_INDEXES = {
+    "category": models.PayloadSchemaType.KEYWORD,
+    "supplier_code": models.PayloadSchemaType.KEYWORD,
+    "price": models.PayloadSchemaType.FLOAT,
+    "stock": models.PayloadSchemaType.INTEGER,
+    "stock_known": models.PayloadSchemaType.BOOL,
+}
+
+
+def to_qdrant_filter(filters: Optional[SearchFilters]) -> Optional[models.Filter]:
+    """SearchFilters -> Qdrant Filter (None when there is nothing to filter)"""
+    if filters is None or filters.is_empty():
+        return None
+
+    must = []
+    for field in ("category", "supplier_code"):
+        values = as_values(getattr(filters, field))
+        if values:
+            must.append(models.FieldCondition(key=field, match=models.MatchAny(any=values)))
+    if filters.min_price is not None or filters.max_price is not None:
+        must.append(models.FieldCondition(
+            key="price", range=models.Range(gte=filters.min_price, lte=filters.max_price)
+        ))
+    if filters.in_stock:
+        must.append(models.FieldCondition(key="stock_known", match=models.MatchValue(value=True)))
+        must.append(models.FieldCondition(key="stock", range=models.Range(gt=0)))
+    return models.Filter(must=must)
+
 class QdrantHandler:
     """
     Manages interactions with Qdrant Vector Database.
@@ -64,6 +95,7 @@ class QdrantHandler:
                     exists = False
                 else:
                     logger.debug(f"Collection '{self.collection_name}' exists with correct size.")
+                    self._ensure_payload_indexes(set(info.payload_schema or {}))
 
             if not exists:
                 logger.info(f"Creating collection '{self.collection_name}' with size {vector_size}...")
@@ -75,21 +107,41 @@ class QdrantHandler:
                     )
                 )
                 logger.info(f"Collection '{self.collection_name}' created.")
+                self._ensure_payload_indexes(set())
                 
         except Exception as e:
             logger.error(f"Error checking/creating collection: {e}")
 
-    async def search(self, vector: List[float], limit: int = 5, score_threshold: float = 0.6) -> List[Any]:
+    def _ensure_payload_indexes(self, existing: set):
+        """Creates the payload indexes used by filtered search (missing ones only)"""
+        if self.url == ":memory:":
+            return  # local mode filters by scanning; payload indexes are ignored
+        for field, schema in PAYLOAD_INDEXES.items():
+            if field in existing:
+                continue
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field,
+                    field_schema=schema
+                )
+            except Exception as e:
+                logger.warning(f"Payload index '{field}' not created: {e}")
+
+    async def search(self, vector: List[float], limit: int = 5, score_threshold: float = 0.6,
+                     filters: Optional[SearchFilters] = None) -> List[Any]:
         if not self.async_client and not self.client:
              logger.warning("Qdrant client is not initialized.")
              return []
         
+        query_filter = to_qdrant_filter(filters)
         try:
             if self.async_client:
                 # Async modern client
                 results = await self.async_client.search(
                     collection_name=self.collection_name,
                     query_vector=vector,
+                    query_filter=query_filter,
                     limit=limit,
                     score_threshold=score_threshold
                 )
@@ -106,6 +158,7 @@ class QdrantHandler:
                         search_method,
                         collection_name=self.collection_name,
                         query_vector=vector,
+                        query_filter=query_filter,
                         limit=limit,
                         score_threshold=score_threshold
                     )
@@ -118,6 +171,7 @@ class QdrantHandler:
                             query_points,
                             collection_name=self.collection_name,
                             query=vector,
+                            query_filter=query_filter,
                             limit=limit,
                             score_threshold=score_threshold,
                             with_payload=True
@@ -138,41 +192,117 @@ class QdrantHandler:
             logger.error(f"Search failed with error: {e}")
             return []
 
-    async def upsert_point(self, point_id: str, vector: List[float], payload: Dict):
-        if not self.async_client and not self.client:
-            return
-
+    @staticmethod
+    def to_point_id(point_id: str) -> str:
+        """Qdrant only accepts UUIDs/ints: SKUs are hashed to a stable UUID5"""
+        import uuid
         try:
-            import uuid
-            try:
-                # Try parsing as UUID
-                uuid_obj = uuid.UUID(str(point_id))
-                final_id = str(uuid_obj)
-            except ValueError:
-                # Hash string to UUID
-                final_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, str(point_id)))
-
-            points = [
-                models.PointStruct(
-                    id=final_id,
-                    vector=vector,
-                    payload=payload
-                )
-            ]
+            # Try parsing as UUID
+            return str(uuid.UUID(str(point_id)))
+        except ValueError:
+            # Hash string to UUID
+            return str(uuid.uuid5(uuid.NAMESPACE_DNS, str(point_id)))
+
+    def count(self) -> int:
+        """Number of points in the collection (0 if unavailable)"""
+        if not self.client:
+            return 0
+        return self.client.count(self.collection_name).count
 
+    async def upsert_points(self, points: List[Tuple[str, List[float], Dict]], wait: bool = True) -> int:
+        """
+        Bulk upsert of (point_id, vector, payload) tuples in a single request.
+        Returns the number of points sent (0 on failure).
+        """
+        if not points or (not self.async_client and not self.client):
+            return 0
+
+        structs = [
+            models.PointStruct(
+                id=self.to_point_id(point_id),
+                vector=vector.tolist() if hasattr(vector, "tolist") else list(vector),
+                payload=payload
+            )
+            for point_id, vector, payload in points
+        ]
+
+        try:
             if self.async_client:
                 await self.async_client.upsert(
                     collection_name=self.collection_name,
-                    points=points
+                    points=structs,
+                    wait=wait
                 )
             else:
-                 # Fallback to sync 
-                 import asyncio
-                 await asyncio.to_thread(
-                     self.client.upsert,
-                     collection_name=self.collection_name,
-                     points=points
-                 )
-                 
+                # Fallback to sync
+                import asyncio
+                await asyncio.to_thread(
+                    self.client.upsert,
+                    collection_name=self.collection_name,
+                    points=structs,
+                    wait=wait
+                )
+            return len(structs)
         except Exception as e:
-            logger.error(f"Upsert failed for {point_id}: {e}")
+            logger.error(f"Bulk upsert of {len(structs)} points failed: {e}")
+            return 0
+
+    async def delete_points(self, point_ids: List[str]) -> int:
+        """Deletes points by SKU (or raw point id). Returns the number requested."""
+        if not point_ids or (not self.async_client and not self.client):
+            return 0
+
+        selector = models.PointIdsList(points=[self.to_point_id(pid) for pid in point_ids])
+        try:
+            if self.async_client:
+                await self.async_client.delete(collection_name=self.collection_name, points_selector=selector)
+            else:
+                import asyncio
+                await asyncio.to_thread(
+                    self.client.delete,
+                    collection_name=self.collection_name,
+                    points_selector=selector
+                )
+            return len(point_ids)
+        except Exception as e:
+            logger.error(f"Delete of {len(point_ids)} points failed: {e}")
+            return 0
+
+    def list_point_ids(self, page_size: int = 1000) -> List[str]:
+        """All point ids in the collection (scroll without payloads or vectors)"""
+        if not self.client:
+            return []
+
+        ids = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            ids.extend(str(p.id) for p in points)
+            if offset is None:
+                break
+        return ids
+
+    async def upsert_point(self, point_id: str, vector: List[float], payload: Dict):
+        await self.upsert_points([(point_id, vector, payload)])
+
+    def flush(self):
+        """No-op: Qdrant persists writes itself (LocalVectorStore saves here)"""
+        pass
+
+
+def create_vector_store():
+    """Vector store for the configured backend (settings.VECTOR_BACKEND)"""
+    from core.config import settings
+    if settings.VECTOR_BACKEND == "local":
+        from core.ai.local_vector_store import LocalVectorStore
+        return LocalVectorStore(
+            index_type=settings.LOCAL_VECTOR_INDEX_TYPE,
+            nprobe=settings.LOCAL_VECTOR_IVF_NPROBE
+        )
+    return QdrantHandler()
@@ -0,0 +1,240 @@
+"""
+Adquify Engine - Bulk Upsert
+============================
+Escritura masiva para la ingesta de catálogos, en lugar de
+`SELECT ... .first()` + `commit()` por fila:
+
+- `prefetch`: claves existentes de un lote en una sola query `IN`.
+- `upsert`: `INSERT ... ON CONFLICT (...) DO UPDATE` (SQLite y PostgreSQL),
+  con executemany por lote. Las filas que no cambian no se reescriben, así
+  que `updated_at` (marca de agua de la sincronización vectorial) solo avanza
+  en las que cambian de verdad. Otros dialectos: INSERT + UPDATE por clave
+  primaria tras el prefetch.
+- `upsert_products`: productos por `sku_adquify` + imágenes de los productos
+  nuevos, en transacciones por lote (un fallo solo pierde su lote).
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import JSON, Text, and_, cast, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from core.models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+# Bound parameters per IN query (SQLite < 3.32 allows 999)
+IN_CHUNK_SIZE = 900
+
+
+def chunked(items: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def prefetch(db: Session, key_column, keys: Iterable, *columns, where=None) -> Dict[Any, Any]:
+    """
+    {key: row} de las filas cuyo `key_column` está en `keys` (una query IN por
+    cada IN_CHUNK_SIZE claves). `columns` son las columnas extra a leer.
+    """
+    keys = list(dict.fromkeys(k for k in keys if k is not None))
+    found = {}
+    for chunk in chunked(keys, IN_CHUNK_SIZE):
+        query = select(key_column, *columns).where(key_column.in_(chunk))
+        if where is not None:
+            query = query.where(where)
+        for row in db.execute(query):
+            found[row[0]] = row
+    return found
+
+
+def _column_names(model) -> set:
+    return {c.name for c in model.__table__.columns}
+
+
+def _group_by_keys(rows: List[Dict]) -> Dict[tuple, List[Dict]]:
+    """executemany needs the same keys in every row of a call"""
+    groups: Dict[tuple, List[Dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+def upsert(db: Session, model, rows: List[Dict], conflict_columns: Sequence[str],
+           update_columns: Optional[Sequence[str]] = None, passive_columns: Sequence[str] = ()) -> int:
+    """
+    Inserta o actualiza `rows` (dicts de columna -> valor) en la transacción
+    actual, sin commit. En conflicto sobre `conflict_columns` (índice único)
+    se actualizan `update_columns` (por defecto, todas las presentes en la fila).
+    `passive_columns` (p.ej. marcas de tiempo de la lectura) se escriben con el
+    resto, pero por sí solas no cuentan como cambio.
+    Devuelve el número de filas enviadas.
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    known = _column_names(model)
+    unknown = {k for row in rows for k in row} - known
+    if unknown:
+        raise ValueError(f"Unknown {table.name} columns: {sorted(unknown)}")
+
+    # Last occurrence wins for repeated keys (one statement cannot update a row twice)
+    unique = {tuple(row[c] for c in conflict_columns): row for row in rows}
+    rows = list(unique.values())
+
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        _upsert_generic(db, model, rows, conflict_columns, update_columns, passive_columns)
+        return len(rows)
+
+    dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    touch = "updated_at" in known
+
+    for keys, group in _group_by_keys(rows).items():
+        stmt = dialect_insert(table)
+        columns = [c for c in (update_columns or keys) if c in keys and c not in conflict_columns]
+        if not [c for c in columns if c not in passive_columns]:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        else:
+            set_ = {c: stmt.excluded[c] for c in columns}
+            if touch and "updated_at" not in set_:
+                set_["updated_at"] = datetime.utcnow()
+            # Only rewrite rows whose values actually change (JSON compared as text)
+            changed = or_(*[
+                cast(table.c[c], Text).is_distinct_from(cast(stmt.excluded[c], Text))
+                if isinstance(table.c[c].type, JSON)
+                else table.c[c].is_distinct_from(stmt.excluded[c])
+                for c in columns if c not in passive_columns
+            ])
+            stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=set_, where=changed)
+        db.execute(stmt, group)
+    return len(rows)
+
+
+def _upsert_generic(db: Session, model, rows: List[Dict], conflict_columns: Sequence[str],
+                    update_columns: Optional[Sequence[str]], passive_columns: Sequence[str] = ()):
+    """
+    Fallback without ON CONFLICT: prefetch ids and current values, bulk INSERT
+    the new rows, bulk UPDATE the rest. Like the ON CONFLICT path, unchanged
+    rows are skipped and changed ones get a new `updated_at`.
+    """
+    table = model.__table__
+    pk = table.primary_key.columns.values()[0]
+    compare = [
+        c for c in dict.fromkeys(c for row in rows for c in (update_columns or row))
+        if c in table.c and c not in conflict_columns
+    ]
+    current = [table.c[c] for c in compare]
+    criteria = lambda row: and_(*[table.c[c] == row[c] for c in conflict_columns])
+    if len(conflict_columns) == 1:
+        existing = prefetch(db, table.c[conflict_columns[0]], [r[conflict_columns[0]] for r in rows], pk, *current)
+        found = {(k,): row[1:] for k, row in existing.items()}
+    else:
+        found = {}
+        keys = [table.c[c] for c in conflict_columns]
+        for chunk in chunked(rows, IN_CHUNK_SIZE // len(conflict_columns)):
+            query = select(*keys, pk, *current).where(or_(*[criteria(r) for r in chunk]))
+            found.update({tuple(row[:len(keys)]): row[len(keys):] for row in db.execute(query)})
+
+    touch = "updated_at" in table.c
+    now = datetime.utcnow()
+    new, existing_rows = [], []
+    for row in rows:
+        match = found.get(tuple(row[c] for c in conflict_columns))
+        if match is None:
+            new.append(row)
+            continue
+        row_id, old = match[0], dict(zip(compare, match[1:]))
+        values = {c: row[c] for c in (update_columns or row) if c in row and c not in conflict_columns}
+        if all(old[c] == v for c, v in values.items() if c not in passive_columns):
+            continue
+        if touch and "updated_at" not in values:
+            values["updated_at"] = now
+        existing_rows.append({pk.name: row_id, **values})
+    for group in _group_by_keys(new).values():
+        db.execute(insert(table), group)
+    for group in _group_by_keys(existing_rows).values():
+        db.execute(update(model), group)
+
+
+def new_skus(db: Session, count: int, generate: Callable[[], str]) -> List[str]:
+    """
+    `count` SKUs from `generate` that are not in the DB yet (nor repeated).
+    Random SKUs must be checked: with ON CONFLICT a collision would silently
+    update another product instead of failing.
+    """
+    skus: List[str] = []
+    while len(skus) < count:
+        candidates = set()
+        while len(candidates) < count - len(skus):
+            candidates.add(generate())
+        candidates -= set(skus)
+        candidates -= set(prefetch(db, Product.sku_adquify, candidates))
+        skus.extend(candidates)
+    return skus[:count]
+
+
+@dataclass
+class UpsertResult:
+    created: int = 0
+    updated: int = 0
+    errors: List[str] = field(default_factory=list)
+    ids: Dict[str, int] = field(default_factory=dict)  # sku_adquify -> products.id
+
+    def as_dict(self) -> Dict:
+        return {"created": self.created, "updated": self.updated, "errors": self.errors}
+
+
+def upsert_products(
+    db: Session,
+    rows: List[Dict],
+    update_columns: Optional[Sequence[str]] = None,
+    images: Optional[Dict[str, List[str]]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    result: Optional[UpsertResult] = None,
+    passive_columns: Sequence[str] = ()
+) -> UpsertResult:
+    """
+    Upsert de productos por `sku_adquify`, con commit por lote.
+
+    rows            dicts con columnas de Product (todas deben traer sku_adquify).
+    update_columns  columnas que se actualizan si el producto ya existe
+                    (las demás solo se escriben al crearlo).
+    images          {sku_adquify: [url, ...]} que se añaden solo a los productos nuevos.
+    passive_columns columnas de update_columns que no cuentan como cambio (ver `upsert`).
+    """
+    result = result or UpsertResult()
+    images = images or {}
+
+    for chunk in chunked(rows, chunk_size):
+        skus = [r["sku_adquify"] for r in chunk]
+        try:
+            existing = prefetch(db, Product.sku_adquify, skus)
+            upsert(db, Product, list(chunk), ["sku_adquify"], update_columns, passive_columns)
+
+            ids = {sku: row[1] for sku, row in prefetch(db, Product.sku_adquify, skus, Product.id).items()}
+            created = {sku for sku in skus if sku not in existing}
+            image_rows = [
+                {"product_id": ids[sku], "url": url}
+                for sku in created if sku in ids
+                for url in dict.fromkeys(images.get(sku) or ())
+                if url
+            ]
+            if image_rows:
+                db.execute(insert(ProductImage), image_rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Bulk upsert of {len(chunk)} products failed: {e}")
+            result.errors.append(f"Rows {skus[0]}..{skus[-1]}: {e}")
+            continue
+
+        result.created += len(created)
+        result.updated += len(set(skus)) - len(created)
+        result.ids.update(ids)
+    return result
@@ -9,38 +9,49 @@ MULTIPLICADORES = {
     'Default': 1.60   # Margen de seguridad si no hay tipo definido
 }
 
-def limpiar_nombre(texto):
-    """Convierte MAYÚSCULAS GRITONAS en Formato Título y añade branding"""
-    if pd.isna(texto) or not texto: return "Producto Adquify Sin Nombre"
-    texto = str(texto).title()
-    # Eliminar palabras clave de proveedores si las hubiera
-    texto = texto.replace("Mod.", "Serie").replace("Tap.", "Acabado")
-    return texto
-
-def calcular_pvp(row):
-    """Calcula precio final basado en puntos (precio proveedor) y tipo"""
-    # Mapping from internal JSON to user logic
-    # 'price_supplier' is equivalent to 'Puntos'
-    puntos = row.get('price_supplier', 0)
-    
+# Columnas de entrada que usa AdquifyProcessor (lectura selectiva de snapshots)
+COLUMNAS_ENTRADA = ['id', 'sku_adquify', 'name', 'name_original', 'price_supplier', 'type_point',
+                    'images', 'Alto', 'Ancho', 'Fondo', 'product_url']
+
+NOMBRE_POR_DEFECTO = "Producto Adquify Sin Nombre"
+# Palabras clave de proveedores (tras pasar a Formato Título)
+REEMPLAZOS_NOMBRE = {"Mod.": "Serie", "Tap.": "Acabado"}
+
+def limpiar_nombres(nombres: pd.Series) -> pd.Series:
+    """Convierte MAYÚSCULAS GRITONAS en Formato Título y añade branding (columna entera)"""
+    vacio = nombres.isna() | (nombres == "") | (nombres == 0)
+    limpio = nombres.astype(str).str.title()
+    for original, reemplazo in REEMPLAZOS_NOMBRE.items():
+        limpio = limpio.str.replace(original, reemplazo, regex=False)
+    return limpio.mask(vacio, NOMBRE_POR_DEFECTO)
+
+def calcular_pvps(df: pd.DataFrame) -> pd.Series:
+    """Calcula precio final basado en puntos (precio proveedor) y tipo, para todo el catálogo"""
+    # 'price_supplier' is equivalent to 'Puntos'; vacíos o no numéricos -> 0
+    puntos = pd.to_numeric(df['price_supplier'], errors='coerce').fillna(0.0) if 'price_supplier' in df.columns \
+        else pd.Series(0.0, index=df.index)
+
     # 'Tipo Punto' logic - currently defaulting to General as we don't have this field in raw data yet
     # Could be extended to map from 'source' or other fields
-    tipo = row.get('type_point', 'General') 
-    
-    # Manejo de errores en datos
-    if pd.isna(puntos) or points_is_empty(puntos): return 0.0
-    
-    # Seleccionar multiplicador
-    factor = MULTIPLICADORES.get(tipo, MULTIPLICADORES['Default'])
-    
-    try:
-        precio_final = float(puntos) * factor
-        return round(precio_final, 2)
-    except:
-        return 0.0
-
-def points_is_empty(puntos):
-    return puntos == '' or puntos is None
+    if 'type_point' in df.columns:
+        factor = df['type_point'].map(MULTIPLICADORES).fillna(MULTIPLICADORES['Default'])
+    else:
+        factor = MULTIPLICADORES['General']
+
+    precio = puntos * factor
+    pvp = precio.round(2)
+    # np.round escala x100 y redondea: en los empates x.xx5 puede diferir un céntimo
+    # del round() de Python (exacto sobre el valor binario); solo esos van fila a fila
+    empate = ((precio * 100) % 1 - 0.5).abs() < 1e-6
+    if empate.any():
+        pvp[empate] = precio[empate].map(lambda x: round(x, 2))
+    return pvp
+
+def primera_imagen(imagenes: pd.Series) -> pd.Series:
+    """Primera URL de 'images' (lista o texto); '' si no hay"""
+    tipo = imagenes.map(type)
+    primera = imagenes.where(tipo == list).astype(object).str[0]
+    return imagenes.where(tipo == str, primera).fillna('')
 
 class AdquifyProcessor:
     def __init__(self, products_list):
@@ -49,9 +60,10 @@ class AdquifyProcessor:
         """
         self.df = pd.DataFrame(products_list)
         
-    def process(self):
+    def process(self, verbose: bool = True):
         """
-        Apply Adquify logic to the dataframe
+        Apply Adquify logic to the dataframe.
+        `verbose=False` skips the progress banner (request path, page-by-page exports).
         """
         if self.df.empty:
             return pd.DataFrame()
@@ -62,10 +74,11 @@ class AdquifyProcessor:
         if 'price_supplier' not in self.df.columns:
             self.df['price_supplier'] = 0.0
 
-        print(f"🔄 Processing {len(self.df)} items with Adquify Protocol...")
+        if verbose:
+            print(f"🔄 Processing {len(self.df)} items with Adquify Protocol...")
 
         # 1. Limpiar Nombre
-        self.df['Nombre_Comercial'] = self.df['name_original'].apply(limpiar_nombre)
+        self.df['Nombre_Comercial'] = limpiar_nombres(self.df['name_original'])
 
         # 2. Generar/Usar SKU
         # We prefer the existing 'sku_adquify' if it exists, otherwise we generate a fallback
@@ -73,15 +86,16 @@ class AdquifyProcessor:
             self.df['SKU_Adquify'] = self.df['sku_adquify']
         else:
             # Fallback to user's logic if needed (though our scrapers should provide this)
-            self.df['SKU_Adquify'] = self.df.apply(lambda row: f"ADQ-{str(row.get('id', 'UNKNOWN'))}", axis=1)
+            ids = self.df['id'].astype(str) if 'id' in self.df.columns else 'UNKNOWN'
+            self.df['SKU_Adquify'] = "ADQ-" + ids
 
         # 3. Calcular PVP
-        self.df['PVP_Adquify'] = self.df.apply(calcular_pvp, axis=1)
+        self.df['PVP_Adquify'] = calcular_pvps(self.df)
 
         # 4. Filter and Select Columns
         # Limpiar columnas irrelevantes para el cliente final
         # Map our internal columns to the output format expected
-        self.df['Imagen'] = self.df['images'].apply(lambda x: x[0] if isinstance(x, list) and len(x) > 0 else (x if isinstance(x, str) else ''))
+        self.df['Imagen'] = primera_imagen(self.df['images']) if 'images' in self.df.columns else ''
         
         # Dimensions (if available) - Create if not exist
         for col in ['Alto', 'Ancho', 'Fondo']:
@@ -11,6 +11,27 @@ class Settings(BaseSettings):
     # Database (Default to SQLite for immediate functionality, easy switch to Postgres)
     DATABASE_URL: str = f"sqlite:///{DATA_DIR}/adquify_core.db"
     
+    # Embedding storage: float32 (lossless), float16 or int8 (quantized)
+    EMBEDDING_STORAGE_DTYPE: str = "float32"
+    
+    # Query embedding cache (chat / WhatsApp / Telegram)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    QUERY_EMBEDDING_CACHE_PERSIST: bool = True
+    
+    # Chat: max seconds to wait for the PDF render alongside the LLM answer
+    # (the URL is returned anyway; the file appears when the render finishes)
+    CHAT_PDF_WAIT_SECONDS: float = 10.0
+    
+    # Vector search backend: "qdrant" (server or QDRANT_URL=:memory:) or
+    # "local" (NumPy index persisted under data/vector_index, no Qdrant process)
+    VECTOR_BACKEND: str = "qdrant"
+    LOCAL_VECTOR_INDEX_TYPE: str = "flat"  # "flat" (exact) or "ivf" (approximate)
+    LOCAL_VECTOR_IVF_NPROBE: int = 32
+    
+    # Vector Sync (incremental Qdrant updates driven by Product.updated_at)
+    VECTOR_SYNC_INTERVAL_MINUTES: int = 5
+    
     # Security / Suppliers
     SECRET_KEY: str = "supersecretkey"  # Change in prod!
 
@@ -5,35 +5,348 @@ Detecta productos duplicados usando SKU y similitud de embedding de imagen.
 """
 
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
 from sklearn.metrics.pairwise import cosine_similarity
 import json
+import re
+import sys
+import unicodedata
+import zlib
 from pathlib import Path
 
+try:
+    from core.ai.vector_codec import as_vector
+except ImportError:
+    # Ejecutado como script: añadir la raíz del proyecto al path
+    sys.path.append(str(Path(__file__).resolve().parents[2]))
+    from core.ai.vector_codec import as_vector
+
 # Umbral de similitud para considerar duplicado (0.95 = muy similar)
 SIMILARITY_THRESHOLD = 0.92
 
-def compute_cosine_similarity(embedding1: List[float], embedding2: List[float]) -> float:
-    """Calcula similitud coseno entre dos embeddings"""
-    if not embedding1 or not embedding2:
+def compute_cosine_similarity(embedding1, embedding2) -> float:
+    """Calcula similitud coseno entre dos embeddings (lista, array o bytes de Product.embedding_vector)"""
+    vec1 = as_vector(embedding1)
+    vec2 = as_vector(embedding2)
+    if vec1 is None or vec2 is None or not vec1.size or not vec2.size:
         return 0.0
     
-    vec1 = np.array(embedding1).reshape(1, -1)
-    vec2 = np.array(embedding2).reshape(1, -1)
+    vec1 = vec1.reshape(1, -1)
+    vec2 = vec2.reshape(1, -1)
     
     return cosine_similarity(vec1, vec2)[0][0]
 
-def is_duplicate_by_sku(new_sku: str, existing_skus: List[str]) -> bool:
-    """Verifica si el SKU ya existe"""
+# Memoria máxima para cada bloque de similitudes (float32) en el cálculo por lotes
+DEFAULT_MEMORY_BUDGET_MB = 256
+# Referencias por bloque de columnas (las filas del bloque se ajustan al presupuesto)
+REFERENCE_BLOCK = 8192
+
+
+def is_duplicate_by_sku(new_sku: str, existing_skus) -> bool:
+    """Verifica si el SKU ya existe (pasar un set para búsqueda O(1))"""
     return new_sku in existing_skus
 
+
+def build_embedding_matrix(embeddings: List) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apila los embeddings válidos en una matriz float32 con filas normalizadas (L2),
+    de modo que similitud coseno = producto escalar.
+
+    Returns:
+        (matrix [n_validos x dim], indices de `embeddings` a los que corresponde cada fila)
+    """
+    rows, index = [], []
+    dim = None
+    for i, emb in enumerate(embeddings):
+        vec = as_vector(emb) if emb is not None else None
+        if vec is None or not vec.size:
+            continue
+        if dim is None:
+            dim = vec.size
+        if vec.size != dim:
+            continue
+        rows.append(vec)
+        index.append(i)
+
+    if not rows:
+        return np.zeros((0, dim or 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    matrix = np.vstack(rows).astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix, np.asarray(index, dtype=np.int64)
+
+
+def _block_size(n_cols: int, memory_budget_mb: float) -> int:
+    """Filas por bloque para que un bloque [filas x n_cols] float32 quepa en el presupuesto"""
+    return max(1, int(memory_budget_mb * 1024 * 1024 // (4 * max(n_cols, 1))))
+
+
+def iter_similar_pairs(
+    queries: np.ndarray,
+    references: np.ndarray,
+    threshold: float = SIMILARITY_THRESHOLD,
+    memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+    upper_triangle: bool = False
+):
+    """
+    Recorre los pares (i, j, score) con score >= threshold, calculando
+    `queries @ references.T` por bloques acotados por `memory_budget_mb`.
+    Con `upper_triangle` (queries is references) solo se emiten pares i < j.
+    """
+    n_ref = references.shape[0]
+    if not queries.shape[0] or not n_ref:
+        return
+    col_block = min(n_ref, REFERENCE_BLOCK)
+    row_block = _block_size(col_block, memory_budget_mb)
+
+    for r0 in range(0, queries.shape[0], row_block):
+        q = queries[r0:r0 + row_block]
+        # En modo triángulo superior, las columnas anteriores a r0 ya se cubrieron
+        c_start = r0 if upper_triangle else 0
+        for c0 in range(c_start - c_start % col_block, n_ref, col_block):
+            sims = q @ references[c0:c0 + col_block].T
+            if upper_triangle:
+                rows = np.arange(r0, r0 + q.shape[0])[:, None]
+                cols = np.arange(c0, c0 + sims.shape[1])[None, :]
+                sims[cols <= rows] = -np.inf
+            ii, jj = np.nonzero(sims >= threshold)
+            for i, j in zip(ii, jj):
+                yield r0 + int(i), c0 + int(j), float(sims[i, j])
+
+
+def best_matches(
+    queries: np.ndarray,
+    references: np.ndarray,
+    memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Para cada fila de `queries`, el índice de la referencia más similar y su score
+    (-1 / -inf si no hay referencias). Cálculo por bloques.
+    """
+    n_q, n_ref = queries.shape[0], references.shape[0]
+    best_idx = np.full(n_q, -1, dtype=np.int64)
+    best_score = np.full(n_q, -np.inf, dtype=np.float32)
+    if not n_q or not n_ref:
+        return best_idx, best_score
+
+    col_block = min(n_ref, REFERENCE_BLOCK)
+    row_block = _block_size(col_block, memory_budget_mb)
+    for r0 in range(0, n_q, row_block):
+        q = queries[r0:r0 + row_block]
+        for c0 in range(0, n_ref, col_block):
+            sims = q @ references[c0:c0 + col_block].T
+            idx = np.argmax(sims, axis=1)
+            score = sims[np.arange(len(idx)), idx]
+            better = score > best_score[r0:r0 + len(idx)]
+            best_score[r0:r0 + len(idx)][better] = score[better]
+            best_idx[r0:r0 + len(idx)][better] = idx[better] + c0
+    return best_idx, best_score
+
+
+class UnionFind:
+    """Conjuntos disjuntos (path halving + unión por tamaño) para agrupar duplicados"""
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return int(x)
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+
+    def groups(self) -> List[List[int]]:
+        clusters = {}
+        for i in range(len(self.parent)):
+            clusters.setdefault(self.find(i), []).append(i)
+        return [members for members in clusters.values() if len(members) > 1]
+
+
+# ===== MinHash / LSH (pre-filtro de candidatos por texto) =====
+
+MINHASH_PERMUTATIONS = 128
+MINHASH_PRIME = (1 << 31) - 1
+SHINGLE_SIZE = 4
+
+
+def normalize_product_text(*parts: Optional[str]) -> str:
+    """Minúsculas, sin tildes ni signos, espacios colapsados"""
+    text = unicodedata.normalize("NFKD", " ".join(p for p in parts if p))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_SIZE) -> np.ndarray:
+    """Hashes (crc32) de los k-gramas de caracteres del texto normalizado"""
+    if not text:
+        return np.zeros(0, dtype=np.uint64)
+    if len(text) <= k:
+        grams = {text}
+    else:
+        grams = {text[i:i + k] for i in range(len(text) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """Firmas MinHash con permutaciones (a·x + b) mod p, vectorizadas por producto"""
+
+    def __init__(self, num_perm: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text) % np.uint64(MINHASH_PRIME)
+        if not hashes.size:
+            return np.full(self.num_perm, MINHASH_PRIME, dtype=np.uint32)
+        # (n_shingles x num_perm): cabe en uint64 porque a, x < 2^31
+        permuted = (np.outer(hashes, self.a) + self.b) % np.uint64(MINHASH_PRIME)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts: List[str], chunk_shingles: int = 200_000) -> np.ndarray:
+        """Firmas de muchos textos: shingles concatenados y mínimo por segmento (reduceat)"""
+        out = np.full((len(texts), self.num_perm), MINHASH_PRIME, dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # Agrupar textos hasta ~chunk_shingles shingles (acota la matriz permutada)
+            hashes, owners, total = [], [], 0
+            end = start
+            while end < len(texts) and (total < chunk_shingles or end == start):
+                h = shingle_hashes(texts[end])
+                if h.size:
+                    hashes.append(h)
+                    owners.append(end)
+                    total += h.size
+                end += 1
+            if hashes:
+                flat = np.concatenate(hashes) % np.uint64(MINHASH_PRIME)
+                permuted = (np.outer(flat, self.a) + self.b) % np.uint64(MINHASH_PRIME)
+                offsets = np.concatenate(([0], np.cumsum([h.size for h in hashes])[:-1]))
+                out[owners] = np.minimum.reduceat(permuted, offsets, axis=0).astype(np.uint32)
+            start = end
+        return out
+
+
+def lsh_bands_for(threshold: float, num_perm: int = MINHASH_PERMUTATIONS) -> Tuple[int, int]:
+    """(bandas, filas) con bandas*filas = num_perm cuyo umbral (1/b)^(1/r) queda más cerca de `threshold`"""
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    return min(options, key=lambda br: abs((1.0 / br[0]) ** (1.0 / br[1]) - threshold))
+
+
+class MinHashLSH:
+    """
+    Índice LSH por bandas: dos textos son candidatos si coinciden en alguna
+    banda completa de su firma. Con Jaccard >= threshold la probabilidad de
+    colisión es alta; textos distintos casi nunca se comparan.
+    """
+
+    def __init__(self, threshold: float = 0.5, num_perm: int = MINHASH_PERMUTATIONS, max_bucket: int = 200):
+        self.bands, self.rows = lsh_bands_for(threshold, num_perm)
+        self.max_bucket = max_bucket
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+
+    def _keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: int, signature: np.ndarray):
+        for band, bucket_key in self._keys(signature):
+            self._buckets[band].setdefault(bucket_key, []).append(key)
+
+    def query(self, signature: np.ndarray) -> Set[int]:
+        candidates = set()
+        for band, bucket_key in self._keys(signature):
+            candidates.update(self._buckets[band].get(bucket_key, ())[:self.max_bucket])
+        return candidates
+
+    def candidate_pairs(self) -> Set[Tuple[int, int]]:
+        """Pares (i, j), i < j, que comparten alguna banda (buckets enormes se recortan)"""
+        pairs = set()
+        for buckets in self._buckets:
+            for members in buckets.values():
+                members = members[:self.max_bucket]
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        a, b = members[x], members[y]
+                        pairs.add((a, b) if a < b else (b, a))
+        return pairs
+
+
+def product_text(product: dict) -> str:
+    return normalize_product_text(product.get('name'), product.get('description'))
+
+
+def minhash_candidate_pairs(products: List[dict], threshold: float = 0.5) -> Set[Tuple[int, int]]:
+    """Pares candidatos a duplicado por nombre + descripción (para find_duplicate_clusters)"""
+    hasher = MinHasher()
+    lsh = MinHashLSH(threshold)
+    for i, signature in enumerate(hasher.signatures([product_text(p) for p in products])):
+        lsh.add(i, signature)
+    return lsh.candidate_pairs()
+
+
+def find_duplicate_clusters(
+    products: List[dict],
+    threshold: float = SIMILARITY_THRESHOLD,
+    memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+    candidate_pairs=None
+) -> List[List[dict]]:
+    """
+    Agrupa productos duplicados de uno o varios catálogos: mismo `sku_supplier`
+    o similitud de embedding >= threshold (transitivo, union-find).
+    `candidate_pairs` (opcional) limita la comparación visual a esos pares (i, j).
+
+    Returns:
+        Lista de clusters (cada uno una lista de productos, tamaño >= 2)
+    """
+    uf = UnionFind(len(products))
+
+    # 1. SKU exacto: hash por sku_supplier
+    first_by_sku = {}
+    for i, p in enumerate(products):
+        sku = p.get('sku_supplier')
+        if sku:
+            if sku in first_by_sku:
+                uf.union(first_by_sku[sku], i)
+            else:
+                first_by_sku[sku] = i
+
+    # 2. Similitud visual por bloques (triángulo superior)
+    matrix, index = build_embedding_matrix([p.get('embedding') for p in products])
+    if candidate_pairs is None:
+        for i, j, _ in iter_similar_pairs(matrix, matrix, threshold, memory_budget_mb, upper_triangle=True):
+            uf.union(int(index[i]), int(index[j]))
+    else:
+        row_of = {int(orig): row for row, orig in enumerate(index)}
+        for a, b in candidate_pairs:
+            ra, rb = row_of.get(a), row_of.get(b)
+            if ra is not None and rb is not None and float(matrix[ra] @ matrix[rb]) >= threshold:
+                uf.union(a, b)
+
+    return [[products[i] for i in members] for members in uf.groups()]
+
+
 def find_visual_duplicates(
     new_embedding: List[float], 
     existing_embeddings: List[dict],
     threshold: float = SIMILARITY_THRESHOLD
 ) -> List[Tuple[str, float]]:
     """
-    Encuentra productos visualmente similares.
+    Encuentra productos visualmente similares (un único producto matriz-vector).
     
     Args:
         new_embedding: Embedding del nuevo producto
@@ -43,19 +356,14 @@ def find_visual_duplicates(
     Returns:
         Lista de (sku, score) de productos similares
     """
-    matches = []
-    
-    for existing in existing_embeddings:
-        sku = existing.get('sku')
-        emb = existing.get('embedding')
-        
-        if not emb:
-            continue
-        
-        score = compute_cosine_similarity(new_embedding, emb)
-        
-        if score >= threshold:
-            matches.append((sku, round(score, 4)))
+    query, _ = build_embedding_matrix([new_embedding])
+    matrix, index = build_embedding_matrix([e.get('embedding') for e in existing_embeddings])
+    if not query.shape[0] or not matrix.shape[0] or matrix.shape[1] != query.shape[1]:
+        return []
+
+    scores = matrix @ query[0]
+    hits = np.flatnonzero(scores >= threshold)
+    matches = [(existing_embeddings[index[h]].get('sku'), round(float(scores[h]), 4)) for h in hits]
     
     # Ordenar por similitud descendente
     matches.sort(key=lambda x: x[1], reverse=True)
@@ -67,6 +375,7 @@ def check_product_duplicate(
 ) -> dict:
     """
     Verifica si un producto es duplicado.
+    Para lotes usar deduplicate_batch (construye el índice una sola vez).
     
     Returns:
         {
@@ -76,38 +385,10 @@ def check_product_duplicate(
             "similarity_score": float | None
         }
     """
-    new_sku = product.get('sku_supplier')
-    new_embedding = product.get('embedding')
-    
-    # 1. Check SKU exacto
-    existing_skus = [p.get('sku_supplier') for p in existing_products if p.get('sku_supplier')]
-    if is_duplicate_by_sku(new_sku, existing_skus):
-        return {
-            "is_duplicate": True,
-            "match_type": "sku",
-            "matched_sku": new_sku,
-            "similarity_score": 1.0
-        }
-    
-    # 2. Check visual si hay embedding
-    if new_embedding:
-        existing_embeddings = [
-            {"sku": p.get('sku_adquify'), "embedding": p.get('embedding')}
-            for p in existing_products
-            if p.get('embedding')
-        ]
-        
-        visual_matches = find_visual_duplicates(new_embedding, existing_embeddings)
-        
-        if visual_matches:
-            best_match = visual_matches[0]
-            return {
-                "is_duplicate": True,
-                "match_type": "visual",
-                "matched_sku": best_match[0],
-                "similarity_score": best_match[1]
-            }
-    
+    return deduplicate_batch([dict(product)], existing_products)["results"][0]
+
+
+def _not_duplicate() -> dict:
     return {
         "is_duplicate": False,
         "match_type": None,
@@ -115,17 +396,55 @@ def check_product_duplicate(
         "similarity_score": None
     }
 
+
+def _best_matches_lsh(
+    query_products: List[dict],
+    queries: np.ndarray,
+    existing_products: List[dict],
+    references: np.ndarray,
+    r_index: np.ndarray,
+    text_threshold: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """best_matches restringido a los candidatos LSH de cada consulta"""
+    hasher = MinHasher()
+    lsh = MinHashLSH(text_threshold)
+    row_of = {int(orig): row for row, orig in enumerate(r_index)}
+    for orig, signature in zip(r_index, hasher.signatures([product_text(existing_products[i]) for i in r_index])):
+        lsh.add(row_of[int(orig)], signature)
+
+    best_idx = np.full(len(queries), -1, dtype=np.int64)
+    best_score = np.full(len(queries), -np.inf, dtype=np.float32)
+    for row, signature in enumerate(hasher.signatures([product_text(p) for p in query_products])):
+        candidates = np.fromiter(lsh.query(signature), dtype=np.int64)
+        if candidates.size:
+            scores = references[candidates] @ queries[row]
+            top = int(np.argmax(scores))
+            best_idx[row], best_score[row] = candidates[top], scores[top]
+    return best_idx, best_score
+
+
 def deduplicate_batch(
     new_products: List[dict],
-    existing_products: List[dict]
+    existing_products: List[dict],
+    threshold: float = SIMILARITY_THRESHOLD,
+    memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+    text_prefilter: bool = False,
+    text_threshold: float = 0.5
 ) -> dict:
     """
     Procesa un lote de productos y clasifica en nuevos vs duplicados.
+    SKUs en un set (O(1) por producto) y similitud visual con un único
+    cálculo matricial por bloques sobre los embeddings normalizados.
+
+    Con `text_prefilter`, un índice MinHash/LSH sobre nombre + descripción
+    (Jaccard de shingles >= ~text_threshold) elige los candidatos y solo
+    se comparan los embeddings de esos pares (coste subcuadrático).
     
     Returns:
         {
             "new": List[dict],           # Productos nuevos
             "duplicates": List[dict],    # Productos duplicados (para actualizar)
+            "results": List[dict],       # Resultado por producto (mismo orden que new_products)
             "stats": {
                 "total": int,
                 "new_count": int,
@@ -135,34 +454,62 @@ def deduplicate_batch(
             }
         }
     """
+    results = [_not_duplicate() for _ in new_products]
+
+    # 1. Check SKU exacto
+    existing_skus = {p.get('sku_supplier') for p in existing_products if p.get('sku_supplier')}
+    pending = []
+    for i, product in enumerate(new_products):
+        sku = product.get('sku_supplier')
+        if sku and is_duplicate_by_sku(sku, existing_skus):
+            results[i] = {
+                "is_duplicate": True,
+                "match_type": "sku",
+                "matched_sku": sku,
+                "similarity_score": 1.0
+            }
+        else:
+            pending.append(i)
+
+    # 2. Check visual: mejor coincidencia de cada producto pendiente
+    queries, q_index = build_embedding_matrix([new_products[i].get('embedding') for i in pending])
+    references, r_index = build_embedding_matrix([p.get('embedding') for p in existing_products])
+    if queries.shape[0] and references.shape[0] and queries.shape[1] == references.shape[1]:
+        if text_prefilter:
+            best_idx, best_score = _best_matches_lsh(
+                [new_products[pending[i]] for i in q_index], queries,
+                existing_products, references, r_index, text_threshold
+            )
+        else:
+            best_idx, best_score = best_matches(queries, references, memory_budget_mb)
+        for row in np.flatnonzero(best_score >= threshold):
+            match = existing_products[r_index[best_idx[row]]]
+            results[pending[q_index[row]]] = {
+                "is_duplicate": True,
+                "match_type": "visual",
+                "matched_sku": match.get('sku_adquify'),
+                "similarity_score": round(float(best_score[row]), 4)
+            }
+
     new_list = []
     duplicates_list = []
-    sku_matches = 0
-    visual_matches = 0
-    
-    for product in new_products:
-        result = check_product_duplicate(product, existing_products)
-        
+    for product, result in zip(new_products, results):
         if result['is_duplicate']:
             product['_duplicate_info'] = result
             duplicates_list.append(product)
-            
-            if result['match_type'] == 'sku':
-                sku_matches += 1
-            elif result['match_type'] == 'visual':
-                visual_matches += 1
         else:
             new_list.append(product)
     
     return {
         "new": new_list,
         "duplicates": duplicates_list,
+        "results": results,
         "stats": {
             "total": len(new_products),
             "new_count": len(new_list),
             "duplicate_count": len(duplicates_list),
-            "sku_matches": sku_matches,
-            "visual_matches": visual_matches
+            "sku_matches": sum(1 for r in results if r['match_type'] == 'sku'),
+            "visual_matches": sum(1 for r in results if r['match_type'] == 'visual')
         }
     }
 
@@ -0,0 +1,64 @@
+"""
+Adquify Engine - Data Migrations
+================================
+Migraciones de datos que no se resuelven con un simple ALTER TABLE.
+Idempotentes: se pueden ejecutar en cada arranque.
+"""
+
+import json
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from core.config import settings
+from core.ai.vector_codec import encode_vector
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_embeddings_to_binary(engine: Engine, table: str = "products", batch_size: int = 500) -> int:
+    """
+    Convierte `embedding_json` (lista JSON de floats) a `embedding_vector` (binario)
+    y vacía la columna JSON. Usa SQL directo para no tocar `updated_at`.
+    Devuelve el número de filas convertidas.
+    """
+    converted = 0
+    last_id = 0
+    dtype = settings.EMBEDDING_STORAGE_DTYPE
+
+    with engine.connect() as conn:
+        while True:
+            rows = conn.execute(
+                text(
+                    f"SELECT id, embedding_json FROM {table} "
+                    "WHERE embedding_json IS NOT NULL AND embedding_vector IS NULL AND id > :last_id "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": batch_size}
+            ).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row_id, raw in rows:
+                last_id = row_id
+                try:
+                    vector = json.loads(raw) if isinstance(raw, str) else raw
+                except ValueError:
+                    vector = None
+                # JSON 'null' or garbage: just clear it
+                updates.append({
+                    "id": row_id,
+                    "vec": encode_vector(vector, dtype) if vector else None
+                })
+
+            conn.execute(
+                text(f"UPDATE {table} SET embedding_vector = :vec, embedding_json = NULL WHERE id = :id"),
+                updates
+            )
+            conn.commit()
+            converted += sum(1 for u in updates if u["vec"] is not None)
+
+    if converted:
+        logger.info(f"Migrated {converted} embeddings in '{table}' to binary ({dtype}).")
+    return converted
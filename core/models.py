@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, JSON, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, JSON, DateTime, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from core.database import Base
+from core.config import settings
+from core.ai.vector_codec import encode_vector, decode_vector
 
 
 class User(Base):
@@ -142,23 +144,73 @@ class Product(Base):
     status = Column(String, default="draft") # draft, reviewed, published
     
     # Embedding Cache (for fast re-indexing)
+    # Binary vector (see core.ai.vector_codec); use the `embedding` accessor.
+    embedding_vector = Column(LargeBinary, nullable=True)
+    # Legacy JSON float list, migrated to embedding_vector on startup
     embedding_json = Column(JSON, nullable=True)
+    # Hash of the text that produced the embedding (re-embed only when it changes)
+    embedding_text_hash = Column(String(40), nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     images = relationship("ProductImage", back_populates="product")
 
+    @property
+    def embedding(self):
+        """Embedding as a NumPy array (zero-copy view for float32), or None"""
+        return decode_vector(self.embedding_vector)
+
+    @embedding.setter
+    def embedding(self, vector):
+        self.embedding_vector = None if vector is None else encode_vector(vector, settings.EMBEDDING_STORAGE_DTYPE)
+
+    __table_args__ = (
+        # Keyset pagination for the catalog listing (status + cursor column)
+        Index("ix_products_status_id", "status", "id"),
+        Index("ix_products_status_updated_id", "status", "updated_at", "id"),
+        # Incremental vector sync watermark scans
+        Index("ix_products_updated_id", "updated_at", "id"),
+    )
+
 class ProductImage(Base):
     __tablename__ = "product_images"
     
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     product = relationship("Product", back_populates="images")
     
     url = Column(String)
     local_path = Column(String, nullable=True)
     
-    # Vector Embedding for Visual Search (stored as JSON/Array for SQLite loop compat)
+    # Vector Embedding for Visual Search (binary, see core.ai.vector_codec)
     # in Postgres/pgvector this would be Vector(512)
-    embedding_json = Column(JSON, nullable=True) 
+    embedding_vector = Column(LargeBinary, nullable=True)
+    embedding_json = Column(JSON, nullable=True)  # Legacy, migrated on startup
+
+    # Perceptual fingerprint (pHash + dHash + color histogram, see core.ai.image_hashing);
+    # empty bytes = image unreadable, NULL = not computed yet
+    fingerprint = Column(LargeBinary, nullable=True)
+
+    # Download state (services.image_fetcher): sha256 of the stored file and
+    # validators for conditional GET; fetched_at without local_path = last attempt failed
+    content_hash = Column(String(64), nullable=True, index=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    fetched_at = Column(DateTime, nullable=True)
+
+    @property
+    def embedding(self):
+        return decode_vector(self.embedding_vector)
+
+    @embedding.setter
+    def embedding(self, vector):
+        self.embedding_vector = None if vector is None else encode_vector(vector, settings.EMBEDDING_STORAGE_DTYPE)
+
+class SyncState(Base):
+    """Persistent key/value state for background jobs (e.g. sync watermarks)"""
+    __tablename__ = "sync_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
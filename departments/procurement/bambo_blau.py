@@ -13,6 +13,10 @@ from datetime import datetime
 from pathlib import Path
 import pandas as pd
 
+import sys
+sys.path.append(str(Path(__file__).parent.parent.parent))  # Engine root, for standalone runs
+from departments.procurement.base import write_scrape_output
+
 # Paths
 ENGINE_ROOT = Path(__file__).parent.parent.parent
 DATA_RAW = ENGINE_ROOT / "data" / "raw"
@@ -180,19 +184,16 @@ def extract_from_excel() -> list:
 
 def save_raw_json(products: list):
     """Guarda los productos extraídos en JSON temporal"""
-    DATA_RAW.mkdir(parents=True, exist_ok=True)
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_path = DATA_RAW / f"bambo_blau_{timestamp}.json"
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump({
-            'supplier': SUPPLIER_CODE,
-            'extracted_at': datetime.utcnow().isoformat(),
-            'total_products': len(products),
-            'products': products
-        }, f, ensure_ascii=False, indent=2)
-    
+
+    write_scrape_output(output_path, {
+        'supplier': SUPPLIER_CODE,
+        'extracted_at': datetime.utcnow().isoformat(),
+        'total_products': len(products),
+        'products': products
+    }, SUPPLIER_CODE, products)
+
     print(f"💾 Guardado en: {output_path}")
     return output_path
 
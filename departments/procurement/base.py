@@ -12,6 +12,22 @@ from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
 import pandas as pd
 
+try:
+    from services.snapshot_store import save_snapshot
+except ImportError:  # Standalone run outside the engine root: JSON only
+    save_snapshot = None
+
+
+def write_scrape_output(path: Path, payload: Dict, supplier: str, products: List[Dict]) -> Path:
+    """Volcado JSON de una ejecución de scraper + su snapshot columnar (si el motor está disponible)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    if save_snapshot:
+        save_snapshot(supplier, products)
+    return path
+
+
 class BaseScraper(ABC):
     """Clase base abstracta para scrapers de proveedores"""
     
@@ -65,15 +81,14 @@ class BaseScraper(ABC):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = self.data_raw / f"{self.supplier_code.lower()}_{timestamp}.json"
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'supplier': self.supplier_code,
-                'supplier_name': self.supplier_name,
-                'extracted_at': datetime.utcnow().isoformat(),
-                'total_products': len(products),
-                'products': products
-            }, f, ensure_ascii=False, indent=2)
-        
+        write_scrape_output(output_path, {
+            'supplier': self.supplier_code,
+            'supplier_name': self.supplier_name,
+            'extracted_at': datetime.utcnow().isoformat(),
+            'total_products': len(products),
+            'products': products
+        }, self.supplier_code, products)
+
         print(f"💾 Guardado: {output_path}")
         return output_path
     
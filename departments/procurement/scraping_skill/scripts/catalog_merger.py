@@ -1,13 +1,22 @@
 import pandas as pd
 import json
 import random
+import uuid
+from typing import Dict
 from sqlalchemy.orm import Session
 from core.database import SessionLocal, engine
 from core.models import Product, Supplier, ProductImage, Base
+from core.bulk_upsert import new_skus, prefetch, upsert_products
 
 # Ensure tables exist
 Base.metadata.create_all(bind=engine)
 
+
+def _clean(value):
+    """NaN cells -> None (JSON-safe)"""
+    return None if pd.isna(value) else value
+
+
 class CatalogMergerAgent:
     """
     The 'Internal Catalog Agent'.
@@ -25,67 +34,67 @@ class CatalogMergerAgent:
             print(f"❌ Error reading CSV: {e}")
             return
 
-        count_new = 0
-        count_updated = 0
-
-        for _, row in df.iterrows():
-            # 1. Resolve Supplier
-            supplier_name = row.get('supplier', 'Unknown')
-            supplier = self._get_or_create_supplier(supplier_name)
-
-            # 2. Normalize Data
-            name = row.get('name', 'Producto Sin Nombre')
-            price_cost = float(row.get('price', 0.0))
-            
-            # Adquify Logic: Selling Price = Cost * Margin
-            price_sale = price_cost * supplier.margin_multiplier
-            
-            # Dimensions/Specs into JSON
-            specs = {
-                "materials": row.get('materials'),
-                "dimensions": row.get('dimensions'),
-                "source": "Agente Scraper V1"
-            }
-
-            # 3. Upsert Product (Check by Name + Supplier for now, ideally SKU)
-            product = self.db.query(Product).filter(
-                Product.name == name, 
-                Product.supplier_id == supplier.id
-            ).first()
-
-            if product:
-                # Update
-                product.cost_price = price_cost
-                product.selling_price = price_sale
-                product.raw_data = specs # Storing specs in raw_data
-                count_updated += 1
-            else:
-                # Create
-                product = Product(
-                    sku_adquify=f"ADQ-{supplier.code}-{random.randint(10000, 99999)}",
-                    sku_supplier=f"SUP-{random.randint(1000, 9999)}", # In real scraper we'd have this
-                    supplier_id=supplier.id,
-                    name=name,
-                    category="Mobiliario", # Inferred or mapped
-                    cost_price=price_cost,
-                    selling_price=price_sale,
-                    description=f"{row.get('materials', '')} - {row.get('dimensions', '')}",
-                    status="published",
-                    raw_data=specs # Storing specs in raw_data
-                )
-                self.db.add(product)
-                self.db.commit()
-                self.db.refresh(product)
-                
-                # Add Image
-                if pd.notna(row.get('image')):
-                    img = ProductImage(product_id=product.id, url=row.get('image'))
-                    self.db.add(img)
-                
-                count_new += 1
-        
-        self.db.commit()
-        print(f"✅ Misión Cumplida: {count_new} nuevos, {count_updated} actualizados.")
+        # 1. Resolve Suppliers (once per distinct name, not per row)
+        df['supplier'] = df['supplier'].fillna('Unknown') if 'supplier' in df.columns else 'Unknown'
+        suppliers = {name: self._get_or_create_supplier(name) for name in df['supplier'].unique()}
+
+        rows, images = [], {}
+        # (supplier_id, name) -> sku_adquify, for existing and just-created products
+        known: Dict[tuple, str] = {}
+
+        for supplier_name, group in df.groupby('supplier', sort=False):
+            supplier = suppliers[supplier_name]
+            records = group.to_dict('records')
+
+            # 2. Existing products of this supplier (Name + Supplier for now, ideally SKU): one IN query per chunk
+            names = [row.get('name', 'Producto Sin Nombre') for row in records]
+            existing = prefetch(self.db, Product.name, names, Product.sku_adquify,
+                                where=Product.supplier_id == supplier.id)
+            known.update({(supplier.id, name): row.sku_adquify for name, row in existing.items()})
+
+            missing = {name for name in names if (supplier.id, name) not in known}
+            fresh = iter(new_skus(self.db, len(missing), lambda: f"ADQ-{supplier.code}-{uuid.uuid4().hex[:8].upper()}"))
+
+            for row in records:
+                # 3. Normalize Data
+                name = row.get('name', 'Producto Sin Nombre')
+                price_cost = float(row.get('price', 0.0))
+
+                # Adquify Logic: Selling Price = Cost * Margin
+                price_sale = price_cost * supplier.margin_multiplier
+
+                # Dimensions/Specs into JSON
+                specs = {
+                    "materials": _clean(row.get('materials')),
+                    "dimensions": _clean(row.get('dimensions')),
+                    "source": "Agente Scraper V1"
+                }
+
+                sku = known.get((supplier.id, name))
+                if sku is None:
+                    sku = next(fresh)
+                    known[(supplier.id, name)] = sku
+                    if pd.notna(row.get('image')):
+                        images[sku] = [row.get('image')]
+
+                rows.append({
+                    "sku_adquify": sku,
+                    "sku_supplier": f"SUP-{random.randint(1000, 9999)}",  # In real scraper we'd have this
+                    "supplier_id": supplier.id,
+                    "name": name,
+                    "category": "Mobiliario",  # Inferred or mapped
+                    "cost_price": price_cost,
+                    "selling_price": price_sale,
+                    "description": f"{row.get('materials', '')} - {row.get('dimensions', '')}",
+                    "status": "published",
+                    "raw_data": specs  # Storing specs in raw_data
+                })
+
+        # 4. Bulk upsert: existing products only get prices and specs refreshed
+        result = upsert_products(self.db, rows, update_columns=["cost_price", "selling_price", "raw_data"], images=images)
+        for error in result.errors:
+            print(f"⚠️ {error}")
+        print(f"✅ Misión Cumplida: {result.created} nuevos, {result.updated} actualizados.")
 
     def _get_or_create_supplier(self, name: str) -> Supplier:
         # Normalize name
@@ -11,6 +11,10 @@ from pathlib import Path
 from typing import Optional, List, Dict
 import hashlib
 
+import sys
+sys.path.append(str(Path(__file__).parent.parent.parent))  # Engine root, for standalone runs
+from departments.procurement.base import write_scrape_output
+
 # Paths
 ENGINE_ROOT = Path(__file__).parent.parent.parent
 CONFIG_PATH = ENGINE_ROOT / "config" / "suppliers_credentials.json"
@@ -162,19 +166,17 @@ async def scrape_with_login(supplier_code: str, max_pages: int = 5, dry_run: boo
     
     # Guardar resultados
     if products and not dry_run:
-        DATA_RAW.mkdir(parents=True, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_path = DATA_RAW / f"{supplier_code.lower()}_web_{timestamp}.json"
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'supplier': supplier_code,
-                'source': 'web_scraping',
-                'extracted_at': datetime.utcnow().isoformat(),
-                'total_products': len(products),
-                'products': products
-            }, f, ensure_ascii=False, indent=2)
-        
+
+        write_scrape_output(output_path, {
+            'supplier': supplier_code,
+            'source': 'web_scraping',
+            'extracted_at': datetime.utcnow().isoformat(),
+            'total_products': len(products),
+            'products': products
+        }, supplier_code, products)
+
         print(f"💾 Guardado en: {output_path}")
     
     return products
@@ -19,6 +19,10 @@ import requests
 from datetime import datetime
 from pathlib import Path
 
+import sys
+sys.path.append(str(Path(__file__).parent.parent.parent))  # Engine root, for standalone runs
+from departments.procurement.base import write_scrape_output
+
 # Configuración
 ENGINE_ROOT = Path(__file__).parent.parent.parent
 CONFIG_PATH = ENGINE_ROOT / "config" / "suppliers_credentials.json"
@@ -516,8 +520,7 @@ def save_json(supplier, products):
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     path = DATA_RAW / f"{supplier.lower()}_final_{ts}.json"
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump({'supplier': supplier, 'date': ts, 'products': products}, f, indent=2)
+    write_scrape_output(path, {'supplier': supplier, 'date': ts, 'products': products}, supplier, products)
     print(f"💾 Saved: {path.name}")
 
 if __name__ == "__main__":
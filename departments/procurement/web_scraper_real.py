@@ -13,6 +13,10 @@ from pathlib import Path
 from typing import Optional, List, Dict, Set
 import random
 
+import sys
+sys.path.append(str(Path(__file__).parent.parent.parent))  # Engine root, for standalone runs
+from departments.procurement.base import write_scrape_output
+
 ENGINE_ROOT = Path(__file__).parent.parent.parent
 CONFIG_PATH = ENGINE_ROOT / "config" / "suppliers_credentials.json"
 DATA_RAW = ENGINE_ROOT / "data" / "raw"
@@ -446,18 +450,16 @@ async def scrape_supplier(supplier_code: str, max_pages: int, status_callback: d
                 raise Exception(f"No implementado: {supplier_code}")
             
             if products:
-                DATA_RAW.mkdir(parents=True, exist_ok=True)
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 output_path = DATA_RAW / f"{supplier_code.lower()}_full_{timestamp}.json"
-                
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump({
-                        'supplier': supplier_code,
-                        'source': 'web_scraping_full',
-                        'extracted_at': datetime.utcnow().isoformat(),
-                        'total_products': len(products),
-                        'products': products
-                    }, f, ensure_ascii=False, indent=2)
+
+                write_scrape_output(output_path, {
+                    'supplier': supplier_code,
+                    'source': 'web_scraping_full',
+                    'extracted_at': datetime.utcnow().isoformat(),
+                    'total_products': len(products),
+                    'products': products
+                }, supplier_code, products)
                 
                 print(f"\n{'='*60}")
                 print(f"💾 GUARDADO: {output_path}")
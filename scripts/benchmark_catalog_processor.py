@@ -0,0 +1,96 @@
+"""
+Benchmark: row-wise (df.apply) vs vectorized AdquifyProcessor on a synthetic catalog.
+Also checks that both produce the same export.
+
+    python scripts/benchmark_catalog_processor.py --products 100000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.catalog_processor import MULTIPLICADORES, AdquifyProcessor
+
+
+def make_catalog(n_products: int):
+    rng = random.Random(42)
+    names = ["SILLA {}", "MESA {}", "SOFA {}", "MOD. OSLO {}", "TAP. LINO {}", "lampara {}", "Aparador {}", "", None]
+    prices = [None, "", "abc", 0, 12.5, "99.9", 150, 1234.56]
+    return [
+        {
+            "id": i,
+            "name": name.format(i) if (name := rng.choice(names)) else name,
+            "price_supplier": rng.choice(prices) if rng.random() < 0.2 else round(rng.uniform(5, 900), 2),
+            "type_point": rng.choice(["General", "O", "X", None]),
+            "images": rng.choice([[f"https://cdn.example/{i}.jpg", "x"], [], f"https://cdn.example/{i}.png", None]),
+            "product_url": f"https://shop.example/p/{i}",
+        }
+        for i in range(n_products)
+    ]
+
+
+# --- Previous row-at-a-time implementation (reference) ---
+
+def _limpiar_nombre(texto):
+    if pd.isna(texto) or not texto: return "Producto Adquify Sin Nombre"
+    texto = str(texto).title()
+    return texto.replace("Mod.", "Serie").replace("Tap.", "Acabado")
+
+
+def _calcular_pvp(row):
+    puntos = row.get('price_supplier', 0)
+    tipo = row.get('type_point', 'General')
+    if pd.isna(puntos) or puntos == '' or puntos is None: return 0.0
+    factor = MULTIPLICADORES.get(tipo, MULTIPLICADORES['Default'])
+    try:
+        return round(float(puntos) * factor, 2)
+    except:
+        return 0.0
+
+
+def process_rowwise(products):
+    df = pd.DataFrame(products)
+    df['name_original'] = df['name']
+    df['Nombre_Comercial'] = df['name_original'].apply(_limpiar_nombre)
+    df['SKU_Adquify'] = df.apply(lambda row: f"ADQ-{str(row.get('id', 'UNKNOWN'))}", axis=1)
+    df['PVP_Adquify'] = df.apply(_calcular_pvp, axis=1)
+    df['Imagen'] = df['images'].apply(lambda x: x[0] if isinstance(x, list) and len(x) > 0 else (x if isinstance(x, str) else ''))
+    for col in ['Alto', 'Ancho', 'Fondo']:
+        df[col] = ''
+    cols = ['SKU_Adquify', 'Nombre_Comercial', 'PVP_Adquify', 'Alto', 'Ancho', 'Fondo', 'Imagen', 'product_url']
+    out = df[cols].copy()
+    return out[out['PVP_Adquify'] > 0]
+
+
+def timed(label: str, fn, products, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(products)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label} {len(products)} products in {best:.3f}s")
+    return result, best
+
+
+def run(n_products: int, repeat: int):
+    products = make_catalog(n_products)
+    expected, baseline = timed("Row-wise:  ", process_rowwise, products, repeat)
+    result, vectorized = timed("Vectorized:", lambda p: AdquifyProcessor(p).process(verbose=False), products, repeat)
+
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), result.reset_index(drop=True), check_dtype=False)
+    print(f"Same output ({len(result)} rows). Speedup: x{baseline / vectorized:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    args = parser.parse_args()
+    run(args.products, args.repeat)
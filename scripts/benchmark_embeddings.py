@@ -0,0 +1,67 @@
+"""
+Benchmark: per-product vs batched embedding generation (offline).
+Uses FakeEmbeddingHandler with a simulated API latency, so no Gemini key is needed.
+
+    python scripts/benchmark_embeddings.py --products 2000 --latency 0.05
+"""
+
+import asyncio
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from core.database import Base
+from core.models import Product
+from core.ai.embeddings import FakeEmbeddingHandler
+from services.sync_service import generate_missing_embeddings
+from services.embedding_pipeline import product_embedding_text
+
+
+def make_session(n_products: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        Product(sku_adquify=f"ADQ-BENCH-{i}", name=f"Producto {i}", description="Silla de comedor",
+                category="Sillas", selling_price=float(i))
+        for i in range(n_products)
+    ])
+    db.commit()
+    return db
+
+
+async def run(n_products: int, latency: float, batch_size: int, concurrency: int):
+    # 1. Baseline: one call per product
+    db = make_session(n_products)
+    embedder = FakeEmbeddingHandler(latency=latency)
+    start = time.perf_counter()
+    for p in db.query(Product).all():
+        p.embedding = await embedder.get_embedding_async(product_embedding_text(p))
+    db.commit()
+    baseline = time.perf_counter() - start
+    print(f"Sequential: {n_products} products in {baseline:.2f}s ({embedder.calls} API calls)")
+
+    # 2. Batched pipeline
+    db = make_session(n_products)
+    embedder = FakeEmbeddingHandler(latency=latency)
+    start = time.perf_counter()
+    await generate_missing_embeddings(db, embedder=embedder, batch_size=batch_size, concurrency=concurrency)
+    batched = time.perf_counter() - start
+    print(f"Batched:    {n_products} products in {batched:.2f}s ({embedder.calls} API calls)")
+    print(f"Speedup: x{baseline / batched:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per API call")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.latency, args.batch_size, args.concurrency))
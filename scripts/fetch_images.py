@@ -0,0 +1,127 @@
+"""
+Downloads pending product images (ProductImage.url) into the content-addressed
+store under assets/images and builds their WebP thumbnails. Safe to interrupt
+and re-run: only images without a local copy are fetched.
+
+    python scripts/fetch_images.py                      # pending images
+    python scripts/fetch_images.py --revalidate-days 7  # also conditional GET of old copies
+    python scripts/fetch_images.py --benchmark 500      # local HTTP stand-in, no DB
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.image_fetcher import FetchJob, FetchStats, ImageFetcher
+
+
+def start_stand_in(images: int, latency_ms: float, distinct: int):
+    """Local image server with ETag/Last-Modified support; returns (server, base_url)"""
+    from PIL import Image
+
+    bodies = []
+    for i in range(distinct):
+        buf = io.BytesIO()
+        Image.new("RGB", (800, 800), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)).save(buf, "JPEG", quality=85)
+        bodies.append(buf.getvalue())
+    etags = [f'"{hashlib.md5(b).hexdigest()}"' for b in bodies]
+    last_modified = formatdate(time.time() - 86400, usegmt=True)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            try:
+                n = int(self.path.rsplit("/", 1)[-1].split(".")[0]) % images
+            except ValueError:
+                self.send_error(404)
+                return
+            time.sleep(latency_ms / 1000)
+            body, etag = bodies[n % distinct], etags[n % distinct]
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def benchmark(images: int, latency_ms: float, connections: int, rate: float, per_host: int):
+    server, base_url = start_stand_in(images, latency_ms, distinct=max(1, images * 4 // 5))
+    root = Path(tempfile.mkdtemp(prefix="adquify_fetch_"))
+    fetcher = ImageFetcher(root=root, max_connections=connections,
+                           requests_per_second_per_host=rate, max_per_host=per_host)
+    jobs = [FetchJob(i, f"{base_url}/img/{i}.jpg") for i in range(images)]
+
+    try:
+        for label, batch in (("cold", jobs), ("revalidate", None)):
+            if batch is None:
+                batch = [FetchJob(r.image_id, jobs[r.image_id].url, r.etag, r.last_modified, r.content_hash)
+                         for r in results]
+            stats = FetchStats()
+            start = time.perf_counter()
+            results = await fetcher.fetch_all(batch)
+            stats.seconds = time.perf_counter() - start
+            for r in results:
+                stats.add(r)
+            print(f"⏱️  {label:<10} {stats.as_dict()}")
+        print(f"📁 Store: {root} ({sum(1 for _ in root.glob('??/??/*'))} files, "
+              f"{sum(1 for _ in root.glob('thumbs/*/*.webp'))} thumbnails)")
+    finally:
+        server.shutdown()
+
+
+def main(args):
+    if args.benchmark:
+        asyncio.run(benchmark(args.benchmark, args.latency_ms, args.connections, args.rate, args.per_host))
+        return
+
+    from core.database import SessionLocal
+    fetcher = ImageFetcher(max_connections=args.connections, requests_per_second_per_host=args.rate,
+                           max_per_host=args.per_host)
+    db = SessionLocal()
+    try:
+        revalidate = timedelta(days=args.revalidate_days) if args.revalidate_days else None
+        stats = asyncio.run(fetcher.run(db, revalidate_after=revalidate, limit=args.limit))
+        print(f"✅ {stats.as_dict()}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=32, help="Max concurrent downloads")
+    parser.add_argument("--rate", type=float, default=8.0, help="Requests per second per host")
+    parser.add_argument("--per-host", type=int, default=6, help="Max concurrent requests per host")
+    parser.add_argument("--revalidate-days", type=float, default=0, help="Revalidate copies older than N days")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after N images")
+    parser.add_argument("--benchmark", type=int, default=0, help="Benchmark N images against a local stand-in")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Stand-in response latency")
+    main(parser.parse_args())
@@ -0,0 +1,43 @@
+"""
+Computes perceptual fingerprints for downloaded product images and lists
+products that share the same photo across suppliers.
+
+    python scripts/fingerprint_images.py --max-distance 6 --min-color 0.8
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.database import SessionLocal
+from services.image_fingerprints import compute_missing_fingerprints, find_duplicate_images, load_image_index
+
+
+def main(max_distance: int, min_color: float, workers: int):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        computed = compute_missing_fingerprints(db, workers=workers or None)
+        print(f"🖼️  {computed} new fingerprints in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        index = load_image_index(db)
+        groups = find_duplicate_images(db, max_distance, min_color, index=index)
+        print(f"🔍 {len(index)} images indexed, {len(groups)} duplicate groups in {time.perf_counter() - start:.1f}s")
+        for group in groups[:50]:
+            print(f"   {', '.join(group['skus'])}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-distance", type=int, default=6, help="Max pHash Hamming distance")
+    parser.add_argument("--min-color", type=float, default=0.8, help="Min color histogram similarity")
+    parser.add_argument("--workers", type=int, default=0, help="Processes (0 = CPU count)")
+    args = parser.parse_args()
+    main(args.max_distance, args.min_color, args.workers)
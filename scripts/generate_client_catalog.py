@@ -7,7 +7,8 @@ from datetime import datetime
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.catalog_processor import AdquifyProcessor
+from core.catalog_processor import COLUMNAS_ENTRADA, AdquifyProcessor
+from services.snapshot_store import CATALOG_SUPPLIER, PYARROW_AVAILABLE, latest_snapshot, read_products
 
 ENGINE_ROOT = Path(__file__).parent.parent
 DATA_RAW = ENGINE_ROOT / "data" / "raw"
@@ -26,20 +27,25 @@ def get_latest_catalog():
 def main():
     print("🚀 Iniciando Generación de Catálogo Interactivo Adquify...")
     
-    # 1. Load Data
-    catalog_file = get_latest_catalog()
-    if not catalog_file:
-        print("❌ Error: No se encontró ningún archivo de catálogo unificado (CATALOG_FULL_*.json)")
-        return
-    
-    print(f"📂 Cargando catálogo: {catalog_file.name}")
-    try:
-        with open(catalog_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            products = data.get('products', [])
-    except Exception as e:
-        print(f"❌ Error leyendo archivo: {e}")
-        return
+    # 1. Load Data: consolidated snapshot (only the processor columns) or the latest JSON
+    snapshot = latest_snapshot(CATALOG_SUPPLIER) if PYARROW_AVAILABLE else None
+    if snapshot:
+        print(f"📂 Cargando snapshot: {snapshot.file} ({snapshot.rows} productos)")
+        products = read_products(snapshot, columns=COLUMNAS_ENTRADA)
+    else:
+        catalog_file = get_latest_catalog()
+        if not catalog_file:
+            print("❌ Error: No se encontró ningún archivo de catálogo unificado (CATALOG_FULL_*.json)")
+            return
+
+        print(f"📂 Cargando catálogo: {catalog_file.name}")
+        try:
+            with open(catalog_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                products = data.get('products', [])
+        except Exception as e:
+            print(f"❌ Error leyendo archivo: {e}")
+            return
 
     if not products:
         print("⚠️ El catálogo está vacío.")
@@ -11,14 +11,14 @@ from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from core.models import Product
 from core.ai.embeddings import GeminiEmbeddingHandler
-from core.ai.vector_store import QdrantHandler
+from core.ai.vector_store import create_vector_store
 
 async def index_catalog():
     print("🚀 Starting Catalog Indexing (Gemini)...")
     
     db: Session = SessionLocal()
     embedder = GeminiEmbeddingHandler()
-    vector_store = QdrantHandler()
+    vector_store = create_vector_store()
     
     # Ensure collection with force_recreate if needed (logic in handler handles dimension check)
     vector_store.ensure_collection()
@@ -60,6 +60,7 @@ async def index_catalog():
             except Exception as e:
                 print(f"❌ Error indexing {product.sku_adquify}: {e}")
 
+        vector_store.flush()
         print(f"✅ Indexing Complete! Total indexed: {count}")
         
     finally:
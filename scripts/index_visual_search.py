@@ -0,0 +1,41 @@
+"""
+Computes CPU visual features for downloaded product images and syncs the
+local visual search index used by POST /search/image.
+
+    python scripts/index_visual_search.py          # incremental
+    python scripts/index_visual_search.py --full   # rewrite every point (payload refresh)
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.database import SessionLocal
+from services.visual_search import get_visual_search
+
+
+def main(full: bool, workers: int):
+    service = get_visual_search()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        computed = service.compute_missing_features(db, workers=workers or None)
+        print(f"🖼️  {computed} images processed in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        written = service.build_index(db, full=full)
+        print(f"✅ {written} points written, {service.store.count()} images indexed in {time.perf_counter() - start:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Rewrite every point, not only new images")
+    parser.add_argument("--workers", type=int, default=0, help="Processes (0 = CPU count)")
+    args = parser.parse_args()
+    main(args.full, args.workers)
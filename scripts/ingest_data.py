@@ -6,16 +6,24 @@ import glob
 import time
 from pathlib import Path
 from typing import List, Dict
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from dotenv import load_dotenv
 
 # Load Env
 load_dotenv()
 
+from sqlalchemy import update
+from core.config import settings
 from core.database import SessionLocal, engine, Base
+from core.migrations import migrate_embeddings_to_binary
 from core.models import Product, ProductImage, Supplier
+from core.bulk_upsert import upsert_products
+from services.feed_reader import batched, iter_json_items
+from core.ai.vector_codec import encode_vector
 from core.ai.embeddings import GeminiEmbeddingHandler
-from core.ai.vector_store import QdrantHandler
+from core.ai.vector_store import QdrantHandler, create_vector_store
+from services.embedding_pipeline import product_embedding_text, text_hash
+from services.sync_service import build_point_payload
 
 # Setup Logging
 import logging
@@ -24,6 +32,7 @@ logger = logging.getLogger("ETL_Ingest")
 
 BATCH_SIZE = 10
 SLEEP_BETWEEN_BATCHES = 2  # Seconds to respect Gemini Rate Limits
+STREAM_CHUNK_SIZE = 1000  # Products read from the JSON dump per upsert
 
 def get_db():
     db = SessionLocal()
@@ -34,95 +43,85 @@ def get_db():
 
 async def ingest_file(file_path: str, db: Session, embedder: GeminiEmbeddingHandler, vector_store: QdrantHandler):
     logger.info(f"Processing File: {file_path}")
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        logger.error(f"Failed to read JSON {file_path}: {e}")
-        return
 
-    products_list = data.get("products", [])
-    if not products_list:
+    # Stream the product list (flat memory on large dumps): upsert + embed per chunk
+    total = 0
+    chunks = batched(iter_json_items(file_path), STREAM_CHUNK_SIZE)
+    while True:
+        try:
+            products_list = next(chunks, None)
+        except Exception as e:
+            logger.error(f"Failed to read JSON {file_path}: {e}")
+            return
+        if products_list is None:
+            break
+        total += len(products_list)
+        logger.info(f"Read {total} products so far...")
+        await ingest_products(products_list, db, embedder, vector_store)
+
+    if not total:
         logger.warning(f"No products found in {file_path}")
-        return
 
-    logger.info(f"Found {len(products_list)} products. Starting ingestion...")
-
-    # Process in batches
-    for i in range(0, len(products_list), BATCH_SIZE):
-        batch = products_list[i : i + BATCH_SIZE]
-        logger.info(f"Processing batch {i} to {i+len(batch)}...")
-
-        for p_data in batch:
+async def ingest_products(products_list: List[Dict], db: Session, embedder: GeminiEmbeddingHandler, vector_store: QdrantHandler):
+    # 1. SQL Ingestion: one bulk upsert per chunk of the file
+    rows, images, by_sku = [], {}, {}
+    for p_data in products_list:
+        sku = p_data.get("sku_adquify") or p_data.get("sku_supplier")
+        if not sku:
+            continue
+        rows.append({
+            "sku_adquify": sku,
+            "sku_supplier": p_data.get("sku_supplier"),
+            "name": p_data.get("name"),
+            "description": p_data.get("description"),
+            "selling_price": p_data.get("price") or 0.0,
+            "supplier_id": 1,  # Default supplier ID
+            "raw_data": p_data,
+            "category": p_data.get('category')
+        })
+        images[sku] = p_data.get("images") or []
+        by_sku[sku] = p_data
+
+    result = upsert_products(db, rows, update_columns=["name", "selling_price", "description"], images=images)
+    logger.info(f"SQL upsert: {result.created} created, {result.updated} updated, {len(result.errors)} failed chunks")
+
+    # 2. Embedding & Vector Store, in batches (Gemini rate limits).
+    # Same text, hash and payload as services.sync_service, so these points
+    # carry supplier/stock for the search filters and the incremental sync
+    # doesn't re-embed them.
+    ids = [result.ids[sku] for sku in by_sku if sku in result.ids]
+    for i in range(0, len(ids), BATCH_SIZE):
+        batch = ids[i : i + BATCH_SIZE]
+        logger.info(f"Embedding batch {i} to {i+len(batch)}...")
+        products = (
+            db.query(Product).options(joinedload(Product.supplier))
+            .filter(Product.id.in_(batch)).order_by(Product.id).all()
+        )
+
+        updates, points = [], []
+        for p in products:
             try:
-                # 1. SQL Ingestion
-                sku = p_data.get("sku_adquify") or p_data.get("sku_supplier")
-                if not sku:
-                    continue
-
-                # Check if exists
-                existing_product = db.query(Product).filter(Product.sku_adquify == sku).first()
-                
-                if existing_product:
-                    # Update
-                    product = existing_product
-                    product.name = p_data.get("name")
-                    product.selling_price = p_data.get("price") or 0.0
-                    product.description = p_data.get("description")
-                    product.stock_actual = 100 # Mock stock
-                    product.status_stock = "green"
-                    # Update other fields as needed
-                else:
-                    # Create
-                    product = Product(
-                        sku_adquify=sku,
-                        sku_supplier=p_data.get("sku_supplier"),
-                        name=p_data.get("name"),
-                        description=p_data.get("description"),
-                        selling_price=p_data.get("price") or 0.0,
-                        stock_actual=100, # Mock stock
-                        status_stock="green",
-                        supplier_id=1, # Default supplier ID
-                        raw_data=p_data,
-                        category=p_data.get('category')
-                    )
-                    db.add(product)
-                    db.flush() # Get ID
-
-                # Images
-                if not existing_product and p_data.get("images"):
-                    for img_url in p_data.get("images"):
-                        db.add(ProductImage(product_id=product.id, url=img_url))
-
-                db.commit()
-
-                # 2. Embedding & Vector Store
-                # Construct text for embedding
-                text_to_embed = f"{product.name}. {product.description} Category: {p_data.get('category','')}"
-                
+                text_to_embed = product_embedding_text(p)
+
                 # Generate Embedding
                 vector = await embedder.get_embedding_async(text_to_embed)
-                
                 if vector:
-                    # Save to DB for caching
-                    product.embedding_json = vector
-                    db.commit() # Save embedding
-                    
-                    # Upsert to Qdrant
-                    payload = {
-                        "id": sku,
-                        "name": product.name,
-                        "price": product.selling_price,
-                        "category": p_data.get("category"),
-                        "url": p_data.get("url")
-                    }
-                    await vector_store.upsert_point(sku, vector, payload)
-                
+                    updates.append({
+                        "id": p.id,
+                        "embedding_vector": encode_vector(vector, settings.EMBEDDING_STORAGE_DTYPE),
+                        "embedding_text_hash": text_hash(text_to_embed),
+                        "updated_at": p.updated_at  # Cache write, not a product change
+                    })
+                    points.append((p.sku_adquify, vector, build_point_payload(p)))
             except Exception as e:
-                logger.error(f"Error processing product {p_data.get('sku_adquify')}: {e}")
-                db.rollback()
-        
+                logger.error(f"Error embedding product {p.sku_adquify}: {e}")
+
+        if updates:
+            # Save to DB for caching (bulk UPDATE by primary key, one commit per batch)
+            db.execute(update(Product), updates)
+            db.commit()
+            await vector_store.upsert_points(points)
+
         # Rate Limit Sleep
         await asyncio.sleep(SLEEP_BETWEEN_BATCHES)
 
@@ -150,7 +149,15 @@ async def main():
                 if "embedding_json" not in columns:
                     logger.info("Adding 'embedding_json' column...")
                     conn.execute(text("ALTER TABLE products ADD COLUMN embedding_json TEXT"))
+                # Same columns as api.main.run_migrations (binary embeddings + incremental sync hash)
+                if "embedding_vector" not in columns:
+                    logger.info("Adding 'embedding_vector' column...")
+                    conn.execute(text("ALTER TABLE products ADD COLUMN embedding_vector BLOB"))
+                if "embedding_text_hash" not in columns:
+                    logger.info("Adding 'embedding_text_hash' column...")
+                    conn.execute(text("ALTER TABLE products ADD COLUMN embedding_text_hash VARCHAR(40)"))
                 conn.commit()
+            migrate_embeddings_to_binary(engine, "products")
     except Exception as e:
         logger.error(f"Migration failed: {e}")
 
@@ -160,7 +167,7 @@ async def main():
     
     # Init AI Handlers
     embedder = GeminiEmbeddingHandler()
-    vector_store = QdrantHandler()
+    vector_store = create_vector_store()
     vector_store.ensure_collection() # Ensure collection exists
 
     # Find Files
@@ -175,6 +182,7 @@ async def main():
     for file_path in files:
         await ingest_file(str(file_path), db, embedder, vector_store)
 
+    vector_store.flush()
     logger.info("Ingestion Complete!")
     db.close()
 
@@ -0,0 +1,99 @@
+"""
+Convierte los volcados JSON de data/raw en snapshots Parquet (services.snapshot_store).
+
+    python scripts/snapshot_raw.py                       # todos los *.json de data/raw
+    python scripts/snapshot_raw.py data/raw/kave_final_20260117_215135_TEST.json
+    python scripts/snapshot_raw.py --benchmark --columns sku_adquify price
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.snapshot_store import (CATALOG_SUPPLIER, PYARROW_AVAILABLE, latest_snapshot, read_table,
+                                     write_snapshot)
+
+DATA_RAW = Path(__file__).parent.parent / "data" / "raw"
+# File name suffixes of the scraper writers (kave_final_<ts>.json, sklum_full_<ts>.json...)
+RUN_SUFFIXES = ("_final", "_full", "_web")
+
+
+def supplier_from_filename(path: Path) -> str:
+    match = re.match(r"(.+?)_\d{8}_\d{6}", path.stem)
+    name = (match.group(1) if match else path.stem).lower()
+    if name == CATALOG_SUPPLIER:
+        return name
+    for suffix in RUN_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def extracted_at_of(data: dict, path: Path) -> str:
+    if data.get("extracted_at"):
+        return data["extracted_at"]
+    if data.get("date"):
+        try:
+            return datetime.strptime(data["date"], "%Y%m%d_%H%M%S").isoformat()
+        except ValueError:
+            pass
+    return datetime.utcfromtimestamp(path.stat().st_mtime).isoformat()
+
+
+def snapshot_file(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"products": data}
+    products = data.get("products") or []
+    if not products:
+        print(f"⚠️ {path.name}: sin productos")
+        return None
+    supplier = supplier_from_filename(path) if path.stem.upper().startswith("CATALOG_FULL") \
+        else (data.get("supplier") or supplier_from_filename(path))
+    info = write_snapshot(supplier, products, extracted_at_of(data, path))
+    print(f"🗂️ {path.name} -> {info.supplier}/{info.file}: {info.rows} filas, "
+          f"{path.stat().st_size / 1024:.0f} KB JSON -> {info.bytes / 1024:.0f} KB")
+    return info
+
+
+def benchmark(path: Path, info, columns):
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        products = json.load(f).get("products", [])
+    values = [[p.get(c) for c in columns] for p in products]
+    full = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = read_table(info, columns)
+    selective = time.perf_counter() - start
+    print(f"   json.load + {columns}: {full * 1000:.1f}ms ({len(values)} filas) | "
+          f"snapshot: {selective * 1000:.1f}ms ({table.num_rows} filas)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="JSON dumps (default: data/raw/*.json)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare a column read against json.load")
+    parser.add_argument("--columns", nargs="+", default=["sku_adquify", "price"])
+    args = parser.parse_args()
+
+    if not PYARROW_AVAILABLE:
+        print("❌ pyarrow no está instalado (pip install pyarrow)")
+        sys.exit(1)
+
+    for file_path in [Path(f) for f in args.files] or sorted(DATA_RAW.glob("*.json")):
+        try:
+            info = snapshot_file(file_path)
+        except Exception as e:
+            print(f"❌ {file_path.name}: {e}")
+            continue
+        if info and args.benchmark:
+            benchmark(file_path, info, args.columns)
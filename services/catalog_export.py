@@ -0,0 +1,121 @@
+"""
+Adquify Catalog Export
+======================
+Exportación del catálogo cliente (lógica de AdquifyProcessor) en streaming:
+
+- Solo productos publicados (como el listado del catálogo).
+- Lee la BD por páginas con un cursor de servidor (`stream_results` +
+  `yield_per`), solo con las columnas necesarias (sin raw_data ni embeddings).
+- Cada página pasa por AdquifyProcessor y se emite enseguida: CSV como
+  generador de texto (StreamingResponse) o filas de un libro openpyxl en
+  modo write-only. La memoria no depende del tamaño del catálogo.
+
+    for chunk in iter_catalog_csv(db):
+        ...
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.catalog_processor import AdquifyProcessor
+from core.models import Product, ProductImage
+
+EXPORT_PAGE_SIZE = 2000
+# Same scope as the catalog listing: drafts and unreviewed products stay out of client exports
+EXPORT_STATUS = "published"
+EXPORT_COLUMNS = ['SKU_Adquify', 'Nombre_Comercial', 'PVP_Adquify', 'Alto', 'Ancho', 'Fondo', 'Imagen']
+CSV_FILENAME = "Catalogo_Maestro_Adquify_Interactive_LATEST.csv"
+XLSX_FILENAME = "Catalogo_Maestro_Adquify_Interactive_LATEST.xlsx"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Dimension keys in metadata_json (see services.ingestion) -> export column
+DIMENSION_KEYS = {'Alto': ('alto', 'height'), 'Ancho': ('ancho', 'width'), 'Fondo': ('fondo', 'depth')}
+
+
+def _first_images(db: Session, product_ids: List[int]) -> Dict[int, str]:
+    """Primera imagen de cada producto de la página (una query IN)"""
+    first: Dict[int, str] = {}
+    query = (
+        select(ProductImage.product_id, ProductImage.url)
+        .where(ProductImage.product_id.in_(product_ids))
+        .order_by(ProductImage.id)
+    )
+    for product_id, url in db.execute(query):
+        first.setdefault(product_id, url)
+    return first
+
+
+def _dimension(metadata: Optional[dict], keys) -> str:
+    if isinstance(metadata, dict):
+        for key in keys:
+            if metadata.get(key) not in (None, ''):
+                return metadata[key]
+    return ''
+
+
+def iter_export_pages(db: Session, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[List[Dict]]:
+    """Productos publicados en el formato de entrada de AdquifyProcessor, página a página"""
+    # status + id order uses ix_products_status_id
+    query = (
+        select(Product.id, Product.sku_adquify, Product.name, Product.cost_price, Product.metadata_json)
+        .where(Product.status == EXPORT_STATUS)
+        .order_by(Product.id)
+        .execution_options(stream_results=True, yield_per=page_size)
+    )
+    for page in db.execute(query).partitions():
+        images = _first_images(db, [row.id for row in page])
+        yield [
+            {
+                'id': row.id,
+                'sku_adquify': row.sku_adquify,
+                'name_original': row.name,
+                'price_supplier': row.cost_price,  # 'Puntos' = precio coste del proveedor
+                'images': images.get(row.id, ''),
+                **{col: _dimension(row.metadata_json, keys) for col, keys in DIMENSION_KEYS.items()},
+            }
+            for row in page
+        ]
+
+
+def iter_catalog_frames(db: Session, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[pd.DataFrame]:
+    """Catálogo cliente procesado, un DataFrame (con EXPORT_COLUMNS) por página"""
+    for page in iter_export_pages(db, page_size):
+        frame = AdquifyProcessor(page).process(verbose=False)
+        if not frame.empty:
+            yield frame.reindex(columns=EXPORT_COLUMNS)
+
+
+def iter_catalog_csv(db: Session, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    """CSV del catálogo cliente por trozos (BOM para que Excel lo abra en UTF-8)"""
+    yield "\ufeff" + pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(index=False)
+    for frame in iter_catalog_frames(db, page_size):
+        yield frame.to_csv(index=False, header=False)
+
+
+def write_catalog_csv(db: Session, path, page_size: int = EXPORT_PAGE_SIZE) -> Path:
+    path = Path(path)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in iter_catalog_csv(db, page_size):
+            f.write(chunk)
+    return path
+
+
+def write_catalog_xlsx(db: Session, path, page_size: int = EXPORT_PAGE_SIZE) -> Path:
+    """Libro Excel en modo write-only: las filas van a disco según se añaden"""
+    from openpyxl import Workbook
+
+    path = Path(path)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Catalogo")
+    sheet.append(EXPORT_COLUMNS)
+    for frame in iter_catalog_frames(db, page_size):
+        frame = frame.astype(object).where(frame.notna(), None)
+        for row in frame.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+    return path
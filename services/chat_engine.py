@@ -1,157 +1,452 @@
+import json
+import time
 import asyncio
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+import logging
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, List, Dict, Optional
+import numpy as np
+from sqlalchemy.orm import Session, selectinload
+from core.config import settings
+from core.database import SessionLocal
 from core.models import Product, Supplier
 from core.ai.embeddings import GeminiEmbeddingHandler
-from core.ai.vector_store import QdrantHandler
+from core.ai.embedding_cache import get_query_embedding_cache
+from core.ai.vector_store import create_vector_store
+from core.ai.search_filters import SearchFilters
+from services.search_index import (
+    search_product_skus, exact_code_skus, reciprocal_rank_fusion, apply_search_filters
+)
+from services.query_filters import get_query_filter_extractor
+from services.response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
 
 class AdquifyChatEngine:
     """
     Real RAG engine for Adquify Catalog.
-    Uses Google Gemini Embeddings + Qdrant Vector Search.
+    Uses Google Gemini Embeddings + Qdrant Vector Search, fused with a
+    lexical (FTS5/BM25) ranking.
+
+    Designed to live for the whole process (see get_chat_engine): clients are
+    injected and warmed once, and each call to process_query receives its own
+    DB session (or opens one if none is given).
     """
     
-    def __init__(self, db: Session, vector_store=None):
+    def __init__(self, db: Optional[Session] = None, vector_store=None, response_cache=None, embedder=None):
+        # Legacy default session for callers that build one engine per request
         self.db = db
-        self.embedder = GeminiEmbeddingHandler()
-        self.vector_store = vector_store if vector_store else QdrantHandler()
-        # Ensure collection exists on startup (async in practice, but fire and forget here or sync check)
-        self.vector_store.ensure_collection()
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+        self.embedder = embedder if embedder is not None else GeminiEmbeddingHandler(cache=get_query_embedding_cache())
+        self.vector_store = vector_store if vector_store else create_vector_store()
+        self.filter_extractor = get_query_filter_extractor()
+        # Hybrid retrieval: candidates fetched per leg, products kept after fusion
+        self.candidates = 20
+        self.top_k = 5
+        self._llm = None
+        self._collection_ready = False
 
-    async def process_query(self, query: str) -> Dict:
+    def _ensure_collection(self):
+        """Qdrant collection check (get_collections + get_collection), once per engine"""
+        if not self._collection_ready:
+            self.vector_store.ensure_collection()
+            self._collection_ready = True
+
+    def _get_llm(self):
+        if self._llm is None:
+            import google.generativeai as genai
+            self._llm = genai.GenerativeModel('models/gemini-1.5-flash')
+        return self._llm
+
+    async def warm_up(self):
+        """Startup hook: check the collection and build the LLM/PDF clients up front"""
+        await asyncio.to_thread(self._ensure_collection)
+        try:
+            self._get_llm()
+            from services.pdf_generator import get_pdf_service
+            get_pdf_service()  # ReportLab import cost + render pool
+        except Exception as e:
+            logger.warning(f"Chat engine warm-up incomplete: {e}")
+
+    async def process_query(self, query: str, db: Optional[Session] = None) -> Dict:
         """
         Processes the user query using Semantic Search (RAG).
+        `db` is the per-request session; if omitted, the engine's legacy session
+        is used or a short-lived one is opened for this query.
+        """
+        db = db or self.db
+        if db is None:
+            db = SessionLocal()
+            try:
+                return await self._process_query(query, db)
+            finally:
+                db.close()
+        return await self._process_query(query, db)
+
+    async def stream_query(self, query: str, db: Optional[Session] = None) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of process_query. Yields events:
+          {"event": "products", "products": [...]}  as soon as retrieval finishes
+          {"event": "token", "text": "..."}         LLM answer chunks
+          {"event": "done", "answer", "pdf_url", "timings"} once the PDF is ready
+        The PDF renders in the background while tokens stream.
+        """
+        own_session = (db or self.db) is None
+        db = db or self.db or SessionLocal()
+        try:
+            timings = StageTimer()
+            retrieval = await self._retrieve(query, db, timings)
+            products, is_fallback, cached = retrieval.products, retrieval.is_fallback, retrieval.cached
+
+            if cached:
+                yield {"event": "products", "products": cached["products"], "cached": True}
+                yield {"event": "token", "text": cached["answer"]}
+                yield {"event": "done", "answer": cached["answer"], "pdf_url": cached["pdf_url"],
+                       "cached": True, "timings": timings.finish()}
+                return
+
+            if not products:
+                response = await self._format_response(products, query, is_fallback=is_fallback, timings=timings)
+                yield {"event": "products", "products": []}
+                yield {"event": "token", "text": response["answer"]}
+                yield {"event": "done", "answer": response["answer"], "pdf_url": None, "timings": response["timings"]}
+                return
+
+            cards = [serialize_chat_product(p) for p in products]
+            yield {"event": "products", "products": cards, "fallback": is_fallback}
+
+            pdf_task = asyncio.create_task(self._render_pdf(products, query, timings))
+            parts = []
+            try:
+                async for text in self._stream_answer(products, query, is_fallback, timings):
+                    parts.append(text)
+                    yield {"event": "token", "text": text}
+                pdf_url = await pdf_task
+            finally:
+                if not pdf_task.done():
+                    pdf_task.cancel()
+
+            response = {"answer": "".join(parts), "pdf_url": pdf_url, "products": cards, "timings": timings.finish()}
+            self._store_response(query, retrieval, response)
+            yield {"event": "done", "answer": response["answer"], "pdf_url": pdf_url, "timings": response["timings"]}
+        finally:
+            if own_session:
+                db.close()
+
+    async def _process_query(self, query: str, db: Session) -> Dict:
+        timings = StageTimer()
+        retrieval = await self._retrieve(query, db, timings)
+        if retrieval.cached:
+            retrieval.cached["timings"] = timings.finish()
+            return retrieval.cached
+
+        response = await self._format_response(
+            retrieval.products, query, is_fallback=retrieval.is_fallback, timings=timings
+        )
+        self._store_response(query, retrieval, response)
+        return response
+
+    def _store_response(self, query: str, retrieval: "Retrieval", response: Dict):
+        """Only semantic (non-fallback) answers are cached, keyed by vector + filters"""
+        if not retrieval.is_fallback and retrieval.query_vector is not None:
+            self.response_cache.store(
+                query, retrieval.query_vector, response, retrieval.products, context=retrieval.cache_context
+            )
+
+    async def _retrieve(self, query: str, db: Session, timings: "StageTimer") -> "Retrieval":
+        """
+        Hybrid retrieval in one pass:
+          filters -> embedding -> cache -> [lexical (FTS5/BM25 + exact codes) || filtered vector search]
+          -> reciprocal rank fusion -> SQL hydration of the fused top-k.
+        The lexical leg runs in a worker thread with its own session while the
+        vector leg is awaited (after the response cache lookup).
         """
+        self._ensure_collection()
+
+        # 0. Structured filters mentioned in the query (price, supplier, category, stock)
+        with timings("filters"):
+            filters = self.filter_extractor.extract(query, db)
+        if filters.is_empty():
+            filters = None
+
         # 1. Generate Embedding
+        query_vector = None
         try:
-            query_vector = await self.embedder.get_embedding_async(query)
+            with timings("embedding"):
+                query_vector = await self.embedder.get_query_embedding_async(query)
         except Exception as e:
-            # Fallback if OpenAI down
-            return await self._fallback_sql_search(query)
+            # Embeddings down: lexical ranking only
+            logger.warning(f"Query embedding failed, lexical retrieval only: {e}")
+
+        # 1b. Semantic response cache (near-identical question answered recently, same filters)
+        if query_vector is not None:
+            with timings("cache_lookup"):
+                cached = self.response_cache.lookup(query_vector, db, context=filters_key(filters))
+            if cached:
+                return Retrieval([], False, query_vector, cached, filters)
+
+        # Started after the cache lookup: a cache hit doesn't pay for the lexical query
+        lexical_task = asyncio.create_task(asyncio.to_thread(
+            self._lexical_search, db.get_bind(), query, filters, timings
+        ))
+
+        # 2. Vector Search (Qdrant), filtered inside the index
+        vector_skus = []
+        if query_vector is not None:
+            try:
+                with timings("vector_search"):
+                    search_results = await self.vector_store.search(
+                        query_vector, limit=self.candidates, filters=filters
+                    )
+                vector_skus = [res.payload.get('id') for res in search_results if res.payload]
+            except Exception as e:
+                logger.error(f"⚠️ Vector Search Failed (Qdrant Error): {e}")
+                # Do NOT crash. The lexical ranking still answers.
+
+        exact_skus, lexical_skus = await lexical_task
 
-        # 2. Vector Search (Qdrant)
-        search_results = []
+        # 3. Fuse (exact catalog-code matches always lead) and hydrate
+        with timings("hydration"):
+            fused = reciprocal_rank_fusion([vector_skus, lexical_skus])
+            fused = list(dict.fromkeys(exact_skus + fused))[:self.top_k]
+            products = self._hydrate(db, fused, filters) if fused else []
+
+        # Without semantic hits this is a keyword answer (not cached, flagged in the text)
+        return Retrieval(products, not vector_skus, query_vector, filters=filters)
+
+    def _lexical_search(self, bind, query: str, filters: Optional[SearchFilters], timings: "StageTimer"):
+        """(exact code matches, BM25 ranking) on a dedicated session (runs in a worker thread)"""
         try:
-            search_results = await self.vector_store.search(query_vector, limit=5)
+            with timings("lexical_search"), Session(bind=bind) as session:
+                return (
+                    exact_code_skus(session, query, limit=self.top_k, filters=filters),
+                    search_product_skus(session, query, limit=self.candidates, filters=filters)
+                )
         except Exception as e:
-            import logging
-            logging.error(f"⚠️ Vector Search Failed (Qdrant Error): {e}")
-            # Do NOT crash. Just proceed to empty results which triggers fallback.
-            search_results = []
-        
-        # 3. Process Results
-        products = []
-        if search_results:
-            # Extract Product IDs from payloads
-            product_ids = [res.payload.get('id') for res in search_results if res.payload]
-            
-            # Fetch full objects from SQL to ensure freshness (stock, price)
-            products = self.db.query(Product).filter(Product.sku_adquify.in_(product_ids)).all()
-            
-            # Maintain order from vector search
-            # Create a map for sorting
-            product_map = {p.sku_adquify: p for p in products}
-            ordered_products = []
-            for pid in product_ids:
-                if pid in product_map:
-                    ordered_products.append(product_map[pid])
-            products = ordered_products
+            logger.error(f"Lexical search failed: {e}")
+            return [], []
 
-        if not products:
-             return await self._fallback_sql_search(query)
+    def _hydrate(self, db: Session, skus: List[str], filters: Optional[SearchFilters] = None) -> List[Product]:
+        """
+        Loads the fused products from SQL (fresh stock/price), in fused order.
+        Images are loaded in the same round trip so serialization causes no lazy loads.
+        """
+        # Fetch full objects from SQL to ensure freshness (stock, price)
+        # (filters re-checked against SQL: the index payload may lag behind price/stock)
+        products = (
+            apply_search_filters(db.query(Product), filters)
+            .options(selectinload(Product.images))
+            .filter(Product.sku_adquify.in_(skus))
+            .all()
+        )
+
+        # Maintain fused order
+        product_map = {p.sku_adquify: p for p in products}
+        return [product_map[sku] for sku in skus if sku in product_map]
 
-        return await self._format_response(products, query)
+    async def _render_pdf(self, products: List[Product], query: str, timings: "StageTimer") -> Optional[str]:
+        """Submits the PDF render and waits for it (bounded) alongside the LLM call"""
+        with timings("pdf"):
+            try:
+                from services.pdf_generator import get_pdf_service
+                ticket = get_pdf_service().submit(products, query)
+                if ticket is None:
+                    return None
+                # Still rendering after the timeout: keep the URL, it becomes valid when it finishes
+                return await ticket.wait(timeout=settings.CHAT_PDF_WAIT_SECONDS, pending_url=True)
+            except Exception as e:
+                print(f"PDF Generation Error: {e}")
+                return None
 
-    async def _fallback_sql_search(self, query: str) -> Dict:
+    @staticmethod
+    def _build_prompt(products: List[Product], query: str) -> str:
+        # Context builder
+        products_context = "\n".join([
+            f"- {p.name} (Precio: €{p.selling_price or 'Consultar'}, Stock: {getattr(p, 'stock_quantity', 'Consultar')})"
+            for p in products
+        ])
+
+        user_message = f"""Consulta del cliente: "{query}"
+
+Productos encontrados en catálogo:
+{products_context}
+
+Genera una respuesta breve, recomendando estos productos. Menciona que se adjunta un PDF con detalles."""
+        return f"{SYSTEM_PROMPT}\n\n{user_message}"
+
+    @staticmethod
+    def _fallback_answer(products: List[Product], query: str, is_fallback: bool) -> str:
+        prefix = "🔍 (Búsqueda por Similitud)" if not is_fallback else "⚠️ (Búsqueda por Palabras Clave)"
+        return f"{prefix} He encontrado {len(products)} opciones para '{query}'. Te las he adjuntado en el PDF."
+
+    async def _generate_answer(self, products: List[Product], query: str, is_fallback: bool, timings: "StageTimer") -> str:
+        """Gemini answer for the matched products (with a template fallback)"""
+        with timings("llm"):
+            try:
+                model = self._get_llm()
+                # Run blocking generation in thread
+                response = await asyncio.to_thread(model.generate_content, self._build_prompt(products, query))
+
+                # Defensive check
+                if response and hasattr(response, 'text') and response.text:
+                    return response.text
+
+                # Fallback if text generation is blocked or empty
+                print("Gemini response was empty or blocked.")
+                # DO NOT RAISE, just fallback
+                return f"He encontrado {len(products)} opciones para tu búsqueda. Te adjunto el PDF con los detalles."
+
+            except Exception as e:
+                print(f"Gemini Generation Error: {e}")
+                return self._fallback_answer(products, query, is_fallback)
+
+    async def _stream_answer(self, products: List[Product], query: str, is_fallback: bool,
+                             timings: "StageTimer") -> AsyncIterator[str]:
         """
-        Legacy SQL search as backup.
+        Gemini answer as it is generated. The blocking stream is consumed in a
+        worker thread and handed to the event loop chunk by chunk.
         """
-        # Simple keyword matching
-        products = self.db.query(Product).filter(
-            or_(
-                Product.name.ilike(f"%{query}%"),
-                Product.description.ilike(f"%{query}%")
-            )
-        ).limit(5).all()
-        return await self._format_response(products, query, is_fallback=True)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
 
-    async def _format_response(self, products: List[Product], query: str, is_fallback: bool = False) -> Dict:
+        def produce():
+            try:
+                for chunk in self._get_llm().generate_content(self._build_prompt(products, query), stream=True):
+                    text = getattr(chunk, "text", "")
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        with timings("llm"):
+            producer = loop.run_in_executor(None, produce)
+            emitted = False
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"Gemini streaming error: {item}")
+                    if not emitted:
+                        yield self._fallback_answer(products, query, is_fallback)
+                        emitted = True
+                    break
+                emitted = True
+                yield item
+            if not emitted:
+                logger.warning("Gemini stream was empty or blocked.")
+                yield f"He encontrado {len(products)} opciones para tu búsqueda. Te adjunto el PDF con los detalles."
+            await producer
+
+    async def _format_response(self, products: List[Product], query: str, is_fallback: bool = False,
+                               timings: Optional["StageTimer"] = None) -> Dict:
+        timings = timings or StageTimer()
         if not products:
             return {
                 "answer": f"Lo siento, no he encontrado productos que coincidan con '{query}' en el catálogo actual. ¿Pruebas con otros términos?",
                 "products": [],
-                "pdf_url": None
+                "pdf_url": None,
+                "timings": timings.finish()
             }
-            
-        # Generate PDF
-        try:
-            from services.pdf_generator import PDFGenerator
-            pdf_gen = PDFGenerator()
-            # Need to run blocking code in threadpool
-            pdf_url = await asyncio.to_thread(pdf_gen.generate_catalog_pdf, products, query)
-        except Exception as e:
-            print(f"PDF Generation Error: {e}")
-            pdf_url = None
 
-        # Generate AI Answer using Gemini Pro
-        ai_response_text = ""
-        try:
-            import google.generativeai as genai
-            
-            # Context builder
-            products_context = "\n".join([
-                f"- {p.name} (Precio: €{p.selling_price or 'Consultar'}, Stock: {getattr(p, 'stock_quantity', 'Consultar')})"
-                for p in products
-            ])
-            
-            system_prompt = """Eres un vendedor experto de 'Global Prosper', una empresa líder en suministros hoteleros.
+        # PDF render and Gemini answer run concurrently: the response waits for the slowest
+        pdf_url, ai_response_text = await asyncio.gather(
+            self._render_pdf(products, query, timings),
+            self._generate_answer(products, query, is_fallback, timings)
+        )
+
+        response = {
+            "answer": ai_response_text,
+            "pdf_url": pdf_url,
+            "products": [serialize_chat_product(p) for p in products],
+            "timings": timings.finish()
+        }
+        return response
+
+
+@dataclass
+class Retrieval:
+    """Outcome of the retrieval stage shared by process_query and stream_query"""
+    products: List[Product]
+    is_fallback: bool
+    query_vector: Optional[np.ndarray] = None
+    cached: Optional[Dict] = None
+    filters: Optional[SearchFilters] = None
+
+    @property
+    def cache_context(self) -> Optional[str]:
+        return filters_key(self.filters)
+
+
+def filters_key(filters: Optional[SearchFilters]) -> Optional[str]:
+    """Stable string for a set of filters (response cache context)"""
+    if filters is None or filters.is_empty():
+        return None
+    return json.dumps(asdict(filters), sort_keys=True, default=str)
+
+
+SYSTEM_PROMPT = """Eres un vendedor experto de 'Global Prosper', una empresa líder en suministros hoteleros.
 Tu tono es profesional, cercano y persuasivo.
 Tu objetivo es ayudar al cliente a encontrar lo que necesita y cerrar la venta (o agendar una consulta).
 Responde a partir de los productos encontrados en nuestro catálogo.
 NO inventes productos. Si no hay información suficiente en los productos listados, sugiere contactar a ventas.
 Sé conciso y directo (es WhatsApp)."""
 
-            user_message = f"""Consulta del cliente: "{query}"
 
-Productos encontrados en catálogo:
-{products_context}
+def serialize_chat_product(p: Product) -> Dict:
+    """Product card as returned by /chat (images must be loaded already)"""
+    return {
+        "name": p.name,
+        "price": f"€{p.selling_price:.2f}" if p.selling_price else "Consultar",
+        "sku": p.sku_adquify,
+        "image": p.images[0].url if p.images else None,
+        "url": (p.raw_data or {}).get('url', '#'),
+        "stock": getattr(p, 'stock_quantity', 'Consultar')
+    }
 
-Genera una respuesta breve, recomendando estos productos. Menciona que se adjunta un PDF con detalles."""
-            
-            model = genai.GenerativeModel('models/gemini-1.5-flash')
-            # Run blocking generation in thread
-            response = await asyncio.to_thread(
-                model.generate_content, 
-                f"{system_prompt}\n\n{user_message}"
-            )
-            
-            # Defensive check
-            if response and hasattr(response, 'text') and response.text:
-                ai_response_text = response.text
-            else:
-                 # Fallback if text generation is blocked or empty
-                print("Gemini response was empty or blocked.")
-                # DO NOT RAISE, just fallback
-                ai_response_text = f"He encontrado {len(products)} opciones para tu búsqueda. Te adjunto el PDF con los detalles."
 
-        except Exception as e:
-            print(f"Gemini Generation Error: {e}")
-            prefix = "🔍 (Búsqueda por Similitud)" if not is_fallback else "⚠️ (Búsqueda por Palabras Clave)"
-            ai_response_text = f"{prefix} He encontrado {len(products)} opciones para '{query}'. Te las he adjuntado en el PDF."
+class StageTimer:
+    """
+    Wall-clock duration per pipeline stage, in milliseconds.
+    Stages may overlap (PDF and LLM run concurrently), so `total_ms` is
+    measured from creation, not summed.
+    """
 
-        response = {
-            "answer": ai_response_text,
-            "pdf_url": pdf_url,
-            "products": [
-                {
-                    "name": p.name,
-                    "price": f"€{p.selling_price:.2f}" if p.selling_price else "Consultar",
-                    "sku": p.sku_adquify,
-                    "image": p.images[0].url if p.images else None,
-                    "url": p.raw_data.get('url', '#'),
-                    "stock": getattr(p, 'stock_quantity', 'Consultar')
-                } for p in products
-            ]
-        }
-        return response
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[f"{stage}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def finish(self) -> Dict[str, float]:
+        return {**self.stages, "total_ms": round((time.perf_counter() - self._start) * 1000, 1)}
+
+
+# ========== GLOBAL INSTANCE ==========
+
+_chat_engine: Optional[AdquifyChatEngine] = None
+
+
+def get_chat_engine(vector_store=None) -> AdquifyChatEngine:
+    """
+    Process-wide chat engine. The first call creates it (with `vector_store`
+    if given); later calls return the same instance.
+    """
+    global _chat_engine
+    if _chat_engine is None:
+        _chat_engine = AdquifyChatEngine(vector_store=vector_store)
+    return _chat_engine
+
+
+def set_chat_engine(engine: AdquifyChatEngine):
+    """Install a pre-built engine (startup, tests)"""
+    global _chat_engine
+    _chat_engine = engine
@@ -0,0 +1,114 @@
+"""
+Adquify Embedding Pipeline
+==========================
+Generación de embeddings por lotes con un pool de concurrencia limitada.
+
+- Muchos textos por llamada a la API (batchEmbedContents, hasta 100).
+- Como máximo `concurrency` llamadas en vuelo, ejecutadas fuera del event loop.
+- Reintentos con backoff exponencial + jitter ante rate limits (429) y 5xx.
+- El embedder es intercambiable (Gemini en producción, FakeEmbeddingHandler offline).
+"""
+
+import asyncio
+import random
+import hashlib
+import logging
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger("EmbeddingPipeline")
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_EXCEPTIONS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+    )
+except ImportError:
+    RETRYABLE_EXCEPTIONS = ()
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """Rate limits y errores transitorios del servidor"""
+    if RETRYABLE_EXCEPTIONS and isinstance(exc, RETRYABLE_EXCEPTIONS):
+        return True
+    message = str(exc).lower()
+    return "429" in message or "rate limit" in message or "quota" in message or "503" in message
+
+
+def product_embedding_text(product) -> str:
+    """Representación textual de un producto que se embebe (y se indexa)"""
+    return f"{product.name} {product.description or ''} {product.category or ''} Price: {product.selling_price}"
+
+
+def text_hash(text: str) -> str:
+    """Hash estable del texto embebido (Product.embedding_text_hash)"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class BatchEmbeddingPipeline:
+    """
+    Embebe listas de textos en lotes concurrentes.
+    Los lotes que fallan tras agotar reintentos devuelven None por texto.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        batch_size: int = 100,
+        concurrency: int = 4,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        task_type: str = "retrieval_document"
+    ):
+        self.embedder = embedder
+        self.batch_size = max(1, min(batch_size, getattr(embedder, "max_batch_size", batch_size)))
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.task_type = task_type
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {"batches": 0, "texts": 0, "retries": 0, "failed_batches": 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _embed_batch(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        attempt = 0
+        async with self._get_semaphore():
+            while True:
+                try:
+                    vectors = await asyncio.to_thread(
+                        self.embedder.get_embeddings_batch, list(texts), self.task_type
+                    )
+                    if len(vectors) != len(texts):
+                        raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(texts)} texts")
+                    self.stats["batches"] += 1
+                    self.stats["texts"] += len(texts)
+                    return vectors
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable_error(e):
+                        logger.error(f"Embedding batch of {len(texts)} failed: {e}")
+                        self.stats["failed_batches"] += 1
+                        return [None] * len(texts)
+
+                    delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                    delay *= random.uniform(0.5, 1.0)
+                    attempt += 1
+                    self.stats["retries"] += 1
+                    logger.warning(f"Rate limited ({e}). Retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def embed_texts(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Embebe todos los textos preservando el orden de entrada"""
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(b) for b in batches))
+        return [vec for batch in results for vec in batch]
@@ -0,0 +1,198 @@
+"""
+Adquify Feed Reader
+===================
+Lectura en streaming de los feeds de proveedor (CSV / JSON / Excel) en
+DataFrames de tamaño fijo, para que la memoria no dependa del tamaño del
+fichero:
+
+- CSV:   `pd.read_csv(chunksize=...)`.
+- JSON:  parseo incremental de la lista de productos (`ijson` si está
+         instalado; si no, un lector por bloques con `json.JSONDecoder.raw_decode`).
+         Acepta una lista en la raíz o un objeto con la lista en `products`
+         (formato de los volcados de data/raw).
+- Excel: `openpyxl` en modo read-only (filas bajo demanda, sin cargar el libro).
+
+    for chunk in iter_feed_chunks("data/raw/CATALOG_FULL.json", chunksize=5000):
+        ...
+"""
+
+import json
+import logging
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+DEFAULT_CHUNK_SIZE = 5000
+READ_BLOCK = 1 << 16
+JSON_ITEMS_KEY = "products"
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ----- JSON -----
+
+class _StreamBuffer:
+    """Text buffer over a file that refills on demand and drops consumed input"""
+
+    def __init__(self, f: IO[str]):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        block = self.f.read(READ_BLOCK)
+        if not block:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at EOF), without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON feed: expected '{char}' near offset {self.pos}")
+        self.pos += 1
+
+    def decode(self, decoder: json.JSONDecoder) -> Any:
+        """Decodes the next complete JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next block
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def _iter_json_array(f: IO[str], key: str) -> Iterator[Any]:
+    """Items of the root array, or of `key` in the root object, one at a time"""
+    decoder = json.JSONDecoder()
+    stream = _StreamBuffer(f)
+
+    if stream.peek() == "{":
+        stream.expect("{")
+        while True:
+            if stream.peek() == "}":
+                return
+            name = stream.decode(decoder)
+            stream.expect(":")
+            if name == key and stream.peek() == "[":
+                break
+            stream.decode(decoder)  # Other root fields (date, count, ...) are small
+            if stream.peek() == ",":
+                stream.expect(",")
+
+    stream.expect("[")
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.decode(decoder)
+        nxt = stream.peek()
+        if nxt == ",":
+            stream.expect(",")
+        elif nxt == "]":
+            return
+        else:
+            raise ValueError(f"Invalid JSON feed: unexpected '{nxt}' in product list")
+
+
+def _json_root(path: Path) -> str:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        stream = _StreamBuffer(f)
+        return stream.peek()
+
+
+def iter_json_items(path, key: str = JSON_ITEMS_KEY) -> Iterator[Dict]:
+    """Products of a JSON feed, parsed incrementally"""
+    path = Path(path)
+    if IJSON_AVAILABLE:
+        prefix = "item" if _json_root(path) == "[" else f"{key}.item"
+        with open(path, "rb") as f:
+            yield from ijson.items(f, prefix, use_float=True)
+        return
+    with open(path, "r", encoding="utf-8-sig") as f:
+        yield from _iter_json_array(f, key)
+
+
+def iter_json_chunks(path, chunksize: int = DEFAULT_CHUNK_SIZE, key: str = JSON_ITEMS_KEY) -> Iterator[pd.DataFrame]:
+    for batch in batched(iter_json_items(path, key), chunksize):
+        yield pd.DataFrame.from_records(batch)
+
+
+# ----- CSV / Excel -----
+
+def iter_csv_chunks(path, chunksize: int = DEFAULT_CHUNK_SIZE, **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs) as reader:
+        yield from reader
+
+
+def iter_excel_chunks(path, chunksize: int = DEFAULT_CHUNK_SIZE, sheet: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Rows of an .xlsx sheet (first one by default); the first row is the header"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else f"col_{i}" for i, c in enumerate(header)]
+        for batch in batched(rows, chunksize):
+            # Skip fully empty rows (formatting-only lines at the end of many sheets)
+            batch = [r for r in batch if any(v is not None for v in r)]
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_feed_chunks(path, chunksize: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """DataFrames of at most `chunksize` rows, by file extension"""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return iter_csv_chunks(path, chunksize)
+    if suffix == ".json":
+        return iter_json_chunks(path, chunksize)
+    if suffix in (".xlsx", ".xlsm"):
+        return iter_excel_chunks(path, chunksize)
+    if suffix == ".xls":
+        # Legacy binary Excel has no streaming reader: whole sheet, then sliced
+        df = pd.read_excel(path)
+        return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+    raise ValueError("Unsupported file format")
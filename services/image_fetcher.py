@@ -0,0 +1,427 @@
+"""
+Adquify Image Fetcher
+=====================
+Descarga concurrente de las imágenes de producto (ProductImage.url) a un
+almacén direccionado por contenido:
+
+    assets/images/<sha[:2]>/<sha[2:4]>/<sha256>.<ext>
+    assets/images/thumbs/<sha[:2]>/<sha256>_<size>.webp
+
+- Un único httpx.AsyncClient con pool de conexiones acotado (keep-alive) y
+  `max_connections` descargas en vuelo.
+- Límite por host: intervalo mínimo entre peticiones y concurrencia máxima,
+  para no saturar a ningún proveedor.
+- GET condicional (If-None-Match / If-Modified-Since) al revalidar: un 304
+  no descarga nada.
+- Deduplicación por sha256: la misma foto publicada en varias URLs (o por
+  varios proveedores) se guarda una sola vez.
+- Miniaturas WebP generadas en un pool de procesos (Pillow es CPU).
+- Reanudable: el estado vive en ProductImage (local_path, content_hash,
+  etag, last_modified, fetched_at) y se confirma por lotes; al relanzar solo
+  se procesan las imágenes pendientes.
+
+Cuando cambia el contenido de una imagen se borran su huella perceptual y su
+vector visual, para que se recalculen.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+ASSETS_IMAGES = settings.BASE_DIR / "assets" / "images"
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "image/avif": "avif",
+}
+URL_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "avif"}
+
+# Outcomes
+DOWNLOADED = "downloaded"
+DEDUPLICATED = "deduplicated"
+NOT_MODIFIED = "not_modified"
+FAILED = "failed"
+
+
+@dataclass
+class FetchJob:
+    image_id: int
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+@dataclass
+class FetchResult:
+    image_id: int
+    status: str
+    content_hash: Optional[str] = None
+    local_path: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class FetchStats:
+    counts: Dict[str, int] = field(default_factory=dict)
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def add(self, result: FetchResult):
+        self.counts[result.status] = self.counts.get(result.status, 0) + 1
+        self.bytes += result.size
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def as_dict(self) -> Dict:
+        return {
+            **self.counts,
+            "total": self.total,
+            "megabytes": round(self.bytes / 1e6, 2),
+            "seconds": round(self.seconds, 2),
+            "images_per_second": round(self.total / self.seconds, 1) if self.seconds else None,
+        }
+
+
+def make_thumbnail(source: str, target: str, size: int) -> bool:
+    """WebP thumbnail (longest side = size). Runs in a worker process."""
+    from PIL import Image
+    try:
+        with Image.open(source) as image:
+            image.draft("RGB", (size, size))
+            image.thumbnail((size, size))
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+            image.save(tmp, "WEBP", quality=80, method=4)
+        os.replace(tmp, target)
+        return True
+    except Exception:
+        return False
+
+
+class HostRateLimiter:
+    """Minimum interval between requests and max concurrent requests, per host"""
+
+    def __init__(self, requests_per_second: float = 5.0, max_per_host: int = 4):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.max_per_host = max_per_host
+        self._next_slot: Dict[str, float] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Semaphores belong to one event loop (each asyncio.run() starts a new one)
+            self._loop = loop
+            self._next_slot, self._semaphores = {}, {}
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._semaphores[host]
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        async with self._semaphore(host):
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            start = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+class ImageFetcher:
+    """
+    Descargador asíncrono con almacén direccionado por contenido.
+
+        fetcher = ImageFetcher()
+        stats = asyncio.run(fetcher.run(db))
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        max_connections: int = 32,
+        requests_per_second_per_host: float = 8.0,
+        max_per_host: int = 6,
+        timeout: float = 20.0,
+        max_bytes: int = 25 * 1024 * 1024,
+        thumbnail_size: int = 320,
+        workers: Optional[int] = None,
+        user_agent: str = "AdquifyImageFetcher/1.0"
+    ):
+        self.root = Path(root or ASSETS_IMAGES)
+        self.max_connections = max_connections
+        self.limiter = HostRateLimiter(requests_per_second_per_host, max_per_host)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.workers = workers
+        self.user_agent = user_agent
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    # ----- Storage layout -----
+
+    def path_for(self, content_hash: str, ext: str) -> Path:
+        return self.root / content_hash[:2] / content_hash[2:4] / f"{content_hash}.{ext}"
+
+    def thumbnail_for(self, content_hash: str) -> Path:
+        return self.root / "thumbs" / content_hash[:2] / f"{content_hash}_{self.thumbnail_size}.webp"
+
+    def relative(self, path: Path) -> str:
+        """Path stored in ProductImage.local_path (relative to the engine root when possible)"""
+        try:
+            return path.relative_to(settings.BASE_DIR).as_posix()
+        except ValueError:
+            return str(path)
+
+    @staticmethod
+    def extension(url: str, content_type: Optional[str]) -> str:
+        mime = (content_type or "").split(";")[0].strip().lower()
+        if mime in CONTENT_TYPE_EXTENSIONS:
+            return CONTENT_TYPE_EXTENSIONS[mime]
+        suffix = Path(urlsplit(url).path).suffix.lower().lstrip(".")
+        if suffix in URL_EXTENSIONS:
+            return "jpg" if suffix == "jpeg" else suffix
+        return "img"
+
+    # ----- Fetching -----
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={"User-Agent": self.user_agent, "Accept": "image/*"},
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            )
+        )
+
+    async def _thumbnail(self, content_hash: str, source: Path):
+        target = self.thumbnail_for(content_hash)
+        if target.exists():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        ok = await loop.run_in_executor(self._pool, make_thumbnail, str(source), str(target), self.thumbnail_size)
+        if not ok:
+            logger.warning(f"Thumbnail failed for {source}")
+
+    async def fetch(self, client: httpx.AsyncClient, job: FetchJob) -> FetchResult:
+        headers = {}
+        if job.content_hash:
+            # Conditional GET only makes sense if we still hold the old bytes
+            if job.etag:
+                headers["If-None-Match"] = job.etag
+            if job.last_modified:
+                headers["If-Modified-Since"] = job.last_modified
+
+        host = urlsplit(job.url).netloc
+        tmp = self.root / "tmp" / f"{uuid.uuid4().hex}.part"
+        try:
+            async with self.limiter.slot(host):
+                async with client.stream("GET", job.url, headers=headers) as response:
+                    if response.status_code == 304:
+                        return FetchResult(job.image_id, NOT_MODIFIED, job.content_hash,
+                                           etag=response.headers.get("ETag", job.etag),
+                                           last_modified=response.headers.get("Last-Modified", job.last_modified))
+                    if response.status_code != 200:
+                        return FetchResult(job.image_id, FAILED, error=f"HTTP {response.status_code}")
+                    content_type = response.headers.get("Content-Type", "")
+                    if content_type and not content_type.startswith(("image/", "application/octet-stream")):
+                        return FetchResult(job.image_id, FAILED, error=f"Not an image ({content_type})")
+
+                    # Stream to a temp file, hashing on the way (no full copy in memory)
+                    digest = hashlib.sha256()
+                    size = 0
+                    tmp.parent.mkdir(parents=True, exist_ok=True)
+                    with open(tmp, "wb") as f:
+                        async for chunk in response.aiter_bytes(65536):
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise ValueError(f"larger than {self.max_bytes} bytes")
+                            digest.update(chunk)
+                            f.write(chunk)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+
+            if not size:
+                raise ValueError("empty body")
+            content_hash = digest.hexdigest()
+            target = self.path_for(content_hash, self.extension(job.url, content_type))
+            if target.exists():
+                tmp.unlink()
+                status = DEDUPLICATED
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, target)
+                status = DOWNLOADED
+
+            return FetchResult(job.image_id, status, content_hash, self.relative(target),
+                               etag, last_modified, size)
+        except Exception as e:
+            return FetchResult(job.image_id, FAILED, error=f"{type(e).__name__}: {e}")
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    async def fetch_all(self, jobs: Iterable[FetchJob], client: Optional[httpx.AsyncClient] = None) -> List[FetchResult]:
+        """Downloads a batch of jobs with at most `max_connections` in flight"""
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        own_client = client is None
+        client = client or self._client()
+        own_pool = self._pool is None
+        if own_pool:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        results: List[FetchResult] = []
+        thumbnails: List[asyncio.Task] = []
+
+        async def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self.fetch(client, job)
+                results.append(result)
+                if result.status in (DOWNLOADED, DEDUPLICATED):
+                    # CPU work in the process pool while this worker moves on to the next download
+                    source = self.path_for(result.content_hash, Path(result.local_path).suffix.lstrip("."))
+                    thumbnails.append(asyncio.create_task(self._thumbnail(result.content_hash, source)))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.max_connections, len(jobs)))))
+            await asyncio.gather(*thumbnails)
+        finally:
+            if own_client:
+                await client.aclose()
+            if own_pool:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        return results
+
+    # ----- DB pipeline -----
+
+    def pending_jobs(self, db: Session, after_id: int, limit: int,
+                     revalidate_before: Optional[datetime], retry_before: datetime) -> List[FetchJob]:
+        pending = and_(
+            ProductImage.local_path.is_(None),
+            or_(ProductImage.fetched_at.is_(None), ProductImage.fetched_at < retry_before)
+        )
+        if revalidate_before is not None:
+            pending = or_(pending, and_(
+                ProductImage.content_hash.isnot(None),
+                ProductImage.fetched_at < revalidate_before
+            ))
+        rows = (
+            db.query(ProductImage.id, ProductImage.url, ProductImage.etag,
+                     ProductImage.last_modified, ProductImage.content_hash)
+            .filter(ProductImage.id > after_id, ProductImage.url.isnot(None), ProductImage.url != "", pending)
+            .order_by(ProductImage.id)
+            .limit(limit)
+            .all()
+        )
+        return [FetchJob(r.id, r.url, r.etag, r.last_modified, r.content_hash) for r in rows]
+
+    def _save(self, db: Session, jobs: List[FetchJob], results: List[FetchResult]):
+        previous = {job.image_id: job.content_hash for job in jobs}
+        now = datetime.utcnow()
+        rows = []
+        for r in results:
+            row = {"id": r.image_id, "fetched_at": now}
+            if r.status in (DOWNLOADED, DEDUPLICATED):
+                row.update(local_path=r.local_path, content_hash=r.content_hash,
+                           etag=r.etag, last_modified=r.last_modified)
+                if r.content_hash != previous.get(r.image_id):
+                    # New bytes: derived features must be recomputed
+                    row.update(fingerprint=None, embedding_vector=None)
+            elif r.status == NOT_MODIFIED:
+                row.update(etag=r.etag, last_modified=r.last_modified)
+            rows.append(row)
+        if rows:
+            # Bulk UPDATE by primary key needs the same keys in every row
+            for keys in {tuple(sorted(row)) for row in rows}:
+                db.execute(update(ProductImage), [row for row in rows if tuple(sorted(row)) == keys])
+            db.commit()
+
+    async def run(
+        self,
+        db: Session,
+        batch_size: int = 200,
+        revalidate_after: Optional[timedelta] = None,
+        retry_after: timedelta = timedelta(days=1),
+        limit: Optional[int] = None
+    ) -> FetchStats:
+        """
+        Descarga las imágenes pendientes por lotes (cada lote se confirma en BD,
+        así que un proceso interrumpido continúa donde lo dejó).
+        Con `revalidate_after`, las ya descargadas hace más de ese tiempo se
+        revalidan con GET condicional.
+        """
+        stats = FetchStats()
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        revalidate_before = now - revalidate_after if revalidate_after is not None else None
+        retry_before = now - retry_after
+        last_id = 0
+
+        async with self._client() as client:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            try:
+                while limit is None or stats.total < limit:
+                    size = batch_size if limit is None else min(batch_size, limit - stats.total)
+                    jobs = self.pending_jobs(db, last_id, size, revalidate_before, retry_before)
+                    if not jobs:
+                        break
+                    last_id = jobs[-1].image_id
+
+                    results = await self.fetch_all(jobs, client)
+                    self._save(db, jobs, results)
+                    for r in results:
+                        stats.add(r)
+                        if r.status == FAILED:
+                            logger.debug(f"Image {r.image_id} failed: {r.error}")
+                    logger.info(f"Image fetch progress: {stats.as_dict()}")
+            finally:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+        stats.seconds = time.perf_counter() - start
+        return stats
@@ -0,0 +1,114 @@
+"""
+Adquify Image Fingerprints
+==========================
+Calcula una vez por ProductImage la huella perceptual (core.ai.image_hashing)
+y detecta fotos idénticas entre proveedores con el índice de Hamming.
+
+- Solo procesa imágenes con `fingerprint IS NULL` y `local_path` (keyset por id).
+- La decodificación con Pillow es CPU: se reparte en un pool de procesos.
+- Escritura con UPDATE masivo por clave primaria.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.models import Product, ProductImage
+from core.ai.image_hashing import FINGERPRINT_SIZE, ImageFingerprint, ImageHashIndex, fingerprint_file
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_image_path(local_path: str) -> str:
+    """local_path absoluto o relativo a la raíz del engine"""
+    path = Path(local_path)
+    return str(path if path.is_absolute() else settings.BASE_DIR / path)
+
+
+def compute_missing_fingerprints(db: Session, batch_size: int = 500, workers: Optional[int] = None) -> int:
+    """
+    Huellas de las imágenes descargadas que aún no la tienen.
+    Devuelve el número de imágenes procesadas (legibles o no).
+    """
+    processed = 0
+    last_id = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = (
+                db.query(ProductImage.id, ProductImage.local_path)
+                .filter(
+                    ProductImage.id > last_id,
+                    ProductImage.fingerprint.is_(None),
+                    ProductImage.local_path.isnot(None)
+                )
+                .order_by(ProductImage.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            paths = [resolve_image_path(r.local_path) for r in rows]
+            fingerprints = pool.map(fingerprint_file, paths, chunksize=16)
+            # b"" marks unreadable files so they are not retried on every run
+            db.execute(update(ProductImage), [
+                {"id": r.id, "fingerprint": fp or b""} for r, fp in zip(rows, fingerprints)
+            ])
+            db.commit()
+            processed += len(rows)
+
+    if processed:
+        logger.info(f"Computed fingerprints for {processed} images")
+    return processed
+
+
+def load_image_index(db: Session) -> ImageHashIndex:
+    """Índice de Hamming con todas las huellas válidas (clave = ProductImage.id)"""
+    rows = (
+        db.query(ProductImage.id, ProductImage.fingerprint)
+        .filter(ProductImage.fingerprint.isnot(None))
+        .yield_per(5000)
+    )
+    return ImageHashIndex(
+        (image_id, ImageFingerprint.from_bytes(blob))
+        for image_id, blob in rows
+        if blob and len(blob) == FINGERPRINT_SIZE
+    )
+
+
+def find_duplicate_images(db: Session, max_distance: int = 6, min_color_similarity: float = 0.8,
+                          index: Optional[ImageHashIndex] = None) -> List[Dict]:
+    """
+    Grupos de fotos casi idénticas que pertenecen a productos distintos:
+    [{"image_ids": [...], "skus": [...]}]
+    """
+    if index is None:
+        index = load_image_index(db)
+    groups = index.duplicate_groups(max_distance, min_color_similarity)
+    if not groups:
+        return []
+
+    image_ids = [i for g in groups for i in g]
+    sku_by_image = {}
+    for chunk_start in range(0, len(image_ids), 500):
+        chunk = image_ids[chunk_start:chunk_start + 500]
+        rows = (
+            db.query(ProductImage.id, Product.sku_adquify)
+            .join(Product, Product.id == ProductImage.product_id)
+            .filter(ProductImage.id.in_(chunk))
+        )
+        sku_by_image.update({image_id: sku for image_id, sku in rows})
+
+    result = []
+    for group in groups:
+        skus = sorted({sku_by_image[i] for i in group if i in sku_by_image})
+        if len(skus) > 1:
+            result.append({"image_ids": sorted(group), "skus": skus})
+    return result
@@ -6,6 +6,30 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from core.models import Product, Supplier, ProductImage
+from core.bulk_upsert import DEFAULT_CHUNK_SIZE, UpsertResult, chunked, new_skus, prefetch, upsert_products
+from services.feed_reader import DEFAULT_CHUNK_SIZE as DEFAULT_FEED_CHUNK_SIZE, iter_feed_chunks
+from services.sync_service import invalidate_catalog_caches
+
+# Column aliases in supplier feeds (first one present wins)
+SKU_COLUMNS = ['sku_supplier', 'sku', 'ref']
+NAME_COLUMNS = ['name', 'nombre', 'title']
+COST_COLUMNS = ['cost', 'coste', 'price']
+STOCK_COLUMNS = ['stock', 'quantity']
+DIMENSION_COLUMNS = ['width', 'height', 'depth', 'weight', 'color', 'ancho', 'alto', 'fondo', 'peso', 'dimensiones']
+
+
+def parse_specs(specs) -> dict:
+    """'specs' cell as a dict (JSON text, dict or empty)"""
+    if isinstance(specs, dict):
+        return dict(specs)
+    if isinstance(specs, str):
+        try:
+            parsed = json.loads(specs)
+            return parsed if isinstance(parsed, dict) else {"raw_specs": specs}
+        except ValueError:
+            return {"raw_specs": specs}
+    return {}
+
 
 class IngestionService:
     def __init__(self, db: Session):
@@ -30,107 +54,133 @@ class IngestionService:
         else:
             return "red"
 
-    def ingest_file(self, file_path: str, supplier_code: str):
+    def map_columns(self, df: pd.DataFrame, row_offset: int = 0):
+        """
+        Vectorized column mapping for one chunk of a feed.
+        Returns (normalized DataFrame indexed by file row, errors).
+        """
+        errors = []
+
+        def first_column(names, default):
+            # Heuristic mapping for common names: first alias present in the feed
+            for name in names:
+                if name in df.columns:
+                    return df[name]
+            return pd.Series(default, index=df.index)
+
+        out = pd.DataFrame(index=df.index)
+        out["sku_supplier"] = first_column(SKU_COLUMNS, "").fillna("").astype(str).str.strip()
+        out["name"] = first_column(NAME_COLUMNS, "Unknown Product").fillna("Unknown Product")
+
+        raw_cost = first_column(COST_COLUMNS, 0)
+        raw_stock = first_column(STOCK_COLUMNS, 0)
+        out["cost"] = pd.to_numeric(raw_cost, errors="coerce")
+        out["stock"] = pd.to_numeric(raw_stock, errors="coerce")
+
+        invalid = (
+            (out["sku_supplier"] == "")
+            | (out["cost"].isna() & raw_cost.notna())
+            | (out["stock"].isna() & raw_stock.notna())
+        )
+        for index in out.index[invalid]:
+            errors.append(f"Row {row_offset + index}: missing SKU or invalid cost/stock")
+        out = out[~invalid]
+        out["cost"] = out["cost"].fillna(0.0)
+        out["stock"] = out["stock"].fillna(0).astype(int)
+
+        # Metadata: 'specs' (JSON text or dict) + specific dimensions present in the feed
+        specs = first_column(["specs"], None).loc[out.index].map(parse_specs)
+        dims = [c for c in DIMENSION_COLUMNS if c in df.columns]
+        if dims:
+            extra = df.loc[out.index, dims].astype(object)
+            extra = extra.where(extra.notna(), None).to_dict("records")
+            specs = pd.Series(
+                [{**s, **{k: v for k, v in e.items() if v is not None}} for s, e in zip(specs, extra)],
+                index=out.index
+            )
+        out["specs"] = specs
+        return out, errors
+
+    def ingest_file(self, file_path: str, supplier_code: str, chunksize: int = DEFAULT_FEED_CHUNK_SIZE):
         """
         Universal Ingestion Function.
-        Reads CSV/JSON/Excel and upserts products.
+        Streams CSV/JSON/Excel in chunks (flat memory) and upserts products.
         """
         # 1. Load Supplier
         supplier = self.db.query(Supplier).filter(Supplier.code == supplier_code).first()
         if not supplier:
             raise ValueError(f"Supplier {supplier_code} not found")
 
-        # 2. Read File
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        elif file_path.endswith('.json'):
-            df = pd.read_json(file_path)
-        elif file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-            df = pd.read_excel(file_path)
-        else:
-            raise ValueError("Unsupported file format")
-
         results = {
             "created": 0,
             "updated": 0,
-            "total": len(df),
+            "total": 0,
             "errors": []
         }
 
-        # 3. Process Rows
-        for index, row in df.iterrows():
-            try:
-                # Normalize keys (expecting standardized columns or mapping)
-                # For this implementation, we assume the input has key columns or we map them.
-                # Heuristic mapping for common names:
-                sku_supplier = str(row.get('sku_supplier', row.get('sku', row.get('ref', '')))).strip()
-                name = row.get('name', row.get('nombre', row.get('title', 'Unknown Product')))
-                cost = float(row.get('cost', row.get('coste', row.get('price', 0))))
-                stock = int(row.get('stock', row.get('quantity', 0)))
-                
-                # Metadata extraction (everything else)
-                # metadata = row.to_dict() # This might be too heavy?
-                # Extract 'specs' if exists
-                specs = row.get('specs', {})
-                if isinstance(specs, str):
-                    try:
-                        specs = json.loads(specs)
-                    except:
-                        specs = {"raw_specs": specs}
-                
-                # 4. Find or Create Product
-                product = self.db.query(Product).filter(
-                    Product.supplier_id == supplier.id,
-                    Product.sku_supplier == sku_supplier
-                ).first()
-
-                is_new = False
-                if not product:
-                    is_new = True
-                    product = Product(
-                        sku_adquify=self.generate_adquify_sku(),
-                        sku_supplier=sku_supplier,
-                        supplier_id=supplier.id,
-                        created_at=datetime.utcnow()
-                    )
-                    self.db.add(product)
-                
-                # 5. Update Core Fields
-                product.name = name
-                product.cost_price = cost
-                
-                # 6. Apply Margin Multiplier
-                margin = supplier.margin_multiplier or 1.56
-                product.selling_price = cost * margin
-
-                # 7. Update Stock & Sync Status
-                product.stock_actual = stock
-                product.last_sync = datetime.utcnow()
-                product.status_stock = "green" # We just synced it
-
-                # 8. Update Metadata
-                # Merge specs into metadata_json
-                current_meta = product.metadata_json or {}
-                if isinstance(current_meta, str): current_meta = {} # Safety
-                current_meta.update(specs)
-                
-                # Add specific dimensions if present in row
-                for dim in ['width', 'height', 'depth', 'weight', 'color', 'ancho', 'alto', 'fondo', 'peso', 'color', 'dimensiones']:
-                    if dim in row and pd.notna(row[dim]):
-                        current_meta[dim] = row[dim]
-                
-                product.metadata_json = current_meta
-                product.status = "published" # Mark as ready/published if ingested? Or "reviewed"?
-                
-                if is_new:
-                    results["created"] += 1
-                else:
-                    results["updated"] += 1
-
-            except Exception as e:
-                results["errors"].append(f"Row {index}: {str(e)}")
-        
-        self.db.commit()
+        margin = supplier.margin_multiplier or 1.56
+        now = datetime.utcnow()
+        update_columns = ["name", "cost_price", "selling_price", "stock_quantity", "last_stock_update",
+                          "metadata_json", "status"]
+        outcome = UpsertResult()
+
+        # 2. Read File chunk by chunk (see services.feed_reader)
+        row_offset = 0
+        for df in iter_feed_chunks(file_path, chunksize):
+            df = df.reset_index(drop=True)
+            results["total"] += len(df)
+            mapped, errors = self.map_columns(df, row_offset)
+            row_offset += len(df)
+            results["errors"].extend(errors)
+
+            # 3. Selling price = cost * margin, for the whole chunk at once
+            mapped["selling_price"] = mapped["cost"] * margin
+
+            # 4. Resolve existing products (one IN query per upsert chunk) and bulk upsert
+            records = mapped.to_dict("records")
+            for chunk in chunked(records, DEFAULT_CHUNK_SIZE):
+                existing = prefetch(
+                    self.db, Product.sku_supplier, [r["sku_supplier"] for r in chunk],
+                    Product.sku_adquify, Product.metadata_json,
+                    where=Product.supplier_id == supplier.id
+                )
+                missing = list(dict.fromkeys(r["sku_supplier"] for r in chunk if r["sku_supplier"] not in existing))
+                assigned = dict(zip(missing, new_skus(self.db, len(missing), self.generate_adquify_sku)))
+                rows = {}
+                for r in chunk:
+                    sku_supplier = r["sku_supplier"]
+                    known = existing.get(sku_supplier)
+                    if known is None:
+                        # Repeated supplier SKU inside the chunk: later rows merge into the first
+                        sku_adquify = assigned[sku_supplier]
+                        current_meta = dict(rows[sku_supplier]["metadata_json"]) if sku_supplier in rows else {}
+                    else:
+                        sku_adquify = known.sku_adquify
+                        current_meta = known.metadata_json if isinstance(known.metadata_json, dict) else {}
+                    rows[sku_supplier] = {
+                        "sku_adquify": sku_adquify,
+                        "sku_supplier": sku_supplier,
+                        "supplier_id": supplier.id,
+                        "name": r["name"],
+                        "cost_price": r["cost"],
+                        "selling_price": r["selling_price"],
+                        "stock_quantity": r["stock"],
+                        "last_stock_update": now,
+                        "status": "published",
+                        "created_at": now,
+                        # Merge specs into metadata_json
+                        "metadata_json": {**current_meta, **r["specs"]},
+                    }
+                # Re-reading an identical feed is not a change: the read timestamp alone
+                # must not bump updated_at (and trigger a vector re-sync)
+                upsert_products(self.db, list(rows.values()), update_columns, result=outcome,
+                                passive_columns=["last_stock_update"])
+
+        if outcome.ids:
+            invalidate_catalog_caches(outcome.ids)
+        results["created"] = outcome.created
+        results["updated"] = outcome.updated
+        results["errors"].extend(outcome.errors)
         return results
 
 # Helper for standalone execution
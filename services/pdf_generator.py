@@ -1,8 +1,15 @@
 
 import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
@@ -14,12 +21,51 @@ ENGINE_ROOT = Path(__file__).parent.parent
 PDF_DIR = ENGINE_ROOT / "data" / "generated_pdfs"
 PDF_DIR.mkdir(parents=True, exist_ok=True)
 
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class PDFProduct:
+    """Detached copy of the product fields a PDF needs (no DB session required)"""
+    sku: str
+    name: str
+    description: Optional[str]
+    selling_price: Optional[float]
+    image_path: Optional[str] = None
+
+
+def snapshot_products(products) -> List[PDFProduct]:
+    """ORM products -> PDFProduct snapshots (snapshots pass through unchanged)"""
+    snapshots = []
+    for p in products:
+        if isinstance(p, PDFProduct):
+            snapshots.append(p)
+            continue
+        image_path = p.images[0].local_path if p.images else None
+        snapshots.append(PDFProduct(
+            sku=p.sku_adquify,
+            name=p.name,
+            description=p.description,
+            selling_price=p.selling_price,
+            image_path=image_path
+        ))
+    return snapshots
+
+
+def pdf_cache_key(products: List[PDFProduct], query_context: str) -> str:
+    """Same query + same ordered SKUs and prices -> same PDF"""
+    h = hashlib.sha256((query_context or "").strip().lower().encode("utf-8"))
+    for p in products:
+        h.update(f"|{p.sku}:{p.selling_price}".encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
 class PDFGenerator:
     """
     Generates PDF product sheets for Adquify.
     """
     
-    def __init__(self):
+    def __init__(self, output_dir: Path = PDF_DIR):
+        self.output_dir = output_dir
         self.styles = getSampleStyleSheet()
         self.setup_styles()
 
@@ -46,24 +92,25 @@ class PDFGenerator:
             fontName='Helvetica-Bold'
         )
 
-
-import logging
-logger = logging.getLogger(__name__)
-
-    def generate_catalog_pdf(self, products: List[Product], query_context: str) -> str:
+    def generate_catalog_pdf(self, products: List[Product], query_context: str, filename: Optional[str] = None) -> str:
         """
         Generates a PDF for the list of products and returns the relative URL path.
+        Accepts ORM products or PDFProduct snapshots (safe to render off-request).
         """
         # CRITICAL FIX: Safe Guard against None input
         if not query_context or not isinstance(query_context, str):
             logger.error("PDF Generation skipped: Input text is None or invalid.")
             return None
 
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        filename = f"Adquify_Selection_{timestamp}.pdf"
-        filepath = PDF_DIR / filename
+        products = snapshot_products(products)
+        if not filename:
+            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            filename = f"Adquify_Selection_{timestamp}.pdf"
+        filepath = self.output_dir / filename
+        # Build to a temp file and rename, so a URL never serves a half-written PDF
+        tmp_path = filepath.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
         
-        doc = SimpleDocTemplate(str(filepath), pagesize=A4)
+        doc = SimpleDocTemplate(str(tmp_path), pagesize=A4)
         story = []
         
         # Header
@@ -76,10 +123,7 @@ logger = logging.getLogger(__name__)
             # Image | Info
             
             # Fetch Image
-            img_path = None
-            if p.images and p.images[0].local_path:
-                if os.path.exists(p.images[0].local_path):
-                    img_path = p.images[0].local_path
+            img_path = p.image_path if p.image_path and os.path.exists(p.image_path) else None
             
             # If no local image, we skip image or use placeholder logic (ReportLab needs local file or valid http)
             # For this MVP, let's just list text if image is complex
@@ -102,7 +146,132 @@ logger = logging.getLogger(__name__)
             story.append(Spacer(1, 20))
             
         doc.build(story)
+        os.replace(tmp_path, filepath)
         
         # Return URL relative to mounted /files
         # Mounted at: /files -> data/
         return f"/files/generated_pdfs/{filename}"
+
+
+@dataclass
+class PDFTicket:
+    """URL of a (possibly still rendering) PDF plus the future that completes it"""
+    key: str
+    url: str
+    future: Optional[asyncio.Future] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.future is None or self.future.done()
+
+    async def wait(self, timeout: Optional[float] = None, pending_url: bool = False) -> Optional[str]:
+        """
+        Waits for the render; returns the URL, or None if it failed. On timeout
+        returns None, or the URL with `pending_url=True` (it becomes valid when
+        the render finishes).
+        """
+        if self.future is None:
+            return self.url
+        try:
+            ok = await asyncio.wait_for(asyncio.shield(self.future), timeout)
+            return self.url if ok else None
+        except asyncio.TimeoutError:
+            return self.url if pending_url else None
+
+
+class PDFRenderService:
+    """
+    Background, content-addressed PDF rendering for chat answers.
+
+    - submit() returns the final URL immediately; ReportLab runs in a small
+      thread pool off the event loop.
+    - The file name is a hash of the query and the ordered SKUs/prices, so an
+      identical selection reuses the existing file (and in-flight renders are shared).
+    - The directory is bounded by file count and total size (least recently
+      used first; reuse refreshes the mtime).
+    """
+
+    def __init__(self, pdf_dir: Path = PDF_DIR, max_files: int = 500, max_bytes: int = 200 * 1024 * 1024, workers: int = 2):
+        self.pdf_dir = pdf_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.generator = PDFGenerator(output_dir=pdf_dir)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf")
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def filename_for(key: str) -> str:
+        return f"Adquify_Selection_{key}.pdf"
+
+    def url_for(self, key: str) -> str:
+        return f"/files/generated_pdfs/{self.filename_for(key)}"
+
+    def submit(self, products, query_context: str) -> Optional[PDFTicket]:
+        """Schedules (or reuses) the PDF for this selection. Must run inside the event loop."""
+        if not query_context or not products:
+            return None
+
+        snapshots = snapshot_products(products)
+        key = pdf_cache_key(snapshots, query_context)
+        path = self.pdf_dir / self.filename_for(key)
+
+        if key in self._in_flight:
+            return PDFTicket(key, self.url_for(key), self._in_flight[key])
+
+        if path.exists():
+            # Cache hit: mark as recently used for eviction
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return PDFTicket(key, self.url_for(key))
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._render, snapshots, query_context, key)
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return PDFTicket(key, self.url_for(key), future)
+
+    def _render(self, snapshots: List[PDFProduct], query_context: str, key: str) -> bool:
+        try:
+            self.generator.generate_catalog_pdf(snapshots, query_context, filename=self.filename_for(key))
+            self._evict()
+            return True
+        except Exception as e:
+            logger.error(f"PDF render failed for {key}: {e}")
+            return False
+
+    def _evict(self):
+        """Deletes least recently used PDFs beyond max_files / max_bytes"""
+        with self._lock:
+            files = []
+            for f in self.pdf_dir.glob("*.pdf"):
+                try:
+                    st = f.stat()
+                    files.append((st.st_mtime, st.st_size, f))
+                except OSError:
+                    continue
+
+            files.sort(reverse=True)  # newest first
+            total = 0
+            for i, (_, size, f) in enumerate(files):
+                total += size
+                if i >= self.max_files or total > self.max_bytes:
+                    try:
+                        f.unlink()
+                    except OSError:
+                        pass
+
+
+# ========== GLOBAL INSTANCE ==========
+
+_pdf_service: Optional[PDFRenderService] = None
+
+
+def get_pdf_service() -> PDFRenderService:
+    """Get the global PDF render service"""
+    global _pdf_service
+    if _pdf_service is None:
+        _pdf_service = PDFRenderService()
+    return _pdf_service
@@ -0,0 +1,247 @@
+"""
+Adquify Product Listing
+=======================
+Motor de listado del catálogo interno con carga anticipada (eager loading)
+y paginación por cursor (keyset).
+
+- Imágenes y proveedor se cargan en 2 queries fijas por página (sin N+1).
+- La paginación usa `WHERE id > :last_id` (o `(updated_at, id)`), de modo que
+  la página 500 cuesta lo mismo que la página 1.
+- Con `q`, el filtro usa el índice FTS5 (services.search_index) y admite orden
+  por relevancia BM25.
+- El total es opcional y se cachea con TTL, porque `COUNT(*)` recorre la tabla.
+"""
+
+import base64
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, func, false
+from sqlalchemy.orm import Session, selectinload, joinedload, defer
+
+from core.models import Product
+from services.search_index import is_fts_available, build_match_query, fts_rank_subquery, ilike_filter
+
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/400"
+
+# Órdenes soportados por la paginación keyset
+ORDER_BY_ID = "id"
+ORDER_BY_UPDATED = "updated"
+ORDER_BY_RELEVANCE = "relevance"
+
+
+def encode_cursor(order: str, product: Product, rank: Optional[float] = None) -> str:
+    """Codifica la posición del último producto de la página en un cursor opaco"""
+    data = {"o": order, "id": product.id}
+    if order == ORDER_BY_RELEVANCE:
+        data["r"] = rank
+    if order == ORDER_BY_UPDATED:
+        data["u"] = product.updated_at.isoformat() if product.updated_at else None
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decodifica un cursor. Lanza ValueError si está mal formado."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(data, dict) or "id" not in data:
+            raise ValueError("cursor sin 'id'")
+        if data.get("u"):
+            data["u"] = datetime.fromisoformat(data["u"])
+        return data
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {e}")
+
+
+def serialize_product(p: Product) -> dict:
+    """Formato público de un producto del catálogo (GET /products)"""
+    return {
+        "id": p.sku_adquify,
+        "name": p.name,
+        "category": p.category,
+        "price": p.selling_price,
+        "image": p.images[0].url if p.images else PLACEHOLDER_IMAGE,
+        "supplier": p.supplier.code if p.supplier else "Unknown",
+        "stock": p.stock_quantity if p.last_stock_update else "Consultar",  # Real stock
+        "description": p.description
+    }
+
+
+class ProductListingEngine:
+    """
+    Listado paginado del catálogo con eager loading y cursor keyset.
+    Thread-safe: no guarda estado por request, solo la caché de totales.
+    """
+
+    def __init__(self, total_ttl_seconds: float = 60.0, max_cached_totals: int = 512):
+        self.total_ttl_seconds = total_ttl_seconds
+        self.max_cached_totals = max_cached_totals
+        self._totals: Dict[Tuple, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    # ----- Query building -----
+
+    def _base_query(self, db: Session, q: Optional[str], category: Optional[str], status: Optional[str]):
+        """Devuelve (query, fts) donde `fts` es la subquery de ranking BM25 o None"""
+        query = db.query(Product)
+        fts = None
+        if status:
+            query = query.filter(Product.status == status)
+
+        if q:
+            if is_fts_available(db):
+                match = build_match_query(q)
+                if match:
+                    fts = fts_rank_subquery(match)
+                    query = query.join(fts, fts.c.id == Product.id)
+                else:
+                    query = query.filter(false())
+            else:
+                query = query.filter(ilike_filter(q))
+
+        if category and category != "Todos":
+            query = query.filter(Product.category.ilike(f"%{category}%"))
+        return query, fts
+
+    def _apply_keyset(self, query, order: str, cursor: Optional[dict], fts=None):
+        if order == ORDER_BY_RELEVANCE:
+            # Mejor BM25 primero: (rank ASC, id ASC)
+            if cursor:
+                last_r, last_id = cursor["r"], cursor["id"]
+                query = query.filter(or_(
+                    fts.c.rank > last_r,
+                    and_(fts.c.rank == last_r, Product.id > last_id)
+                ))
+            return query.add_columns(fts.c.rank).order_by(fts.c.rank.asc(), Product.id.asc())
+
+        if order == ORDER_BY_UPDATED:
+            # Más recientes primero: (updated_at DESC, id DESC)
+            if cursor:
+                last_u, last_id = cursor.get("u"), cursor["id"]
+                if last_u is None:
+                    query = query.filter(and_(Product.updated_at.is_(None), Product.id < last_id))
+                else:
+                    query = query.filter(or_(
+                        Product.updated_at < last_u,
+                        and_(Product.updated_at == last_u, Product.id < last_id),
+                        Product.updated_at.is_(None)
+                    ))
+            return query.order_by(Product.updated_at.desc().nullslast(), Product.id.desc())
+
+        if cursor:
+            query = query.filter(Product.id > cursor["id"])
+        return query.order_by(Product.id.asc())
+
+    # ----- Totals -----
+
+    def get_total(self, db: Session, q: Optional[str] = None, category: Optional[str] = None,
+                  status: Optional[str] = "published") -> int:
+        """COUNT(*) cacheado por filtros durante `total_ttl_seconds`"""
+        key = (q or "", category or "", status or "")
+        now = time.monotonic()
+        with self._lock:
+            cached = self._totals.get(key)
+            if cached and now - cached[0] < self.total_ttl_seconds:
+                return cached[1]
+
+        query, _ = self._base_query(db, q, category, status)
+        total = query.with_entities(func.count(Product.id)).scalar() or 0
+
+        with self._lock:
+            if len(self._totals) >= self.max_cached_totals:
+                # Evict the oldest entry
+                oldest = min(self._totals, key=lambda k: self._totals[k][0])
+                del self._totals[oldest]
+            self._totals[key] = (now, total)
+        return total
+
+    def invalidate_totals(self):
+        with self._lock:
+            self._totals.clear()
+
+    # ----- Listing -----
+
+    def list_products(
+        self,
+        db: Session,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        q: Optional[str] = None,
+        category: Optional[str] = None,
+        order: str = ORDER_BY_ID,
+        status: Optional[str] = "published",
+        include_total: bool = False,
+        skip: int = 0
+    ) -> dict:
+        """
+        Devuelve una página del catálogo.
+
+        Args:
+            cursor: Cursor opaco devuelto como `next_cursor` en la página anterior.
+            order: "id" (estable, ascendente), "updated" (más recientes primero)
+                o "relevance" (BM25, requiere `q`).
+            include_total: Añade el total (cacheado) de productos que cumplen el filtro.
+            skip: Offset legacy; solo se aplica si no hay cursor.
+
+        Returns:
+            {"items": [...], "next_cursor": str | None, "total": int | None}
+        """
+        if order not in (ORDER_BY_ID, ORDER_BY_UPDATED, ORDER_BY_RELEVANCE):
+            raise ValueError(f"Orden no soportado: {order}")
+
+        query, fts = self._base_query(db, q, category, status)
+        if order == ORDER_BY_RELEVANCE and fts is None:
+            # Sin texto (o sin FTS5) no hay ranking: orden estable por id
+            order = ORDER_BY_ID
+
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded and decoded.get("o", ORDER_BY_ID) != order:
+            raise ValueError("El cursor pertenece a otro orden de listado")
+
+        query = query.options(
+            selectinload(Product.images),
+            joinedload(Product.supplier),
+            # Columnas pesadas que el listado no usa
+            defer(Product.embedding_json),
+            defer(Product.embedding_vector),
+            defer(Product.raw_data),
+            defer(Product.metadata_json)
+        )
+        query = self._apply_keyset(query, order, decoded, fts)
+        if skip and not decoded:
+            query = query.offset(skip)
+
+        # Pedimos uno extra para saber si hay página siguiente sin COUNT
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more and rows:
+            if order == ORDER_BY_RELEVANCE:
+                next_cursor = encode_cursor(order, rows[-1][0], rank=rows[-1][1])
+            else:
+                next_cursor = encode_cursor(order, rows[-1])
+        if order == ORDER_BY_RELEVANCE:
+            rows = [row[0] for row in rows]
+
+        return {
+            "items": [serialize_product(p) for p in rows],
+            "next_cursor": next_cursor,
+            "total": self.get_total(db, q, category, status) if include_total else None
+        }
+
+
+# ========== GLOBAL INSTANCE ==========
+
+listing_engine = ProductListingEngine()
+
+
+def get_listing_engine() -> ProductListingEngine:
+    """Get the global listing engine"""
+    return listing_engine
@@ -0,0 +1,188 @@
+"""
+Adquify Query Filters
+=====================
+Extrae filtros estructurados simples de una consulta en lenguaje natural
+para la búsqueda vectorial filtrada:
+
+    "sofás de menos de 500€ de Kave en stock"
+        -> SearchFilters(category=["Sofas"], supplier_code=["KAVE"], max_price=500, in_stock=True)
+
+- Precio: "menos de / hasta / por debajo de N", "más de / desde N", "entre N y M",
+  solo con moneda ("500€", "500 euros") o una palabra de precio cerca
+  ("precio", "presupuesto", "cuesta"); nunca con unidades ("240 cm", "3 plazas").
+- Proveedor: código o nombre de un proveedor existente.
+- Categoría: categorías existentes cuyas palabras aparecen en la consulta
+  (sin acentos, mayúsculas ni plurales). Se devuelven todas las variantes
+  guardadas ("sillas", "Sillas") porque el filtro del índice es exacto.
+- Stock: "en stock", "con stock", "entrega inmediata", "que estén disponibles".
+
+El vocabulario (categorías, proveedores) se lee de la BD y se cachea con TTL.
+"""
+
+import re
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from core.models import Product, Supplier
+from core.ai.search_filters import SearchFilters
+from services.search_index import fold_text
+
+NUMBER = r"(\d+(?:[.,]\d+)*)"
+# Required for a bound unless a price word is near (see is_price_match)
+CURRENCY = r"(\s*(?:€|eur(?:os?)?\b))?"
+# Measures and capacities: "hasta 240 cm", "mas de 3 plazas", "para 8 personas"
+UNIT = re.compile(
+    r"\s*(?:cm|mm|m|mts?|metros?|centimetros?|milimetros?|kg|kilos?|gr?|gramos?|l|litros?|w|watts?"
+    r"|plazas?|personas?|pax|comensales|puertas?|cajones|estantes|baldas|unidades|uds?)\b"
+)
+PRICE_WORD = re.compile(r"\b(?:precios?|cuestan?|cueste|coste|presupuesto|prices?|budget|costs?)\b")
+PRICE_WORD_WINDOW = 25  # characters around the match where a price word counts
+
+PRICE_BETWEEN = re.compile(rf"\bentre\s+{NUMBER}{CURRENCY}\s+y\s+{NUMBER}{CURRENCY}")
+PRICE_MAX = re.compile(
+    rf"(?:\bmenos\s+de|\bpor\s+debajo\s+de|\bbajo|\bhasta|\bmaximo(?:\s+de)?|\bmax\.?|\bunder|\bbelow|\bless\s+than|<)\s*{NUMBER}{CURRENCY}"
+)
+PRICE_MIN = re.compile(
+    rf"(?:\bmas\s+de|\bdesde|\ba\s+partir\s+de|\bminimo(?:\s+de)?|\bover|\babove|\bmore\s+than|>)\s*{NUMBER}{CURRENCY}"
+)
+# "disponible" alone is descriptive ("colores disponibles"): only explicit availability phrases
+IN_STOCK = re.compile(
+    r"\b(?:en\s+stock|con\s+stock|in\s+stock|entrega\s+inmediata"
+    r"|(?:esten|estan|este|esta)\s+disponibles?|disponibles?\s+(?:ahora|ya|hoy|para\s+entrega))\b"
+)
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def parse_number(raw: str) -> Optional[float]:
+    """'1.500' -> 1500, '9,99' -> 9.99, '1,500.50' -> 1500.5"""
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+", raw):
+        raw = raw.replace(".", "")
+    elif "," in raw and "." in raw:
+        raw = raw.replace(",", "")
+    else:
+        raw = raw.replace(",", ".")
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def is_price_match(folded: str, m: re.Match) -> bool:
+    """A number is a price if a currency follows it, or a price word is near and no unit follows"""
+    # Currency groups follow each NUMBER group (2, 4...)
+    if any(m.group(i) for i in range(2, m.re.groups + 1, 2)):
+        return True
+    if UNIT.match(folded, m.end()):
+        return False
+    context = folded[max(0, m.start() - PRICE_WORD_WINDOW):m.end() + PRICE_WORD_WINDOW]
+    return PRICE_WORD.search(context) is not None
+
+
+def _first_price(pattern: re.Pattern, folded: str) -> Optional[re.Match]:
+    return next((m for m in pattern.finditer(folded) if is_price_match(folded, m)), None)
+
+
+def extract_price_range(folded: str) -> Tuple[Optional[float], Optional[float]]:
+    """(min_price, max_price) mentioned in an already folded query"""
+    m = _first_price(PRICE_BETWEEN, folded)
+    if m:
+        low, high = parse_number(m.group(1)), parse_number(m.group(3))
+        if low is not None and high is not None:
+            return min(low, high), max(low, high)
+
+    max_m, min_m = _first_price(PRICE_MAX, folded), _first_price(PRICE_MIN, folded)
+    return (
+        parse_number(min_m.group(1)) if min_m else None,
+        parse_number(max_m.group(1)) if max_m else None
+    )
+
+
+def stem(token: str) -> str:
+    """Very light Spanish/English plural stripping: sofas -> sofa, mesas -> mesa, lamparas -> lampara"""
+    if len(token) > 4 and token.endswith("es") and token[-3] not in "aeiou":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def stems(text: str) -> List[str]:
+    return [stem(t) for t in TOKEN.findall(fold_text(text))]
+
+
+class QueryFilterExtractor:
+    """Builds SearchFilters from a query using the catalog's own categories and suppliers"""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._loaded_at = 0.0
+        self._categories: Dict[Tuple[str, ...], List[str]] = {}
+        self._suppliers: List[Tuple[str, str, str]] = []  # (code, folded code, folded name)
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session):
+        with self._lock:
+            if time.time() - self._loaded_at < self.ttl_seconds:
+                return
+
+            categories: Dict[Tuple[str, ...], List[str]] = {}
+            for (category,) in db.query(Product.category).filter(Product.category.isnot(None)).distinct():
+                words = tuple(s for s in stems(category) if len(s) >= 3 and not s.isdigit())
+                if words:
+                    categories.setdefault(words, []).append(category)
+
+            suppliers = [
+                (code, fold_text(code), fold_text(name or ""))
+                for code, name in db.query(Supplier.code, Supplier.name).filter(Supplier.code.isnot(None))
+            ]
+
+            self._categories, self._suppliers = categories, suppliers
+            self._loaded_at = time.time()
+
+    def extract(self, query: str, db: Session) -> SearchFilters:
+        folded = fold_text(query or "")
+        min_price, max_price = extract_price_range(folded)
+        filters = SearchFilters(min_price=min_price, max_price=max_price, in_stock=bool(IN_STOCK.search(folded)))
+
+        try:
+            self._refresh(db)
+        except Exception:
+            # Vocabulary unavailable: keep the price/stock filters only
+            return filters
+
+        query_stems = set(stems(query))
+        query_tokens = set(TOKEN.findall(folded))
+
+        categories = [
+            value
+            for words, values in self._categories.items()
+            if all(w in query_stems for w in words)
+            for value in values
+        ]
+        suppliers = [
+            code
+            for code, folded_code, folded_name in self._suppliers
+            if (len(folded_code) >= 3 and folded_code in query_tokens)
+            or (folded_name and re.search(rf"\b{re.escape(folded_name)}\b", folded))
+        ]
+
+        filters.category = categories or None
+        filters.supplier_code = suppliers or None
+        return filters
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+# ========== GLOBAL INSTANCE ==========
+
+query_filter_extractor = QueryFilterExtractor()
+
+
+def get_query_filter_extractor() -> QueryFilterExtractor:
+    """Get the global query filter extractor (shared vocabulary cache)"""
+    return query_filter_extractor
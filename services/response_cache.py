@@ -0,0 +1,171 @@
+"""
+Adquify Semantic Response Cache
+===============================
+Caché de respuestas del chat indexada por similitud del embedding de la consulta.
+
+Si llega una consulta cuyo embedding tiene coseno >= `threshold` con una ya
+respondida, se devuelve la respuesta guardada (answer + pdf_url + products)
+sin búsqueda vectorial, PDF ni Gemini.
+
+Invalidación: cada entrada guarda (precio, stock) de los productos devueltos;
+antes de servirla se comprueban contra la BD con una sola query por SKU
+(índice único). Si alguno cambió o desapareció, la entrada se descarta.
+"""
+
+import copy
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from core.models import Product
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class CachedResponse:
+    query: str
+    vector: np.ndarray
+    response: dict
+    fingerprints: Dict[str, Tuple[Optional[float], Optional[int]]]
+    context: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+def product_fingerprint(p: Product) -> Tuple[Optional[float], Optional[int]]:
+    return (p.selling_price, p.stock_quantity)
+
+
+class SemanticResponseCache:
+    """
+    Caché acotada (LRU por inserción + TTL) de respuestas completas del chat.
+    La búsqueda es un producto matriz-vector sobre los embeddings normalizados.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl_seconds: float = 900):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: List[CachedResponse] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        arr = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(arr)
+        return arr / norm if norm else None
+
+    def _rebuild(self):
+        self._matrix = np.vstack([e.vector for e in self._entries]) if self._entries else None
+
+    def _remove(self, entry: CachedResponse):
+        if entry in self._entries:
+            self._entries.remove(entry)
+            self._rebuild()
+
+    def _best_match(self, vec: np.ndarray, context: Optional[str]) -> Optional[CachedResponse]:
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+                return None
+            scores = self._matrix @ vec
+            # Only entries answered under the same filters are candidates
+            scores[[e.context != context for e in self._entries]] = -np.inf
+            idx = int(np.argmax(scores))
+            if scores[idx] < self.threshold:
+                return None
+            entry = self._entries[idx]
+            if time.time() - entry.created_at > self.ttl_seconds:
+                self._remove(entry)
+                return None
+            return entry
+
+    def _is_fresh(self, entry: CachedResponse, db: Session) -> bool:
+        """True si ningún producto devuelto cambió de precio/stock (ni se borró)"""
+        skus = list(entry.fingerprints)
+        if not skus:
+            return True
+        rows = db.query(
+            Product.sku_adquify, Product.selling_price, Product.stock_quantity
+        ).filter(Product.sku_adquify.in_(skus)).all()
+        current = {sku: (price, stock) for sku, price, stock in rows}
+        return all(current.get(sku) == fp for sku, fp in entry.fingerprints.items())
+
+    def lookup(self, vector, db: Session, context: Optional[str] = None) -> Optional[dict]:
+        """
+        Respuesta cacheada para una consulta similar, o None.
+        `context` (p. ej. los filtros extraídos) debe coincidir exactamente:
+        "sofás por menos de 300€" y "... de 500€" tienen embeddings casi iguales.
+        """
+        vec = self._normalize(vector)
+        entry = self._best_match(vec, context) if vec is not None else None
+
+        if entry and not self._is_fresh(entry, db):
+            with self._lock:
+                self._remove(entry)
+                self.stats["invalidations"] += 1
+            entry = None
+
+        with self._lock:
+            self.stats["misses" if entry is None else "hits"] += 1
+        if entry is None:
+            return None
+
+        response = copy.deepcopy(entry.response)
+        response["cached"] = True
+        return response
+
+    def store(self, query: str, vector, response: dict, products: List[Product], context: Optional[str] = None):
+        """Guarda la respuesta con el precio/stock actual de sus productos"""
+        vec = self._normalize(vector)
+        if vec is None or not products:
+            return
+
+        entry = CachedResponse(
+            query=query,
+            vector=vec,
+            response=copy.deepcopy(response),
+            fingerprints={p.sku_adquify: product_fingerprint(p) for p in products},
+            context=context
+        )
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                self._entries.pop(0)
+            self._rebuild()
+
+    def invalidate_skus(self, skus):
+        """Descarta las entradas que contienen alguno de estos SKUs"""
+        skus = set(skus)
+        with self._lock:
+            before = len(self._entries)
+            self._entries = [e for e in self._entries if not skus.intersection(e.fingerprints)]
+            removed = before - len(self._entries)
+            if removed:
+                self.stats["invalidations"] += removed
+                self._rebuild()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rebuild()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "size": len(self._entries)}
+
+
+# ========== GLOBAL INSTANCE ==========
+
+response_cache = SemanticResponseCache()
+
+
+def get_response_cache() -> SemanticResponseCache:
+    """Get the global semantic response cache"""
+    return response_cache
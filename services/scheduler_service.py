@@ -290,17 +290,37 @@ async def scraper_task(supplier_code: str):
 
 
 async def report_task():
-    """Task to generate and send catalog report"""
-    import httpx
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                "http://localhost:8001/internal-catalog/export/csv",
-                timeout=60
-            )
-            logger.info(f"Report generated: {response.json()}")
-        except Exception as e:
-            logger.error(f"Report task failed: {e}")
+    """Task to generate the client catalog report (data/exports, streamed from the DB)"""
+    import asyncio
+    from pathlib import Path
+    from core.database import SessionLocal
+    from services.catalog_export import CSV_FILENAME, write_catalog_csv
+
+    exports_dir = Path(__file__).parent.parent / "data" / "exports"
+    exports_dir.mkdir(parents=True, exist_ok=True)
+    db = SessionLocal()
+    try:
+        path = await asyncio.to_thread(write_catalog_csv, db, exports_dir / CSV_FILENAME)
+        logger.info(f"Report generated: {path}")
+    except Exception as e:
+        logger.error(f"Report task failed: {e}")
+    finally:
+        db.close()
+
+
+async def vector_sync_task(vector_store=None):
+    """Task to push catalog changes (price, stock, text) to the vector index"""
+    from core.database import SessionLocal
+    from core.ai.vector_store import create_vector_store
+    from services.sync_service import incremental_vector_sync
+    
+    db = SessionLocal()
+    try:
+        await incremental_vector_sync(db, vector_store or create_vector_store())
+    except Exception as e:
+        logger.error(f"Vector sync task failed: {e}")
+    finally:
+        db.close()
 
 
 # ========== GLOBAL INSTANCE ==========
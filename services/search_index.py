@@ -0,0 +1,250 @@
+"""
+Adquify Search Index
+====================
+Índice de texto completo (SQLite FTS5) sobre `products`.
+
+- Tabla virtual `products_fts` con contenido externo (no duplica el texto),
+  sincronizada con `products` mediante triggers INSERT/UPDATE/DELETE.
+- Tokenizer `unicode61 remove_diacritics 2`: "sofá" == "sofa", "jardín" == "jardin".
+- Ranking BM25 con pesos por columna (nombre y SKU pesan más que la descripción).
+
+En motores sin FTS5 (p.ej. Postgres) todo cae a la búsqueda ILIKE clásica.
+"""
+
+import re
+import logging
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import text, literal_column, select, table, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from core.models import Product, Supplier
+from core.ai.search_filters import SearchFilters, as_values
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "products_fts"
+FTS_COLUMNS = ("name", "description", "category", "sku_adquify")
+
+# Pesos BM25 en el mismo orden que FTS_COLUMNS
+BM25_WEIGHTS = (10.0, 1.0, 3.0, 10.0)
+
+# Palabras vacías (ya sin tildes) que no se buscan en las consultas OR de chat:
+# como prefijo ("de"*, "la"*) casan con casi todo el catálogo
+STOP_WORDS = frozenset("""
+    de del la las el los un una unos unas al lo y o u e a en con sin por para que
+    se su sus mi mis es son mas muy como pero este esta estos estas ese esa hay
+    the and for with of to in on an or
+""".split())
+MIN_ANY_TERM_LENGTH = 3
+
+# Cache de disponibilidad por URL de engine
+_fts_available = {}
+
+_DDL_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    {", ".join(FTS_COLUMNS)},
+    content='products',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+_COLS = ", ".join(FTS_COLUMNS)
+_NEW = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+_OLD = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+
+_DDL_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_COLS} ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD});
+        INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW});
+    END
+    """,
+]
+
+
+def fold_text(value: str) -> str:
+    """Minúsculas y sin tildes/diacríticos (misma normalización que el tokenizer)"""
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def build_match_query(q: Optional[str], any_term: bool = False) -> Optional[str]:
+    """
+    Convierte texto libre del usuario en una expresión MATCH segura.
+    Cada término se cita (sin operadores FTS inyectables) y se busca por
+    prefijo, para que las búsquedas "mientras se escribe" funcionen.
+    Con `any_term` basta con un término (OR): frases de chat completas, donde
+    BM25 ya premia a los productos que contienen más términos. En ese modo se
+    descartan las palabras vacías y los términos de menos de 3 caracteres.
+    """
+    tokens = re.findall(r"\w+", fold_text(q or ""))
+    if any_term:
+        tokens = [t for t in tokens if len(t) >= MIN_ANY_TERM_LENGTH and t not in STOP_WORDS]
+    if not tokens:
+        return None
+    return (" OR " if any_term else " ").join(f'"{t}"*' for t in tokens)
+
+
+def ensure_fts_index(engine: Engine) -> bool:
+    """
+    Crea la tabla FTS5 y sus triggers si no existen, y la reconstruye
+    cuando se crea por primera vez. Devuelve True si el índice está activo.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+
+    try:
+        with engine.connect() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+                {"n": FTS_TABLE}
+            ).first() is not None
+
+            conn.execute(text(_DDL_TABLE))
+            for ddl in _DDL_TRIGGERS:
+                conn.execute(text(ddl))
+
+            if not exists:
+                logger.info(f"Building FTS index '{FTS_TABLE}'...")
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            conn.commit()
+
+        _fts_available[str(engine.url)] = True
+        logger.info(f"✅ FTS index '{FTS_TABLE}' ready")
+        return True
+    except Exception as e:
+        # SQLite compilado sin FTS5
+        logger.warning(f"FTS5 not available, using ILIKE search: {e}")
+        _fts_available[str(engine.url)] = False
+        return False
+
+
+def is_fts_available(db: Session) -> bool:
+    """True si la sesión apunta a un SQLite con el índice FTS creado"""
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _fts_available:
+        if bind.dialect.name != "sqlite":
+            _fts_available[key] = False
+        else:
+            _fts_available[key] = db.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+                {"n": FTS_TABLE}
+            ).first() is not None
+    return _fts_available[key]
+
+
+def fts_rank_subquery(match: str):
+    """Subquery (id, rank) con los productos que cumplen `match`; rank menor = mejor"""
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    return (
+        select(
+            literal_column("rowid").label("id"),
+            literal_column(f"bm25({FTS_TABLE}, {weights})").label("rank")
+        )
+        .select_from(table(FTS_TABLE))
+        .where(text(f"{FTS_TABLE} MATCH :fts_match").bindparams(fts_match=match))
+        .subquery("fts")
+    )
+
+
+def ilike_filter(q: str):
+    """Filtro legacy (scan completo) para motores sin FTS5"""
+    search = f"%{q}%"
+    return or_(Product.name.ilike(search), Product.description.ilike(search))
+
+
+def apply_search_filters(query, filters: Optional[SearchFilters]):
+    """Mismos filtros estructurados que la búsqueda vectorial, como condiciones SQL"""
+    if filters is None or filters.is_empty():
+        return query
+    if as_values(filters.category):
+        query = query.filter(Product.category.in_(as_values(filters.category)))
+    if as_values(filters.supplier_code):
+        query = query.filter(Product.supplier.has(Supplier.code.in_(as_values(filters.supplier_code))))
+    if filters.min_price is not None:
+        query = query.filter(Product.selling_price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(Product.selling_price <= filters.max_price)
+    if filters.in_stock:
+        query = query.filter(Product.last_stock_update.isnot(None), Product.stock_quantity > 0)
+    return query
+
+
+# Tokens con aspecto de código de catálogo: "ADQ-00123", "KV.4451", "S1234"
+# (con letras y dígitos: "500" o "multi-uso" no son códigos)
+CODE_TOKEN = re.compile(r"\w+(?:[-_./]\w+)+|\w*\d\w*")
+HAS_LETTER = re.compile(r"[^\W\d_]")
+HAS_DIGIT = re.compile(r"\d")
+
+
+def code_tokens(q: Optional[str]) -> set:
+    """Códigos de catálogo candidatos en una consulta"""
+    return {
+        t for t in CODE_TOKEN.findall(q or "")
+        if len(t) >= 3 and HAS_LETTER.search(t) and HAS_DIGIT.search(t)
+    }
+
+
+def _sku_query(db: Session, status: Optional[str], filters: Optional[SearchFilters]):
+    query = apply_search_filters(db.query(Product.sku_adquify), filters)
+    return query.filter(Product.status == status) if status else query
+
+
+def exact_code_skus(db: Session, q: str, limit: int = 20, status: Optional[str] = None,
+                    filters: Optional[SearchFilters] = None) -> List[str]:
+    """SKUs cuyo sku_adquify o sku_supplier aparece literalmente en la consulta"""
+    codes = code_tokens(q)
+    if not codes:
+        return []
+    variants = codes | {c.upper() for c in codes}
+    query = _sku_query(db, status, filters).filter(
+        or_(Product.sku_adquify.in_(variants), Product.sku_supplier.in_(variants))
+    )
+    return [sku for (sku,) in query.limit(limit)]
+
+
+def search_product_skus(db: Session, q: str, limit: int = 20, status: Optional[str] = None,
+                        filters: Optional[SearchFilters] = None) -> List[str]:
+    """
+    Ranking léxico de SKUs para la recuperación híbrida: BM25 con términos en
+    OR (ILIKE si no hay FTS5). Solo lee la columna SKU.
+    """
+    query = _sku_query(db, status, filters)
+    if is_fts_available(db):
+        match = build_match_query(q, any_term=True)
+        if not match:
+            return []
+        fts = fts_rank_subquery(match)
+        query = query.join(fts, fts.c.id == Product.id).order_by(fts.c.rank, Product.id)
+    else:
+        query = query.filter(ilike_filter(q))
+    return [sku for (sku,) in query.limit(limit)]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fusiona varios rankings (listas de claves, mejor primero) con RRF:
+    score(d) = sum 1 / (k + posición). Empates: orden de aparición.
+    """
+    scores = {}
+    for ranking in rankings:
+        for position, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + position)
+    return sorted(scores, key=lambda key: -scores[key])
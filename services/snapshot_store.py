@@ -0,0 +1,274 @@
+"""
+Adquify Snapshot Store
+======================
+Snapshots columnares de cada ejecución de scraper, junto a (o en lugar de)
+los volcados JSON de data/raw:
+
+    data/snapshots/<proveedor>/<proveedor>_<timestamp>.parquet         (zstd)
+    data/snapshots/<proveedor>/<proveedor>_<timestamp>.manifest.json
+
+- El manifiesto (proveedor, extracted_at, filas, esquema) se escribe después
+  del Parquet: si existe, el snapshot está completo. Listar snapshots o saber
+  la última extracción solo lee manifiestos.
+- Lectura por columnas con memory map (`columns=[...]`): consolidar, comparar
+  o exportar no parsea el fichero entero.
+- Las columnas con dicts (specs, dimensiones...) o tipos mezclados se guardan
+  como texto JSON y se decodifican al leer (`json_columns` en el manifiesto).
+
+Requiere pyarrow (opcional): sin él `PYARROW_AVAILABLE` es False,
+`save_snapshot` no hace nada y los consumidores siguen con los JSON.
+"""
+
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+SNAPSHOTS_ROOT = settings.DATA_DIR / "snapshots"
+COMPRESSION = "zstd"
+MANIFEST_SUFFIX = ".manifest.json"
+# Consolidated catalog (update_catalog.py), stored as one more "supplier"
+CATALOG_SUPPLIER = "catalog_full"
+
+
+@dataclass
+class SnapshotInfo:
+    supplier: str
+    extracted_at: str
+    rows: int
+    schema: List[Dict[str, str]]
+    file: str
+    json_columns: List[str] = field(default_factory=list)
+    bytes: int = 0
+    compression: str = COMPRESSION
+    directory: Optional[Path] = field(default=None, repr=False, compare=False)
+
+    @property
+    def path(self) -> Path:
+        return self.directory / self.file
+
+    @property
+    def extracted_datetime(self) -> Optional[datetime]:
+        """extracted_at as a naive UTC datetime (None if unparseable)"""
+        try:
+            value = datetime.fromisoformat(self.extracted_at)
+        except (TypeError, ValueError):
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @property
+    def columns(self) -> List[str]:
+        return [c["name"] for c in self.schema]
+
+    def manifest(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("directory")
+        return data
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+
+
+def _supplier_key(supplier: str) -> str:
+    return re.sub(r"[^a-z0-9_]+", "_", supplier.strip().lower()) or "unknown"
+
+
+def _has_struct(arrow_type) -> bool:
+    if pa.types.is_struct(arrow_type) or pa.types.is_map(arrow_type):
+        return True
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return _has_struct(arrow_type.value_type)
+    return False
+
+
+def _column_array(values: List[Any]):
+    """Native Arrow array for one column, or None if it has to go as JSON text"""
+    if any(isinstance(v, dict) for v in values):
+        return None
+    try:
+        array = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return None
+    return None if _has_struct(array.type) else array
+
+
+def products_to_table(products: Sequence[Dict]):
+    """(pa.Table, json_columns) con una columna por clave (unión, en orden de aparición)"""
+    _require_pyarrow()
+    names = list(dict.fromkeys(key for p in products for key in p))
+    arrays, json_columns = [], []
+    for name in names:
+        values = [p.get(name) for p in products]
+        array = _column_array(values)
+        if array is None:
+            json_columns.append(name)
+            array = pa.array(
+                [None if v is None else json.dumps(v, ensure_ascii=False, default=str) for v in values],
+                type=pa.string()
+            )
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=names), json_columns
+
+
+def write_snapshot(supplier: str, products: Sequence[Dict], extracted_at: Optional[str] = None,
+                   root: Path = SNAPSHOTS_ROOT) -> SnapshotInfo:
+    """Guarda una ejecución de `supplier` como Parquet + manifiesto"""
+    _require_pyarrow()
+    extracted_at = extracted_at or datetime.utcnow().isoformat()
+    key = _supplier_key(supplier)
+    directory = Path(root) / key
+    directory.mkdir(parents=True, exist_ok=True)
+
+    table, json_columns = products_to_table(products)
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
+    path = directory / f"{key}_{stamp}.parquet"
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, path)
+
+    info = SnapshotInfo(
+        supplier=supplier,
+        extracted_at=extracted_at,
+        rows=table.num_rows,
+        schema=[{"name": f.name, "type": str(f.type)} for f in table.schema],
+        file=path.name,
+        json_columns=json_columns,
+        bytes=path.stat().st_size,
+        directory=directory,
+    )
+    manifest_path = path.with_name(path.stem + MANIFEST_SUFFIX)
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(info.manifest(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path)
+    return info
+
+
+def save_snapshot(supplier: str, products: Sequence[Dict], extracted_at: Optional[str] = None,
+                  root: Path = SNAPSHOTS_ROOT) -> Optional[SnapshotInfo]:
+    """write_snapshot para los scrapers: sin pyarrow o si falla, solo avisa (el JSON sigue siendo la fuente)"""
+    if not PYARROW_AVAILABLE or not products:
+        return None
+    try:
+        info = write_snapshot(supplier, products, extracted_at, root)
+        logger.info(f"Snapshot {info.file}: {info.rows} rows, {info.bytes / 1024:.0f} KB")
+        return info
+    except Exception as e:
+        logger.error(f"Snapshot of {supplier} failed: {e}")
+        return None
+
+
+# ----- Manifests -----
+
+def list_snapshots(supplier: Optional[str] = None, root: Path = SNAPSHOTS_ROOT) -> List[SnapshotInfo]:
+    """Snapshots completos (con manifiesto), del más antiguo al más reciente"""
+    root = Path(root)
+    pattern = f"{_supplier_key(supplier)}/*{MANIFEST_SUFFIX}" if supplier else f"*/*{MANIFEST_SUFFIX}"
+    snapshots = []
+    for manifest_path in root.glob(pattern):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                snapshots.append(SnapshotInfo(**json.load(f), directory=manifest_path.parent))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Skipping invalid snapshot manifest {manifest_path}: {e}")
+    return sorted(snapshots, key=lambda s: (s.extracted_at, s.file))
+
+
+def latest_snapshot(supplier: str, root: Path = SNAPSHOTS_ROOT) -> Optional[SnapshotInfo]:
+    snapshots = list_snapshots(supplier, root)
+    return snapshots[-1] if snapshots else None
+
+
+def latest_snapshots(root: Path = SNAPSHOTS_ROOT) -> Dict[str, SnapshotInfo]:
+    """{proveedor: último snapshot}"""
+    return {_supplier_key(s.supplier): s for s in list_snapshots(root=root)}
+
+
+# ----- Reading -----
+
+def read_table(snapshot: SnapshotInfo, columns: Optional[Sequence[str]] = None):
+    """
+    pa.Table del snapshot (memory-mapped). `columns` limita la lectura a esas
+    columnas; las que el snapshot no tiene se ignoran.
+    """
+    _require_pyarrow()
+    if columns is not None:
+        available = set(snapshot.columns)
+        columns = [c for c in dict.fromkeys(columns) if c in available]
+    return pq.read_table(snapshot.path, columns=columns, memory_map=True)
+
+
+def read_frame(snapshot: SnapshotInfo, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    table = read_table(snapshot, columns)
+    df = table.to_pandas()
+    for name in snapshot.json_columns:
+        if name in df.columns:
+            df[name] = df[name].map(lambda v: None if v is None else json.loads(v))
+    return df
+
+
+def read_products(snapshot: SnapshotInfo, columns: Optional[Sequence[str]] = None) -> List[Dict]:
+    """Productos como dicts (mismo formato que los volcados JSON)"""
+    table = read_table(snapshot, columns)
+    json_columns = [c for c in snapshot.json_columns if c in table.column_names]
+    products = table.to_pylist()
+    for product in products:
+        for name in json_columns:
+            if product[name] is not None:
+                product[name] = json.loads(product[name])
+    return products
+
+
+def diff_snapshots(old: SnapshotInfo, new: SnapshotInfo, key: str = "sku_adquify",
+                   columns: Sequence[str] = ("price", "name")) -> Dict[str, Any]:
+    """
+    Cambios entre dos ejecuciones, leyendo solo `key` y `columns`:
+    {"added": [keys], "removed": [keys], "changed": {column: [(key, old, new), ...]}}
+    """
+    compare = [c for c in columns if c in old.columns and c in new.columns and c != key]
+
+    def load(snapshot: SnapshotInfo) -> pd.DataFrame:
+        df = read_frame(snapshot, [key, *compare])
+        for column in compare:
+            # Lists (NumPy arrays from Arrow, lists from JSON columns) compare as tuples
+            df[column] = df[column].map(lambda v: tuple(v) if isinstance(v, (np.ndarray, list)) else v)
+        return df.drop_duplicates(key, keep="last")
+
+    before, after = load(old), load(new)
+    merged = before.merge(after, on=key, how="outer", suffixes=("_old", "_new"), indicator=True)
+
+    changed = {}
+    both = merged[merged["_merge"] == "both"]
+    for column in compare:
+        a, b = both[f"{column}_old"], both[f"{column}_new"]
+        differs = (a != b) & ~(a.isna() & b.isna())
+        rows = both.loc[differs, [key, f"{column}_old", f"{column}_new"]]
+        changed[column] = list(rows.itertuples(index=False, name=None))
+
+    return {
+        "added": merged.loc[merged["_merge"] == "right_only", key].tolist(),
+        "removed": merged.loc[merged["_merge"] == "left_only", key].tolist(),
+        "changed": changed,
+    }
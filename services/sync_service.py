@@ -1,115 +1,344 @@
-import os
+import asyncio
 import logging
-import google.generativeai as genai
-from sqlalchemy.orm import Session
-from core.models import Product
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session, joinedload
+from core.models import Product, SyncState
+from core.config import settings
+from core.ai.vector_codec import encode_vector
+from core.ai.embeddings import GeminiEmbeddingHandler
 from core.ai.vector_store import QdrantHandler
+from services.embedding_pipeline import BatchEmbeddingPipeline, product_embedding_text, text_hash
+from services.product_listing import get_listing_engine
+from services.query_filters import get_query_filter_extractor
+from services.response_cache import get_response_cache
 
 logger = logging.getLogger("SyncService")
 
-async def generate_missing_embeddings(db: Session):
+async def generate_missing_embeddings(
+    db: Session,
+    embedder=None,
+    batch_size: int = 100,
+    concurrency: int = 4,
+    commit_every: int = 800
+):
     """
-    Scans for products without embeddings and generates them using Gemini.
+    Scans for products without embeddings and generates them in batches.
+    Products are read in id-ordered windows of `commit_every`; each window is
+    embedded with bounded concurrency (off the event loop) and committed once.
+    Pass `embedder` (e.g. FakeEmbeddingHandler) to run without the Gemini API.
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if embedder is None:
+        embedder = GeminiEmbeddingHandler()
+    if not getattr(embedder, "configured", False):
         logger.warning("No GOOGLE_API_KEY, cannot generate embeddings.")
-        return
-
-    genai.configure(api_key=api_key)
-    
-    # Fetch products without embeddings
-    products = db.query(Product).filter(Product.embedding_json.is_(None)).all()
-    
-    if not products:
+        return 0
+
+    pipeline = BatchEmbeddingPipeline(embedder, batch_size=batch_size, concurrency=concurrency)
+
+    pending = db.query(Product.id).filter(Product.embedding_vector.is_(None)).count()
+    if not pending:
         logger.info("All products have embeddings.")
-        return
+        return 0
+
+    logger.info(f"Generating embeddings for {pending} new products...")
 
-    logger.info(f"Generating embeddings for {len(products)} new products...")
-    
     count = 0
-    for product in products:
-        try:
-            # Construct text representation
-            text = f"{product.name} {product.description or ''} {product.category or ''} Price: {product.selling_price}"
-            
-            # Call Gemini
-            result = genai.embed_content(
-                model="models/text-embedding-004", 
-                content=text,
-                task_type="retrieval_document"
-            )
-            
-            # Save to DB
-            if 'embedding' in result:
-                product.embedding_json = result['embedding']
+    last_id = 0
+    while True:
+        # Keyset window: failed rows are skipped, never re-read in this run
+        products = (
+            db.query(Product)
+            .filter(Product.embedding_vector.is_(None), Product.id > last_id)
+            .order_by(Product.id)
+            .limit(commit_every)
+            .all()
+        )
+        if not products:
+            break
+        last_id = products[-1].id
+
+        texts = [product_embedding_text(p) for p in products]
+        vectors = await pipeline.embed_texts(texts)
+        for product, text, vector in zip(products, texts, vectors):
+            if vector is not None:
+                product.embedding = vector
+                product.embedding_text_hash = text_hash(text)
                 count += 1
-            
-            # Commit every 50 to avoid big transactions hanging
-            if count % 50 == 0:
-                db.commit()
-                
-        except Exception as e:
-            logger.error(f"Embedding failed for {product.sku_adquify}: {e}")
-            
-    db.commit()
-    logger.info(f"Embedding generation complete. {count} updated.")
 
-async def reindex_qdrant_from_db(db: Session, vector_store: QdrantHandler):
+        db.commit()
+        logger.info(f"   Embedded {count}/{pending}...")
+
+    logger.info(f"Embedding generation complete. {count} updated. Stats: {pipeline.stats}")
+    return count
+
+def invalidate_catalog_caches(skus=()):
+    """
+    In-process caches derived from the catalog, after products were written:
+    listing totals, the filter vocabulary (categories/suppliers) and cached chat
+    answers that include any of `skus`.
+    """
+    get_listing_engine().invalidate_totals()
+    get_query_filter_extractor().invalidate()
+    if skus:
+        get_response_cache().invalidate_skus(skus)
+
+def build_point_payload(p: Product) -> dict:
+    """Qdrant payload for a product (what the chat engine reads back from search hits)"""
+    return {
+        "id": p.sku_adquify,
+        "name": p.name,
+        "price": p.selling_price,
+        "category": p.category,
+        "supplier_code": p.supplier.code if p.supplier else None,
+        "url": p.raw_data.get('url') if p.raw_data else None,
+        # Numeric for the in-stock filter; "Consultar" is display only (serialize_product)
+        "stock": int(p.stock_quantity or 0),
+        "stock_known": p.last_stock_update is not None
+    }
+
+REINDEX_BATCH_ATTEMPTS = 2
+
+async def reindex_qdrant_from_db(
+    db: Session,
+    vector_store: QdrantHandler,
+    batch_size: int = 256,
+    parallelism: int = 1,
+    force: bool = False
+) -> int:
     """
     Reads products from SQLite (with cached embeddings) and Upserts them to Qdrant.
     This is used on startup for :memory: Qdrant instances.
+
+    Products are streamed with `yield_per(batch_size)` and sent as bulk upserts
+    of `batch_size` points; up to `parallelism` batches are in flight at once
+    (keep 1 for the in-memory client, which is not thread-safe).
+    A batch the store does not fully write is retried once; then the run
+    raises instead of reporting a partial index as complete.
     """
     logger.info("Checking Qdrant state...")
-    
-    # Check if Qdrant is empty (logic could be refined, e.g. count points)
-    # For :memory:, we assume it is empty or we force sync.
-    # Qdrant client count?
-    try:
-        # Simple check: do we have any points?
-        # vector_store.client.count(...)
-        # But let's just do a scroll.
-        count = 0
-        if vector_store.client:
-            res = vector_store.client.count(vector_store.collection_name)
-            count = res.count
-        
-        if count > 0:
-            logger.info(f"Qdrant already has {count} points. Skipping re-indexing.")
-            return
-        
-    except Exception as e:
-        logger.warning(f"Failed to check Qdrant count: {e}. Proceeding with sync.")
+
+    if not force:
+        try:
+            count = vector_store.count()
+            if count > 0:
+                logger.info(f"Qdrant already has {count} points. Skipping re-indexing.")
+                return 0
+        except Exception as e:
+            logger.warning(f"Failed to check Qdrant count: {e}. Proceeding with sync.")
 
     logger.info("Starting Re-indexing from DB...")
-    
+
     # CRITICAL: Ensure collection exists (fix for race condition in In-Memory Qdrant)
     if vector_store:
         vector_store.ensure_collection()
-    
-    
-    products = db.query(Product).filter(Product.embedding_json.isnot(None)).all()
-    logger.info(f"Found {len(products)} products with embeddings in DB.")
-    
-    for p in products:
-        try:
-            # Reconstruct payload
-            payload = {
-                "id": p.sku_adquify,
-                "name": p.name,
-                "price": p.selling_price,
-                "category": p.category,
-                "url": p.raw_data.get('url') if p.raw_data else None,
-                "stock": p.stock_actual if p.last_sync else "Consultar"
-            }
-            
-            # Upsert
-            # Since embedding is stored, we don't need Gemini API
-            vector = p.embedding_json
-            if vector:
-               await vector_store.upsert_point(p.sku_adquify, vector, payload)
-               
-        except Exception as e:
-            logger.error(f"Failed to index product {p.sku_adquify}: {e}")
-            
-    logger.info("Re-indexing Complete.")
+
+    query = (
+        db.query(Product)
+        .options(joinedload(Product.supplier))
+        .filter(Product.embedding_vector.isnot(None))
+        .order_by(Product.id)
+        .yield_per(batch_size)
+    )
+
+    indexed = 0
+    in_flight = set()
+
+    async def flush(points):
+        # The stores swallow errors and report what they wrote: a short count is a failed batch
+        nonlocal indexed
+        for attempt in range(1, REINDEX_BATCH_ATTEMPTS + 1):
+            written = await vector_store.upsert_points(points)
+            if written >= len(points):
+                indexed += written
+                return
+            logger.warning(f"Re-index batch wrote {written}/{len(points)} points "
+                           f"(attempt {attempt}/{REINDEX_BATCH_ATTEMPTS})")
+        raise RuntimeError(f"Re-index batch of {len(points)} points failed after {REINDEX_BATCH_ATTEMPTS} attempts")
+
+    batch = []
+    try:
+        for p in query:
+            try:
+                vector = p.embedding
+                if vector is not None:
+                    batch.append((p.sku_adquify, vector, build_point_payload(p)))
+            except Exception as e:
+                logger.error(f"Failed to index product {p.sku_adquify}: {e}")
+                continue
+
+            if len(batch) >= batch_size:
+                in_flight.add(asyncio.create_task(flush(batch)))
+                batch = []
+                if len(in_flight) >= parallelism:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+
+        if batch:
+            in_flight.add(asyncio.create_task(flush(batch)))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    except Exception:
+        for task in in_flight:
+            task.cancel()
+        logger.error(f"Re-indexing failed after {indexed} points upserted; the index is incomplete.")
+        raise
+
+    await asyncio.to_thread(vector_store.flush)
+    logger.info(f"Re-indexing Complete. {indexed} points upserted.")
+    return indexed
+
+
+# ===== INCREMENTAL SYNC =====
+
+VECTOR_SYNC_WATERMARK = "vector_sync_watermark"
+
+def get_sync_state(db: Session, key: str) -> Optional[dict]:
+    state = db.get(SyncState, key)
+    return state.value if state else None
+
+def set_sync_state(db: Session, key: str, value: dict):
+    state = db.get(SyncState, key)
+    if state:
+        state.value = value
+    else:
+        db.add(SyncState(key=key, value=value))
+
+async def _remove_orphan_points(db: Session, vector_store: QdrantHandler) -> int:
+    """
+    Deletes points whose product no longer exists (hard deletes leave no updated_at trace).
+    Only scrolls Qdrant when its count exceeds the number of embedded products.
+    """
+    expected = db.query(Product.id).filter(Product.embedding_vector.isnot(None)).count()
+    if vector_store.count() <= expected:
+        return 0
+
+    valid_ids = {
+        vector_store.to_point_id(sku)
+        for (sku,) in db.query(Product.sku_adquify).filter(Product.embedding_vector.isnot(None))
+    }
+    orphans = [pid for pid in vector_store.list_point_ids() if pid not in valid_ids]
+    return await vector_store.delete_points(orphans)
+
+async def incremental_vector_sync(
+    db: Session,
+    vector_store: QdrantHandler,
+    embedder=None,
+    batch_size: int = 256
+) -> dict:
+    """
+    Pushes products changed since the last run (Product.updated_at watermark) to Qdrant.
+
+    - Rows whose embedding text hash changed are re-embedded (batched); rows where
+      only price/stock/payload fields changed reuse the stored vector.
+    - Rows that lost their embedding are deleted from the index, as are points
+      of products deleted from the DB.
+    - New vectors/hashes are committed per chunk; the index is saved once at the
+      end of the run and only then is the watermark (updated_at, id) persisted
+      in `sync_state`. If the vector store fails part of a chunk the run stops
+      there and the watermark stays at the last fully pushed chunk, so the next
+      run retries those rows.
+
+    When nothing changed the cost is a single indexed range query.
+    """
+    if embedder is None:
+        embedder = GeminiEmbeddingHandler()
+    pipeline = BatchEmbeddingPipeline(embedder) if getattr(embedder, "configured", False) else None
+
+    stats = {"scanned": 0, "reembedded": 0, "upserted": 0, "deleted": 0}
+    watermark = get_sync_state(db, VECTOR_SYNC_WATERMARK) or {}
+    last_ts = datetime.fromisoformat(watermark["updated_at"]) if watermark.get("updated_at") else None
+    last_id = watermark.get("id", 0)
+    synced = None
+    changed_skus = set()
+
+    while True:
+        query = db.query(Product).options(joinedload(Product.supplier)).filter(Product.updated_at.isnot(None))
+        if last_ts is not None:
+            query = query.filter(or_(
+                Product.updated_at > last_ts,
+                and_(Product.updated_at == last_ts, Product.id > last_id)
+            ))
+        products = query.order_by(Product.updated_at, Product.id).limit(batch_size).all()
+        if not products:
+            break
+        stats["scanned"] += len(products)
+        changed_skus.update(p.sku_adquify for p in products)
+
+        # 1. Classify changes
+        to_embed, hash_updates, to_delete = [], [], []
+        for p in products:
+            text = product_embedding_text(p)
+            h = text_hash(text)
+            if p.embedding_vector is None:
+                to_delete.append(p.sku_adquify)
+            elif p.embedding_text_hash is None:
+                # Legacy row: trust the cached vector, just record its text hash
+                hash_updates.append({"id": p.id, "embedding_text_hash": h, "updated_at": p.updated_at})
+            elif p.embedding_text_hash != h:
+                to_embed.append((p, text, h))
+
+        # 2. Re-embed only rows whose text changed
+        new_vectors = {}
+        if to_embed and pipeline:
+            vectors = await pipeline.embed_texts([text for _, text, _ in to_embed])
+            for (p, _, h), vector in zip(to_embed, vectors):
+                if vector is not None:
+                    new_vectors[p.id] = vector
+                    hash_updates.append({
+                        "id": p.id,
+                        "embedding_vector": encode_vector(vector, settings.EMBEDDING_STORAGE_DTYPE),
+                        "embedding_text_hash": h,
+                        "updated_at": p.updated_at
+                    })
+            stats["reembedded"] += len(new_vectors)
+        elif to_embed:
+            logger.warning(f"{len(to_embed)} products changed text but no embedder is configured; reusing old vectors.")
+
+        # 3. Push payload/vector changes and deletions
+        points = [
+            (p.sku_adquify, new_vectors[p.id] if p.id in new_vectors else p.embedding, build_point_payload(p))
+            for p in products if p.embedding_vector is not None
+        ]
+        upserted = await vector_store.upsert_points(points)
+        deleted = await vector_store.delete_points(to_delete)
+        stats["upserted"] += upserted
+        stats["deleted"] += deleted
+        if upserted < len(points) or deleted < len(to_delete):
+            # The store swallows errors: keep the old watermark (and hashes) so the next run retries
+            db.rollback()
+            stats["error"] = f"vector store wrote {upserted}/{len(points)} points, deleted {deleted}/{len(to_delete)}"
+            logger.error(f"Incremental vector sync stopped: {stats['error']}")
+            break
+
+        # 4. Persist new vectors/hashes; the watermark only moves in memory until the index is saved.
+        # Bulk UPDATE by primary key; updated_at is passed explicitly so these
+        # writes don't bump the rows past the watermark again.
+        last_ts, last_id = products[-1].updated_at, products[-1].id
+        if hash_updates:
+            db.execute(update(Product), hash_updates)
+            db.commit()
+        synced = {"updated_at": last_ts.isoformat(), "id": last_id}
+
+    if changed_skus:
+        invalidate_catalog_caches(changed_skus)
+    if "error" not in stats:
+        stats["deleted"] += await _remove_orphan_points(db, vector_store)
+
+    # 5. Save the index once per run (LocalVectorStore rewrites its files), off the event loop,
+    # then persist the watermark of the last fully pushed chunk
+    try:
+        await asyncio.to_thread(vector_store.flush)
+    except Exception as e:
+        stats["error"] = f"vector index flush failed: {e}"
+        logger.error(f"Incremental vector sync stopped: {stats['error']}")
+        return stats
+    if synced:
+        set_sync_state(db, VECTOR_SYNC_WATERMARK, synced)
+        db.commit()
+
+    if stats["scanned"] or stats["deleted"]:
+        logger.info(f"Incremental vector sync: {stats}")
+    return stats
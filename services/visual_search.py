@@ -1,44 +1,227 @@
-# import torch
-# from sentence_transformers import SentenceTransformer
-from PIL import Image
-import requests
-from io import BytesIO
+"""
+Adquify Visual Search
+=====================
+Búsqueda de productos por foto sin GPU ni modelo externo:
+
+1. `compute_missing_features`: vector de características CPU
+   (core.ai.image_features) de cada ProductImage descargada, guardado en
+   `ProductImage.embedding_vector`. Decodificación en un pool de procesos.
+2. `build_index`: índice vectorial local (LocalVectorStore, memory-mapped en
+   data/vector_index/product_images_v<N>/) con un punto por imagen.
+   Incremental: añade las imágenes nuevas, reescribe las que cambiaron de
+   características (hash en el payload) y quita las que ya no existen.
+3. `search_bytes`: la foto subida se procesa en memoria (sin fichero temporal),
+   se consulta el índice y se agrupan los aciertos por producto
+   (score = mejor imagen del producto).
+
+Un vector de longitud 0 marca una imagen ilegible, para no reintentarla.
+"""
+
+import hashlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from core.config import settings
+from core.models import Product, ProductImage
+from core.ai.image_features import FEATURE_DIM, FEATURE_VERSION, features_from_bytes, features_from_file
+from core.ai.local_vector_store import LocalVectorStore
+from core.ai.search_filters import SearchFilters
+from core.ai.vector_codec import HEADER_SIZE, decode_vector, encode_vector
+from services.image_fingerprints import resolve_image_path
+from services.product_listing import serialize_product
+from services.sync_service import build_point_payload
+
+logger = logging.getLogger(__name__)
+
+UNREADABLE = encode_vector([])
+# Stored sizes of a current feature vector (float32/float16/int8) and of the unreadable marker.
+# embedding_vector is shared with the legacy image embeddings (other dimension): those get recomputed.
+CURRENT_FEATURE_SIZES = [HEADER_SIZE + FEATURE_DIM * width for width in (4, 2, 1)] + [len(UNREADABLE)]
+
+
+def feature_hash(blob: bytes) -> str:
+    """Versión de las características de una imagen (cambia al re-descargarla y recalcularlas)"""
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
 
 class VisualSearchService:
-    def __init__(self):
-        # Load a lightweight CLIP model
-        print("Visual Search Disabled (OOM Fix)...")
-        self.model = None # SentenceTransformer('clip-ViT-B-32')
-
-    def compute_embedding_from_image(self, image: Image.Image):
-        return None
-        # try:
-        #     return self.model.encode(image).tolist()
-        # except Exception as e:
-        #     print(f"Error computing embedding: {e}")
-        #     return None
-
-    def compute_image_embedding(self, image_url: str):
-        return None
-        # """Downloads image and computes embedding vector"""
-        # try:
-        #     response = requests.get(image_url, stream=True)
-        #     if response.status_code == 200:
-        #         img = Image.open(BytesIO(response.content))
-        #         return self.compute_embedding_from_image(img)
-        # except Exception as e:
-        #     print(f"Error computing embedding for {image_url}: {e}")
-        #     return None
-    
-    def find_similar(self, query_img_path: str, all_embeddings: list):
-        return []
-        # """
-        # Naive search implementation. 
-        # In production, use pgvector (SQL) or faiss.
-        # """
-        # query_img = Image.open(query_img_path)
-        # query_emb = self.model.encode(query_img)
-        
-        # # Cosine similarity logic here...
-        # # (Omitted for brevity in this initial setup)
-        # pass
+    """Índice de características de ProductImage y búsqueda por imagen"""
+
+    def __init__(self, store: Optional[LocalVectorStore] = None, min_score: float = 0.5):
+        self.store = store or LocalVectorStore(
+            collection_name=f"product_images_v{FEATURE_VERSION}",
+            index_type=settings.LOCAL_VECTOR_INDEX_TYPE,
+            nprobe=settings.LOCAL_VECTOR_IVF_NPROBE
+        )
+        self.store.ensure_collection(FEATURE_DIM)
+        self.min_score = min_score
+        self._build_lock = threading.Lock()
+
+    # ----- Feature extraction -----
+
+    def compute_missing_features(self, db: Session, batch_size: int = 500, workers: Optional[int] = None) -> int:
+        """Características de las imágenes descargadas que no las tienen (o guardan un vector de otra dimensión)"""
+        processed = 0
+        last_id = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                rows = (
+                    db.query(ProductImage.id, ProductImage.local_path)
+                    .filter(
+                        ProductImage.id > last_id,
+                        or_(
+                            ProductImage.embedding_vector.is_(None),
+                            func.length(ProductImage.embedding_vector).notin_(CURRENT_FEATURE_SIZES)
+                        ),
+                        ProductImage.local_path.isnot(None)
+                    )
+                    .order_by(ProductImage.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                paths = [resolve_image_path(r.local_path) for r in rows]
+                vectors = pool.map(features_from_file, paths, chunksize=16)
+                db.execute(update(ProductImage), [
+                    {
+                        "id": r.id,
+                        "embedding_vector": UNREADABLE if vec is None
+                        else encode_vector(vec, settings.EMBEDDING_STORAGE_DTYPE)
+                    }
+                    for r, vec in zip(rows, vectors)
+                ])
+                db.commit()
+                processed += len(rows)
+
+        if processed:
+            logger.info(f"Computed visual features for {processed} images")
+        return processed
+
+    # ----- Index -----
+
+    def build_index(self, db: Session, full: bool = False, batch_size: int = 2000) -> int:
+        """
+        Sincroniza el índice con la BD y lo persiste. Con `full=True` reescribe
+        todos los puntos (p.ej. tras cambios de precio/categoría en los payloads).
+        Devuelve el número de puntos escritos.
+        """
+        with self._build_lock:
+            indexed = self.store.payload_values("feature_hash")
+            seen = set()
+            written = 0
+            last_id = 0
+
+            while True:
+                images = (
+                    db.query(ProductImage)
+                    .options(joinedload(ProductImage.product).joinedload(Product.supplier))
+                    .filter(ProductImage.id > last_id, ProductImage.embedding_vector.isnot(None))
+                    .order_by(ProductImage.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not images:
+                    break
+                last_id = images[-1].id
+
+                points = []
+                for image in images:
+                    point_id = str(image.id)
+                    if image.product is None:
+                        continue
+                    try:
+                        vector = decode_vector(image.embedding_vector)
+                    except ValueError:
+                        continue
+                    # Skips unreadable markers and vectors from another extractor
+                    if vector is None or vector.shape[0] != FEATURE_DIM:
+                        continue
+                    seen.add(point_id)
+                    version = feature_hash(image.embedding_vector)
+                    if full or indexed.get(point_id) != version:
+                        payload = build_point_payload(image.product)
+                        payload["image_id"] = image.id
+                        payload["feature_hash"] = version
+                        points.append((point_id, vector.astype(np.float32), payload))
+
+                if points:
+                    written += self.store.upsert_points_sync(points)
+                db.expunge_all()
+
+            stale = list(indexed.keys() - seen)
+            self.store.delete_points_sync(stale)
+            self.store.flush()
+
+        logger.info(f"Visual index: {written} images written, {len(stale)} removed, {self.store.count()} total")
+        return written
+
+    def refresh(self, db: Session, workers: Optional[int] = None) -> int:
+        """Características pendientes + sincronización incremental del índice"""
+        self.compute_missing_features(db, workers=workers)
+        return self.build_index(db)
+
+    # ----- Query -----
+
+    def search_vector(self, vector: np.ndarray, db: Session, limit: int = 10,
+                      filters: Optional[SearchFilters] = None) -> List[Dict]:
+        # Several photos per product: over-fetch, then keep the best image per SKU
+        hits = self.store.search_sync(vector, limit=limit * 4, score_threshold=self.min_score, filters=filters)
+        best: Dict[str, Dict] = {}
+        for hit in hits:
+            sku = hit.payload.get("id")
+            if sku and sku not in best:
+                best[sku] = {"score": round(hit.score, 4), "image_id": hit.payload.get("image_id")}
+            if len(best) >= limit:
+                break
+        if not best:
+            return []
+
+        products = (
+            db.query(Product)
+            .options(selectinload(Product.images), joinedload(Product.supplier))
+            .filter(Product.sku_adquify.in_(list(best)))
+            .all()
+        )
+        by_sku = {p.sku_adquify: p for p in products}
+
+        results = []
+        for sku, match in best.items():
+            product = by_sku.get(sku)
+            if product is None:
+                continue
+            item = serialize_product(product)
+            item["similarity"] = match["score"]
+            matched = next((img for img in product.images if img.id == match["image_id"]), None)
+            if matched is not None:
+                item["image"] = matched.url
+            results.append(item)
+        return results
+
+    def search_bytes(self, data: bytes, db: Session, limit: int = 10,
+                     filters: Optional[SearchFilters] = None) -> List[Dict]:
+        """Productos más parecidos a una imagen recibida en memoria (JPEG/PNG/WebP)"""
+        return self.search_vector(features_from_bytes(data), db, limit, filters)
+
+
+_visual_search: Optional[VisualSearchService] = None
+_visual_search_lock = threading.Lock()
+
+
+def get_visual_search() -> VisualSearchService:
+    """Singleton: el índice se carga (memory-mapped) una sola vez por proceso"""
+    global _visual_search
+    if _visual_search is None:
+        with _visual_search_lock:
+            if _visual_search is None:
+                _visual_search = VisualSearchService()
+    return _visual_search
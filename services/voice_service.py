@@ -208,8 +208,8 @@ class VoiceService:
         # Step 2: Process query
         if chat_engine:
             try:
-                result = chat_engine.process_query(text_query)
-                text_response = result.get("response", "No encontré información.")
+                result = await chat_engine.process_query(text_query)
+                text_response = result.get("answer", "No encontré información.")
             except Exception as e:
                 logger.error(f"Chat engine error: {e}")
                 text_response = f"Buscaste: {text_query}. Hubo un error procesando la consulta."
@@ -10,12 +10,20 @@ import csv
 from pathlib import Path
 from datetime import datetime
 
-# Check for pandas/openpyxl
+# Check for openpyxl (Excel export)
 try:
-    import pandas as pd
-    HAS_PANDAS = True
+    from openpyxl import Workbook
+    HAS_OPENPYXL = True
 except ImportError:
-    HAS_PANDAS = False
+    HAS_OPENPYXL = False
+
+# Columnar snapshots of each scraper run (optional, needs pyarrow)
+try:
+    from services.snapshot_store import (CATALOG_SUPPLIER, PYARROW_AVAILABLE, latest_snapshot,
+                                         read_products, save_snapshot)
+    HAS_SNAPSHOTS = PYARROW_AVAILABLE
+except ImportError:
+    HAS_SNAPSHOTS = False
 
 # Script paths
 SCRIPTS = {
@@ -62,66 +70,79 @@ def run_script(name, script_name):
         print(f"   ❌ {name} ERROR: {str(e)}")
         return False
 
+EXPORT_FIELDS = [
+    'supplier', 'sku_adquify', 'sku_supplier', 'name', 'price',
+    'stock_status', 'category', 'dimensions', 'materials',
+    'images', 'description', 'url', 'source'
+]
+
+def export_row(p):
+    """Product -> export values (strings instead of lists), without copying the product"""
+    row = []
+    for field in EXPORT_FIELDS:
+        value = p.get(field)
+        if isinstance(value, list):
+            value = " | ".join(str(v) for v in value)  # Pipe separator for multiple images
+        elif isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False)
+        row.append(value)
+    return row
+
 def export_data(products, basename):
     if not products:
         return
 
-    # 1. Export CSV
+    # 1. Export CSV (row by row, no intermediate copy of the catalog)
     csv_path = basename.with_suffix('.csv')
     print(f"   📊 Exporting to CSV: {csv_path.name}...")
-    
-    fieldnames = [
-        'supplier', 'sku_adquify', 'sku_supplier', 'name', 'price', 
-        'stock_status', 'category', 'dimensions', 'materials',
-        'images', 'description', 'url', 'source'
-    ]
-    
-    # Pre-process for CSV (strings instead of lists)
-    csv_rows = []
-    for p in products:
-        row = p.copy()
-        if isinstance(row.get('images'), list):
-            row['images'] = " | ".join(row['images']) # Pipe separator for multiple images
-        csv_rows.append(row)
 
     with open(csv_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        writer.writerows(csv_rows)
+        writer = csv.writer(csvfile)
+        writer.writerow(EXPORT_FIELDS)
+        writer.writerows(export_row(p) for p in products)
             
     size_mb = csv_path.stat().st_size / (1024 * 1024)
     print(f"      ✅ CSV Saved ({size_mb:.2f} MB)")
 
-    # 2. Export Excel (if pandas available)
-    if HAS_PANDAS:
+    # 2. Export Excel (openpyxl write-only: rows are streamed to disk, no DataFrame)
+    if HAS_OPENPYXL:
         xlsx_path = basename.with_suffix('.xlsx')
         print(f"   📊 Exporting to EXCEL: {xlsx_path.name}...")
         try:
-            df = pd.DataFrame(products)
-            # Ensure images are stringified for verification
-            df['images'] = df['images'].apply(lambda x: " | ".join(x) if isinstance(x, list) else x)
-            # Reorder columns
-            cols = [c for c in fieldnames if c in df.columns]
-            df = df[cols]
-            
-            df.to_excel(xlsx_path, index=False, engine='openpyxl')
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("Catalog")
+            sheet.append(EXPORT_FIELDS)
+            for p in products:
+                sheet.append(export_row(p))
+            workbook.save(xlsx_path)
             size_mb = xlsx_path.stat().st_size / (1024 * 1024)
             print(f"      ✅ Excel Saved ({size_mb:.2f} MB)")
         except Exception as e:
             print(f"      ⚠️ Excel Export Failed: {e}")
     else:
-        print("      ⚠️ Pandas not installed, skipping Excel export.")
+        print("      ⚠️ openpyxl not installed, skipping Excel export.")
 
 def consolidate_data():
     print("\n📦 CONSOLIDATING DATA...")
     all_products = []
     
-    # Helper to load latest
-    def load_latest(pattern, name):
+    # Helper to load latest: newest of the supplier snapshot and the JSON dumps
+    # (the extract_* scripts only write JSON). Full rows: projection happens at export.
+    def load_latest(pattern, name, supplier):
         try:
+            snapshot = latest_snapshot(supplier) if HAS_SNAPSHOTS else None
             files = list(DATA_RAW.glob(pattern))
-            if files:
-                latest = max(files, key=lambda f: f.stat().st_mtime)
+            latest = max(files, key=lambda f: f.stat().st_mtime) if files else None
+            if snapshot and latest:
+                snapshot_time = snapshot.extracted_datetime
+                file_time = datetime.utcfromtimestamp(latest.stat().st_mtime)
+                if snapshot_time is None or file_time > snapshot_time:
+                    snapshot = None
+            if snapshot:
+                prods = read_products(snapshot)
+                print(f"   • {name}: {len(prods)} products (snapshot {snapshot.extracted_at})")
+                return prods
+            if latest:
                 with open(latest, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     prods = data.get('products', [])
@@ -131,10 +152,10 @@ def consolidate_data():
             print(f"   ⚠️ {name} Error: {e}")
         return []
 
-    all_products.extend(load_latest("kave_final_*.json", "Kave Home"))
-    all_products.extend(load_latest("sklum_final_*.json", "Sklum"))
-    all_products.extend(load_latest("casathai_final_*.json", "Casa Thai"))
-    all_products.extend(load_latest("*distrigal*.json", "Distrigal"))
+    all_products.extend(load_latest("kave_final_*.json", "Kave Home", "KAVE"))
+    all_products.extend(load_latest("sklum_final_*.json", "Sklum", "SKLUM"))
+    all_products.extend(load_latest("casathai_final_*.json", "Casa Thai", "CASATHAI"))
+    all_products.extend(load_latest("*distrigal*.json", "Distrigal", "DISTRIGAL"))
     
     print(f"\n✅ TOTAL CONSOLIDATED CATALOG: {len(all_products)} products")
     
@@ -145,6 +166,8 @@ def consolidate_data():
     with open(path_json, 'w', encoding='utf-8') as f:
         json.dump({'date': ts, 'count': len(all_products), 'products': all_products}, f, indent=2, ensure_ascii=False)
     print(f"💾 JSON saved: {path_json.name}")
+    if HAS_SNAPSHOTS:
+        save_snapshot(CATALOG_SUPPLIER, all_products)
     
     # Export CSV/Excel
     export_data(all_products, DATA_RAW / f"CATALOG_FULL_{ts}")